@@ -1,7 +1,12 @@
-from flask import Blueprint, request, jsonify, current_app
-from models.image_classifier import ImageClassifier
-from utils.image_processing import validate_image
+from flask import Blueprint, request, jsonify, current_app, send_from_directory, send_file, url_for
+from models.image_classifier import ImageClassifier, CACHE_MODE_DEFAULT, resolve_payload_encoder
+from utils.image_processing import validate_image, validate_content_length, get_preprocessing_metrics
 from utils.stats_new import ClassificationStats
+from utils.preprocessing_pool import parse_worker_count
+from utils.renditions import RenditionStore
+from utils.upload_outbox import UploadOutbox
+from utils.local_image_store import LocalImageStore
+from utils.history_cursor import next_cursor
 from config import Config
 import io
 import os
@@ -18,22 +23,88 @@ api = Blueprint('api', __name__, url_prefix='/api')
 # Initialize the classifier
 classifier = None
 
+# Initialize the local image store, used instead of ImageBB if configured
+if Config.STATS_ENABLED and Config.IMAGE_STORAGE_BACKEND == 'local':
+    image_store = LocalImageStore(
+        Config.IMAGE_STORE_DIR,
+        url_builder=lambda image_hash: url_for('api.get_image', image_hash=image_hash, _external=True)
+    )
+else:
+    image_store = None
+
+# Initialize the background image upload outbox (ImageBB only)
+if Config.STATS_ENABLED and Config.UPLOAD_IN_BACKGROUND and image_store is None:
+    upload_outbox = UploadOutbox(
+        Config.UPLOAD_OUTBOX_PATH,
+        workers=Config.UPLOAD_WORKERS,
+        max_attempts=Config.UPLOAD_MAX_ATTEMPTS,
+        # The first retry comes after the stats flush, so the record being
+        # patched is in MongoDB by then
+        base_delay=max(2, 2 * Config.STATS_FLUSH_INTERVAL_MS / 1000)
+    )
+else:
+    upload_outbox = None
+
 # Initialize stats tracker
 if Config.STATS_ENABLED:
     if Config.DB_STORAGE_TYPE == 'mongodb':
-        stats = MongoDBStats()
+        stats = MongoDBStats(
+            upload_outbox=upload_outbox,
+            image_store=image_store,
+            flush_interval_ms=Config.STATS_FLUSH_INTERVAL_MS,
+            flush_batch=Config.STATS_FLUSH_BATCH,
+            max_pending=Config.STATS_MAX_PENDING,
+            rollup_grace_seconds=Config.STATS_ROLLUP_GRACE_SECONDS
+        )
+        if Config.STATS_ROLLUP_INTERVAL_SECONDS > 0:
+            stats.start_rollups(Config.STATS_ROLLUP_INTERVAL_SECONDS)
     else:
-        stats = ClassificationStats()
+        stats = ClassificationStats(
+            upload_outbox=upload_outbox,
+            image_store=image_store,
+            flush_interval_ms=Config.STATS_FLUSH_INTERVAL_MS,
+            flush_batch=Config.STATS_FLUSH_BATCH,
+            retention_days=Config.STATS_RETENTION_DAYS
+        )
 else:
     stats = None
 
+# Uploaded images are patched into their history records
+if upload_outbox is not None:
+    upload_outbox.start(stats.apply_upload_result)
+
+# Initialize the local rendition store (thumbnails for the history). Its
+# renditions match those the classifier encodes with the payload
+if Config.STATS_ENABLED and Config.LOCAL_RENDITIONS:
+    rendition_store = RenditionStore(
+        Config.RENDITIONS_DIR,
+        encoder=resolve_payload_encoder(Config.IMAGE_ENCODER_PROFILE)
+    )
+else:
+    rendition_store = None
+
+# Renditions and locally stored images are keyed by the hash of the upload,
+# so they never change
+RENDITION_MAX_AGE = 365 * 24 * 3600
+
+# Seconds a client is asked to wait when the server is out of decode memory
+CLASSIFY_RETRY_AFTER = 5
+
 def get_classifier():
     global classifier
     if (classifier is None):
         classifier = ImageClassifier(
             api_key=Config.OPENAI_API_KEY,
             categories=Config.IMAGE_CATEGORIES,
-            use_cache=Config.USE_CACHE
+            use_cache=Config.USE_CACHE,
+            cache_expiry_hours=Config.CACHE_EXPIRY_HOURS,
+            preprocess_workers=parse_worker_count(Config.PREPROCESS_WORKERS),
+            encoder_profile=Config.IMAGE_ENCODER_PROFILE,
+            max_pixels=Config.MAX_IMAGE_PIXELS,
+            max_decode_bytes=Config.MAX_DECODE_MEMORY_MB * 1024 * 1024,
+            memory_budget_bytes=Config.PREPROCESS_MEMORY_BUDGET_MB * 1024 * 1024,
+            worker_memory_bytes=Config.PREPROCESS_WORKER_MEMORY_MB * 1024 * 1024,
+            rendition_sizes=rendition_store.sizes if rendition_store else None
         )
     return classifier
 
@@ -44,11 +115,20 @@ def classify_image():
     
     Expected request:
     - multipart/form-data with 'file' containing the image
+    - Optional 'cache' query/form parameter: 'bypass' to skip the classification
+      cache entirely or 'refresh' to ignore the cached result and store a new one
     
     Returns:
     - JSON with 'category' and 'confidence' fields
+    - X-Cache header with the cache status (HIT, MISS, EXPIRED, CORRUPT, BYPASS, REFRESH, DISABLED)
     - Error messages with appropriate HTTP status codes
     """
+    # Reject oversized bodies from the Content-Length before reading them
+    try:
+        validate_content_length(request.content_length, Config.MAX_CONTENT_LENGTH)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 413
+    
     # Check if file is present in the request
     if 'file' not in request.files:
         return jsonify({'error': 'No file part in the request'}), 400
@@ -59,17 +139,25 @@ def classify_image():
     if file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    cache_mode = request.values.get('cache', default=CACHE_MODE_DEFAULT, type=str)
+    
     try:
-        # First, validate the image
-        validate_image(file)
+        # First, validate the image from its header
+        validate_image(
+            file,
+            max_bytes=Config.MAX_CONTENT_LENGTH,
+            max_pixels=Config.MAX_IMAGE_PIXELS,
+            max_decode_bytes=Config.MAX_DECODE_MEMORY_MB * 1024 * 1024
+        )
         
         # Get the classifier instance
         classifier = get_classifier()
-          # Reset file pointer before processing
+        # Reset file pointer before processing
         file.seek(0)
         
         # Classify the image
-        category, confidence = classifier.classify_image(file)
+        result = classifier.classify(file, cache_mode=cache_mode)
+        category, confidence = result['category'], result['confidence']
         
         # Record stats if enabled
         if Config.STATS_ENABLED and stats:
@@ -79,7 +167,8 @@ def classify_image():
                 category, 
                 confidence, 
                 file, 
-                original_filename=file.filename
+                original_filename=file.filename,
+                renditions=save_renditions(file, result['renditions'])
             )
         
         # Return the results
@@ -87,11 +176,17 @@ def classify_image():
             'category': category,
             'confidence': confidence,
             'categories': Config.IMAGE_CATEGORIES  # Return all available categories
-        }), 200
+        }), 200, {'X-Cache': result['cache_status']}
         
     except ValueError as e:
         # Return validation errors
         return jsonify({'error': str(e)}), 400
+    except MemoryError as e:
+        # Too many large images being decoded at once: the client may retry
+        print(f"Out of image decode memory: {e}")
+        return jsonify({
+            'error': 'El servidor está procesando demasiadas imágenes. Intente nuevamente en unos segundos.'
+        }), 503, {'Retry-After': str(CLASSIFY_RETRY_AFTER)}
     except Exception as e:
         # Log the error and return detailed error message
         error_message = str(e)
@@ -131,6 +226,76 @@ def classify_image():
                 'type': error_type
             }), 500
 
+def save_renditions(file, renditions):
+    """
+    Store the display renditions of an upload and get their URLs.
+    
+    Args:
+        file: The uploaded file
+        renditions: Renditions encoded during classification (empty on cache hits)
+        
+    Returns:
+        dict: Rendition name -> absolute URL, empty if they could not be stored
+    """
+    if rendition_store is None:
+        return {}
+    
+    try:
+        image_bytes = file.read()
+        file.seek(0)
+        filenames = rendition_store.save(image_bytes, renditions)
+    except Exception as e:
+        # The history falls back to the ImageBB renditions
+        print(f"Error saving image renditions: {e}")
+        return {}
+    
+    return {
+        name: url_for('api.get_rendition', filename=filename, _external=True)
+        for name, filename in filenames.items()
+    }
+
+@api.route('/renditions/<filename>', methods=['GET'])
+def get_rendition(filename):
+    """
+    Endpoint to get a locally stored image rendition (thumbnail or medium).
+    
+    Returns:
+    - The image with long-lived Cache-Control headers
+    """
+    if rendition_store is None or not rendition_store.is_valid_filename(filename):
+        return jsonify({'error': 'Rendition not found'}), 404
+    
+    response = send_from_directory(rendition_store.directory, filename, max_age=RENDITION_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@api.route('/images/<image_hash>', methods=['GET'])
+def get_image(image_hash):
+    """
+    Endpoint to get a history image from the local image store.
+    
+    Supports conditional requests (ETag / If-None-Match) and Range requests.
+    The file is sent with the server's sendfile support (wsgi.file_wrapper,
+    or X-Sendfile with USE_X_SENDFILE behind a proxy).
+    
+    Returns:
+    - The image with long-lived Cache-Control headers
+    """
+    if image_store is None or not image_store.exists(image_hash):
+        return jsonify({'error': 'Image not found'}), 404
+    
+    response = send_file(
+        image_store.path(image_hash),
+        mimetype=image_store.mime_type(image_hash),
+        conditional=True,
+        etag=image_hash,
+        max_age=RENDITION_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
 @api.route('/categories', methods=['GET'])
 def get_categories():
     """
@@ -141,6 +306,24 @@ def get_categories():
     """
     return jsonify({'categories': Config.IMAGE_CATEGORIES}), 200
 
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Endpoint to get runtime instrumentation for this worker process.
+    
+    Returns:
+    - JSON with 'cache' counters (hits, misses, expired, corrupt) and lookup latency histogram
+    - JSON with 'preprocessing' counters (share of images forwarded untouched)
+    - JSON with 'uploads' backlog of the background image upload outbox
+    """
+    classifier = get_classifier()
+    
+    return jsonify({
+        'cache': classifier.cache.get_metrics() if classifier.use_cache else None,
+        'preprocessing': get_preprocessing_metrics(),
+        'uploads': upload_outbox.get_metrics() if upload_outbox else None
+    }), 200
+
 @api.route('/test-openai', methods=['GET'])
 def test_openai():
     """
@@ -186,7 +369,7 @@ def get_stats():
     - days: Number of days to include in daily stats (default: 7)
     
     Returns:
-    - JSON with statistics data
+    - JSON with statistics data, with an ETag (If-None-Match gets a 304)
     """
     if not Config.STATS_ENABLED:
         return jsonify({
@@ -201,9 +384,102 @@ def get_stats():
         # Get stats data
         stats_data = stats.get_stats(days=days)
         
-        return jsonify({
+        # Answer polling clients with 304 Not Modified while the stats are unchanged
+        response = jsonify({
             'stats': stats_data
-        }), 200
+        })
+        response.add_etag()
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({
+            'error': 'Error retrieving statistics',
+            'details': str(e)
+        }), 500
+
+@api.route('/stats/timeseries', methods=['GET'])
+def get_stats_timeseries():
+    """
+    Endpoint to get classification counts over time.
+    
+    Query Params:
+    - granularity: minute (last 6 hours), hour (last 35 days) or day (default: hour)
+    - start: ISO start of the range (default: 1 hour, 1 day or 7 days before end)
+    - end: ISO end of the range (default: now)
+    
+    Returns:
+    - JSON with one point (start, total, categories) per bucket
+    """
+    if not Config.STATS_ENABLED:
+        return jsonify({
+            'error': 'Statistics tracking is disabled in server configuration'
+        }), 400
+    
+    try:
+        granularity = request.args.get('granularity', default='hour', type=str)
+        try:
+            series = stats.get_timeseries(
+                granularity=granularity,
+                start=request.args.get('start'),
+                end=request.args.get('end')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify({
+            'granularity': granularity,
+            'points': series
+        })
+        response.add_etag()
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        return jsonify({
+            'error': 'Error retrieving statistics',
+            'details': str(e)
+        }), 500
+
+@api.route('/stats/rollups', methods=['GET'])
+def get_stats_rollups():
+    """
+    Endpoint to get per-category counts and average confidence by day, week
+    or month, read from the history rollups instead of the raw history.
+    
+    Query Params:
+    - group: day, week (starting on Monday) or month (default: day)
+    - start: First day, YYYY-MM-DD (default: 30 days before end)
+    - end: Last day, YYYY-MM-DD (default: today)
+    - category: Only include this category (optional)
+    
+    Returns:
+    - JSON with one point (start, total, categories) per period
+    """
+    if not Config.STATS_ENABLED:
+        return jsonify({
+            'error': 'Statistics tracking is disabled in server configuration'
+        }), 400
+    
+    try:
+        group = request.args.get('group', default='day', type=str)
+        try:
+            points = stats.get_rollups(
+                group=group,
+                start=request.args.get('start'),
+                end=request.args.get('end'),
+                category=request.args.get('category')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = jsonify({
+            'group': group,
+            'points': points
+        })
+        response.add_etag()
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
     
     except Exception as e:
         return jsonify({
@@ -218,11 +494,13 @@ def get_history():
     
     Query Params:
     - limit: Maximum number of entries to return (default: 20, max: 50)
-    - offset: Offset for pagination (default: 0)
+    - cursor: Return the page after this cursor (next_cursor of the previous page)
+    - offset: Offset for pagination (default: 0), prefer cursor for deep pages
     - category: Filter by category (optional)
     
     Returns:
-    - JSON with history data including base64-encoded images
+    - JSON with history data: the list fields and a thumbnail per entry
+      (the full record is returned by /history/<record_id>)
     """
     if not Config.STATS_ENABLED:
         return jsonify({
@@ -237,24 +515,56 @@ def get_history():
         offset = request.args.get('offset', default=0, type=int)
         offset = max(0, offset)  # Ensure offset is not negative
         
+        cursor = request.args.get('cursor', default=None, type=str)
         category = request.args.get('category', default=None, type=str)
         
         # Get history data
-        history_data = stats.get_classification_history(
-            limit=limit,
-            offset=offset,
-            category=category
-        )
+        try:
+            history_data = stats.get_classification_history(
+                limit=limit,
+                offset=0 if cursor else offset,
+                category=category,
+                cursor=cursor,
+                compact=True
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({
             'history': history_data,
-            'total': len(history_data),
+            'total': stats.count_history(category),
             'limit': limit,
-            'offset': offset
+            'offset': offset,
+            'next_cursor': next_cursor(history_data, limit)
         }), 200
     
     except Exception as e:
         return jsonify({
             'error': 'Error retrieving classification history',
             'details': str(e)
-        }), 500
\ No newline at end of file
+        }), 500
+
+@api.route('/history/<record_id>', methods=['GET'])
+def get_history_record(record_id):
+    """
+    Endpoint to get a single classification of the history.
+    
+    Returns:
+    - JSON with every field of the record, including all image URLs
+    """
+    if not Config.STATS_ENABLED:
+        return jsonify({
+            'error': 'Statistics tracking is disabled in server configuration'
+        }), 400
+    
+    try:
+        record = stats.get_classification_record(record_id)
+    except Exception as e:
+        return jsonify({
+            'error': 'Error retrieving classification',
+            'details': str(e)
+        }), 500
+    
+    if record is None:
+        return jsonify({'error': 'Classification not found'}), 404
+    return jsonify(record), 200
\ No newline at end of file
@@ -1,5 +1,5 @@
 from flask import Flask, jsonify, send_from_directory
-from api.routes import api
+from api.routes import api, upload_outbox, stats
 from config import Config
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_cors import CORS
@@ -16,13 +16,17 @@ def create_app():
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "Accept", "Origin", "Access-Control-Request-Method", "Access-Control-Request-Headers"],
         "supports_credentials": True,
-        "expose_headers": ["Content-Type", "X-CSRFToken", "Authorization"],
+        "expose_headers": ["Content-Type", "X-CSRFToken", "Authorization", "X-Cache"],
         "max_age": 3600
     }})
     
     # Load configuration from Config class
     app.config.from_object(Config)
     
+    # Apply the configured decode limits to Pillow (process-wide)
+    from utils.image_processing import configure_decoder_limits
+    configure_decoder_limits(Config.MAX_IMAGE_PIXELS)
+    
     # Initialize database if using MongoDB
     if Config.DB_STORAGE_TYPE == 'mongodb':
         from utils.db import init_db, close_mongo_connection
@@ -30,6 +34,18 @@ def create_app():
         # Register function to close MongoDB connection on application shutdown
         atexit.register(close_mongo_connection)
     
+    # Stop image preprocessing worker processes (if any) on shutdown
+    from utils.preprocessing_pool import shutdown_preprocess_pool
+    atexit.register(shutdown_preprocess_pool)
+    
+    # Stop the image upload threads; pending uploads stay in the outbox
+    if upload_outbox is not None:
+        atexit.register(upload_outbox.stop)
+    
+    # Write classifications still buffered by the stats (before the MongoDB connection is closed)
+    if Config.STATS_ENABLED:
+        atexit.register(stats.close)
+    
     # Register the API blueprint
     app.register_blueprint(api)
     
@@ -69,7 +85,13 @@ def create_app():
                 "/api/classify": "POST - Clasifica una imagen en una de las categorías predefinidas",
                 "/api/categories": "GET - Obtiene la lista de categorías disponibles",
                 "/api/stats": "GET - Obtiene estadísticas de clasificación",
+                "/api/stats/timeseries": "GET - Obtiene clasificaciones por minuto, hora o día",
+                "/api/stats/rollups": "GET - Obtiene clasificaciones y confianza media por categoría y día, semana o mes",
                 "/api/history": "GET - Obtiene el historial de clasificaciones",
+                "/api/history/<record_id>": "GET - Obtiene el detalle de una clasificación",
+                "/api/metrics": "GET - Obtiene métricas de instrumentación (caché)",
+                "/api/renditions/<archivo>": "GET - Obtiene una miniatura o versión mediana del historial",
+                "/api/images/<hash>": "GET - Obtiene una imagen del historial guardada localmente",
                 "/api/test-openai": "GET - Prueba la conexión con la API de OpenAI",
                 "/api/docs": "GET - Documentación de la API (Swagger UI)"
             }
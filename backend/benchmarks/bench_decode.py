@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark for the image decode stage of optimize_image.
+
+Compares the full-resolution decode (fast_decode=False) with the reduced-scale
+decode path (JPEG draft mode / reduce before convert) on large synthetic
+photos. Every measurement runs in a fresh process so peak RSS is meaningful.
+
+Usage:
+    python benchmarks/bench_decode.py [--repeat 5]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import tempfile
+import multiprocessing
+from io import BytesIO
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from utils.image_processing import optimize_image
+
+# (label, width, height) of the synthetic inputs
+SIZES = [
+    ('12MP', 4000, 3000),
+    ('48MP', 8000, 6000),
+]
+
+# (label, format, mode) of the encodings tried for every size
+ENCODINGS = [
+    ('JPEG', 'JPEG', 'RGB'),
+    ('PNG', 'PNG', 'RGB'),
+    ('PNG RGBA', 'PNG', 'RGBA'),
+]
+
+def make_photo(width, height, image_format, mode='RGB'):
+    """Create a noisy, photo-like test image encoded in the given format."""
+    # Low-resolution noise upscaled gives smooth gradients with some detail,
+    # which compresses roughly like a real photo
+    noise = Image.effect_noise((width // 16, height // 16), 64).convert(mode)
+    img = noise.resize((width, height), Image.BICUBIC)
+    output = BytesIO()
+    if image_format == 'JPEG':
+        img.save(output, format='JPEG', quality=90)
+    else:
+        img.save(output, format='PNG', compress_level=1)
+    return output.getvalue()
+
+def _proc_status_kb(field):
+    """Read a memory field (e.g. VmRSS, VmHWM) of this process in KB."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+def _measure(image_path, fast_decode, queue):
+    """Run one optimize_image call and report elapsed time and peak RSS growth."""
+    with open(image_path, 'rb') as f:
+        image_bytes = f.read()
+    # ru_maxrss survives exec and would report the parent's peak, so use the
+    # per-address-space high water mark instead
+    baseline_kb = _proc_status_kb('VmRSS')
+    start = time.perf_counter()
+    optimize_image(image_bytes, fast_decode=fast_decode)
+    elapsed = time.perf_counter() - start
+    peak_kb = _proc_status_kb('VmHWM')
+    queue.put((elapsed, peak_kb - baseline_kb))
+
+def measure(image_path, fast_decode, repeat):
+    """Measure optimize_image in fresh processes, returning (median seconds, max peak MB)."""
+    ctx = multiprocessing.get_context('spawn')
+    times, peaks = [], []
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_measure, args=(image_path, fast_decode, queue))
+        process.start()
+        elapsed, peak_kb = queue.get()
+        process.join()
+        times.append(elapsed)
+        peaks.append(peak_kb / 1024)
+    return statistics.median(times), max(peaks)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the image decode fast path")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    args = parser.parse_args()
+
+    print(f"{'input':<14} {'size':>9} {'full ms':>9} {'fast ms':>9} {'speedup':>8} {'full MB':>9} {'fast MB':>9}")
+    for label, width, height in SIZES:
+        for encoding, image_format, mode in ENCODINGS:
+            image_bytes = make_photo(width, height, image_format, mode)
+            with tempfile.NamedTemporaryFile() as image_file:
+                image_file.write(image_bytes)
+                image_file.flush()
+                full_time, full_peak = measure(image_file.name, False, args.repeat)
+                fast_time, fast_peak = measure(image_file.name, True, args.repeat)
+            print(
+                f"{label + ' ' + encoding:<14} {len(image_bytes) / 1024 / 1024:>7.1f}MB "
+                f"{full_time * 1000:>9.0f} {fast_time * 1000:>9.0f} {full_time / fast_time:>7.1f}x "
+                f"{full_peak:>9.0f} {fast_peak:>9.0f}"
+            )
+
+if __name__ == "__main__":
+    main()
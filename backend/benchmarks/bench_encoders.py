@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+"""
+Benchmark for the outbound encoder profiles.
+
+Encodes the same 1024 px image (a downscaled synthetic 12 MP photo, as sent
+to the vision API) with every available profile and reports encode time and
+output size relative to the original 'jpeg' profile.
+
+Usage:
+    python benchmarks/bench_encoders.py [--repeat 20]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_decode import make_photo
+from utils.image_processing import (
+    ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE, decode_image, encode_image, is_encoder_available
+)
+
+def measure(img, encoder, repeat):
+    """Encode an image `repeat` times, returning (median seconds, encoded bytes)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encoded, _ = encode_image(img, encoder)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), len(encoded)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the outbound encoder profiles")
+    parser.add_argument("--repeat", type=int, default=20, help="Encodes per profile")
+    args = parser.parse_args()
+
+    img = decode_image(make_photo(4000, 3000, 'JPEG'), (1024, 1024))
+    results = {
+        encoder: measure(img, encoder, args.repeat)
+        for encoder in ENCODER_PROFILES if is_encoder_available(encoder)
+    }
+    baseline_time, baseline_size = results[DEFAULT_ENCODER_PROFILE]
+
+    print(f"{'profile':<10} {'encode ms':>10} {'KB':>8} {'time vs jpeg':>13} {'bytes saved':>12}")
+    for encoder in ENCODER_PROFILES:
+        if encoder not in results:
+            print(f"{encoder:<10} {'not supported by this Pillow build':>45}")
+            continue
+        elapsed, size = results[encoder]
+        print(
+            f"{encoder:<10} {elapsed * 1000:>10.1f} {size / 1024:>8.1f} "
+            f"{elapsed / baseline_time:>12.2f}x {1 - size / baseline_size:>11.0%}"
+        )
+
+if __name__ == "__main__":
+    main()
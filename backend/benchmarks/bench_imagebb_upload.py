@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Benchmark for the ImageBB uploader against a local fake upload server.
+
+Compares the original uploader (new connection per call, base64 form field)
+with the pooled session sending the image as binary multipart, at several
+concurrency levels. The fake server reads the whole body and answers after
+a fixed delay, like a remote host would. Plain HTTP on localhost has no TLS
+handshake, so the gain from connection reuse is a lower bound.
+
+Usage:
+    python benchmarks/bench_imagebb_upload.py [--uploads 64] [--concurrency 1 4 16] [--latency-ms 20]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_decode import make_photo
+
+class FakeUploadHandler(BaseHTTPRequestHandler):
+    """Accepts any upload and answers like the ImageBB API."""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    lock = threading.Lock()
+    connections = 0
+    bytes_received = 0
+
+    def setup(self):
+        super().setup()
+        with FakeUploadHandler.lock:
+            FakeUploadHandler.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.rfile.read(length)
+        with FakeUploadHandler.lock:
+            FakeUploadHandler.bytes_received += length
+        time.sleep(self.latency)
+        body = json.dumps({
+            'success': True,
+            'data': {
+                'url': 'https://i.ibb.co/fake/full.jpg',
+                'thumb': {'url': 'https://i.ibb.co/fake/thumb.jpg'},
+                'medium': {'url': 'https://i.ibb.co/fake/medium.jpg'},
+                'delete_url': 'https://ibb.co/fake/delete'
+            }
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def legacy_upload(url, image_bytes, name):
+    """The original uploader: new connection per call, base64 in a form field."""
+    payload = {'key': 'test', 'image': base64.b64encode(image_bytes).decode('utf-8'), 'name': name}
+    response = requests.post(url, data=payload)
+    response.raise_for_status()
+    return response.json().get('data')
+
+def run(upload, image_bytes, uploads, concurrency):
+    """Upload `uploads` images from `concurrency` threads, returning (uploads/s, connections, MB sent)."""
+    FakeUploadHandler.connections = 0
+    FakeUploadHandler.bytes_received = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: upload(image_bytes, f"image_{i}.jpg"), range(uploads)))
+    elapsed = time.perf_counter() - start
+    assert all(results), "some uploads failed"
+    return uploads / elapsed, FakeUploadHandler.connections, FakeUploadHandler.bytes_received / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ImageBB uploader against a local fake server")
+    parser.add_argument("--uploads", type=int, default=64, help="Uploads per measurement")
+    parser.add_argument("--concurrency", type=int, nargs='+', default=[1, 4, 16], help="Concurrent uploads")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake server processing time")
+    args = parser.parse_args()
+
+    FakeUploadHandler.latency = args.latency_ms / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeUploadHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/1/upload"
+
+    # The uploader reads its endpoint when imported
+    os.environ['IMAGEBB_UPLOAD_URL'] = url
+    os.environ['IMAGEBB_POOL_SIZE'] = str(max(args.concurrency))
+    from utils.imagebb import upload_image_to_imagebb
+
+    # A 3 MP photo
+    image_bytes = make_photo(2000, 1500, 'JPEG')
+    print(f"Image: {len(image_bytes) / 1024 / 1024:.2f}MB, server latency {args.latency_ms:.0f}ms")
+
+    print(f"{'conc':>4} {'legacy up/s':>12} {'pooled up/s':>12} {'speedup':>8} {'legacy conns':>13} {'pooled conns':>13} {'legacy MB':>10} {'pooled MB':>10}")
+    for concurrency in args.concurrency:
+        legacy = run(lambda data, name: legacy_upload(url, data, name), image_bytes, args.uploads, concurrency)
+        # Warm up the pool so connection set-up is amortized as in a running server
+        run(lambda data, name: upload_image_to_imagebb(data, api_key='test', name=name), image_bytes, concurrency, concurrency)
+        pooled = run(lambda data, name: upload_image_to_imagebb(data, api_key='test', name=name), image_bytes, args.uploads, concurrency)
+        print(
+            f"{concurrency:>4} {legacy[0]:>12.1f} {pooled[0]:>12.1f} {pooled[0] / legacy[0]:>7.2f}x "
+            f"{legacy[1]:>13} {pooled[1]:>13} {legacy[2]:>10.1f} {pooled[2]:>10.1f}"
+        )
+
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Benchmark for reading the daily stats window of MongoDBStats.get_stats.
+
+Seeds a throwaway database with one daily_stats document per day and
+compares the original read (one find_one per day of the window) with the
+single range query of get_stats, for several window sizes. Needs a
+running mongod; the database is dropped at the end.
+
+Usage:
+    python benchmarks/bench_mongodb_daily_stats.py [--uri mongodb://localhost:27017] [--days 7 30 365] [--repeat 50]
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.mongodb_stats import MongoDBStats
+
+def seed_daily_stats(db, days, categories):
+    """Insert `days` daily_stats documents ending today."""
+    names = [f"category_{i}" for i in range(categories)]
+    today = datetime.now()
+    documents = []
+    for i in range(days):
+        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+        documents.append({
+            "_id": date,
+            "date": date,
+            "total": 10 * categories,
+            "categories": {name: 10 for name in names},
+            "histograms": {name: {"80": 5, "90": 5} for name in names}
+        })
+    db.daily_stats.insert_many(documents)
+
+def per_day_reads(db, days):
+    """The original get_stats read: one round trip per day of the window."""
+    today = datetime.now()
+    dates = sorted((today - timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days))
+    return {date: db.daily_stats.find_one({"_id": date}, {"_id": 0}) for date in dates}
+
+def measure_ms(function, repeat):
+    """Median latency of `function` in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MongoDB daily stats reads")
+    parser.add_argument("--uri", default=os.environ.get('MONGO_TEST_URI', 'mongodb://localhost:27017'),
+                        help="MongoDB server to use")
+    parser.add_argument("--days", type=int, nargs='+', default=[7, 30, 365], help="Window sizes (?days=)")
+    parser.add_argument("--categories", type=int, default=10, help="Categories per day")
+    parser.add_argument("--repeat", type=int, default=50, help="Reads per measurement")
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command('ping')
+    except PyMongoError as e:
+        print(f"MongoDB not available at {args.uri}: {e}")
+        sys.exit(1)
+
+    db = client[f"bench_daily_stats_{uuid.uuid4().hex[:8]}"]
+    try:
+        seed_daily_stats(db, max(args.days), args.categories)
+        stats = MongoDBStats(db=db)
+
+        print(f"{'days':>5} {'per-day ms':>11} {'range ms':>9} {'speedup':>8}")
+        for days in args.days:
+            assert len(stats.get_stats(days=days)['daily']) == days
+            per_day = measure_ms(lambda: per_day_reads(db, days), args.repeat)
+            ranged = measure_ms(lambda: stats.get_stats(days=days), args.repeat)
+            print(f"{days:>5} {per_day:>11.2f} {ranged:>9.2f} {per_day / ranged:>7.1f}x")
+    finally:
+        client.drop_database(db.name)
+        client.close()
+
+if __name__ == "__main__":
+    main()
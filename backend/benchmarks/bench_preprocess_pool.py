@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Benchmark for the preprocessing process pool.
+
+Simulates a threaded server: N request threads each optimize images, either
+in the request thread (GIL-bound) or through a PreprocessPool with N worker
+processes. The benchmark process is pinned to N CPUs for every level, so
+throughput scaling can be read directly from the table.
+
+Usage:
+    python benchmarks/bench_preprocess_pool.py [--images 48] [--cores 1 2 4 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_decode import make_photo
+from utils.image_processing import optimize_image
+from utils.preprocessing_pool import PreprocessPool, get_cpu_count
+
+def run(image_bytes, images, threads, executor=None):
+    """Optimize `images` copies of an image from `threads` threads, returning images/second."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as request_threads:
+        list(request_threads.map(lambda _: optimize_image(image_bytes, executor=executor), range(images)))
+    return images / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark in-thread vs process-pool preprocessing")
+    parser.add_argument("--images", type=int, default=48, help="Images optimized per measurement")
+    parser.add_argument("--cores", type=int, nargs='+', default=[1, 2, 4, 8], help="Core counts to test")
+    args = parser.parse_args()
+
+    available = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+    print(f"CPUs available: {get_cpu_count()}")
+
+    # A 12 MP phone photo is the common case
+    image_bytes = make_photo(4000, 3000, 'JPEG')
+
+    print(f"{'cores':>5} {'thread img/s':>13} {'pool img/s':>11} {'speedup':>8}")
+    for cores in args.cores:
+        note = ''
+        if available is not None:
+            pinned = available[:cores]
+            if len(pinned) < cores:
+                note = f"  (only {len(pinned)} CPUs available)"
+            os.sched_setaffinity(0, pinned)
+
+        in_thread = run(image_bytes, args.images, cores)
+
+        pool = PreprocessPool(max_workers=cores)
+        # Warm up the workers so process start-up is not measured
+        run(image_bytes, cores, cores, executor=pool)
+        pooled = run(image_bytes, args.images, cores, executor=pool)
+        pool.shutdown()
+
+        print(f"{cores:>5} {in_thread:>13.1f} {pooled:>11.1f} {pooled / in_thread:>7.2f}x{note}")
+
+    if available is not None:
+        os.sched_setaffinity(0, available)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Benchmark for recording classifications in the file-based stats.
+
+Seeds a stats file with many daily entries and compares writes per second
+of the original implementation (utils/stats.py, rewrites the whole JSON
+file on every classification) with the event log of utils/stats_new.py
+(buffers classifications and appends them in batches, compacting every
+`compact_every` events). Also reports the start-up time of rebuilding the
+aggregates from snapshot plus log tail, and the throughput of several
+worker processes sharing the same files, checking that no write is lost.
+
+Usage:
+    python benchmarks/bench_stats_writes.py [--days 10000 30000] [--categories 20] [--writes 2000] [--processes 4]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.stats import ClassificationStats as LegacyStats
+from utils.stats_new import ClassificationStats
+
+def seed_stats_file(path, days, categories):
+    """Write a stats file with `days` daily entries over `categories` categories."""
+    names = [f"category_{i}" for i in range(categories)]
+    today = datetime.now()
+    daily = {}
+    for i in range(days):
+        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
+        daily[date] = {'total': categories, 'categories': {name: 1 for name in names}}
+    stats = {
+        'total_classifications': days * categories,
+        'categories': {name: {'count': days, 'avg_confidence': 80.0} for name in names},
+        'daily': daily,
+        'last_updated': today.isoformat()
+    }
+    with open(path, 'w') as f:
+        json.dump(stats, f, indent=2)
+    return names
+
+def measure_writes(stats, names, writes):
+    """Record `writes` classifications, returning writes/second."""
+    start = time.perf_counter()
+    for _ in range(writes):
+        stats.record_classification(random.choice(names), random.uniform(50, 100))
+    return writes / (time.perf_counter() - start)
+
+def write_from_process(stats_file, history_dir, names, writes, start_event):
+    """Record classifications from one worker process."""
+    stats = ClassificationStats(stats_file=stats_file, history_dir=history_dir)
+    start_event.wait()
+    for _ in range(writes):
+        stats.record_classification(random.choice(names), random.uniform(50, 100))
+    stats.close()
+
+def measure_processes(days, categories, writes, processes):
+    """Record `writes` classifications from each of `processes` workers sharing one stats file."""
+    temp_dir = tempfile.mkdtemp()
+    try:
+        stats_file = os.path.join(temp_dir, 'stats.json')
+        history_dir = os.path.join(temp_dir, 'history')
+        names = seed_stats_file(stats_file, days, categories)
+        start_event = multiprocessing.Event()
+        workers = [
+            multiprocessing.Process(target=write_from_process,
+                                    args=(stats_file, history_dir, names, writes, start_event))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(1)  # Let every worker load the snapshot
+        start = time.perf_counter()
+        start_event.set()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        stats = ClassificationStats(stats_file=stats_file, history_dir=history_dir)
+        total = stats.get_stats()['total_classifications'] - days * categories
+        stats.close()
+        return processes * writes / elapsed, total
+    finally:
+        shutil.rmtree(temp_dir)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark file-based stats writes")
+    parser.add_argument("--days", type=int, nargs='+', default=[10000, 30000], help="Daily entries in the stats file")
+    parser.add_argument("--categories", type=int, default=20, help="Categories per day")
+    parser.add_argument("--writes", type=int, default=2000, help="Classifications recorded per measurement")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes sharing the stats file")
+    args = parser.parse_args()
+
+    print(f"{'days':>6} {'file MB':>8} {'legacy w/s':>11} {'log w/s':>9} {'speedup':>8} {'startup ms':>11}")
+    for days in args.days:
+        temp_dir = tempfile.mkdtemp()
+        try:
+            legacy_file = os.path.join(temp_dir, 'legacy', 'stats.json')
+            log_file = os.path.join(temp_dir, 'log', 'stats.json')
+            os.makedirs(os.path.dirname(legacy_file))
+            os.makedirs(os.path.dirname(log_file))
+            names = seed_stats_file(legacy_file, days, args.categories)
+            shutil.copy(legacy_file, log_file)
+            size_mb = os.path.getsize(legacy_file) / 1024 / 1024
+
+            # The legacy rewrite is slow at this size, so measure fewer writes
+            legacy = measure_writes(LegacyStats(stats_file=legacy_file), names, max(20, args.writes // 50))
+
+            history_dir = os.path.join(temp_dir, 'history')
+            stats = ClassificationStats(stats_file=log_file, history_dir=history_dir)
+            appended = measure_writes(stats, names, args.writes)
+            stats.close()
+
+            # Start-up: load the snapshot and replay the log tail
+            start = time.perf_counter()
+            restarted = ClassificationStats(stats_file=log_file, history_dir=history_dir)
+            startup_ms = (time.perf_counter() - start) * 1000
+            assert restarted.stats['total_classifications'] == days * args.categories + args.writes
+            restarted.close()
+
+            print(f"{days:>6} {size_mb:>8.1f} {legacy:>11.1f} {appended:>9.0f} {appended / legacy:>7.0f}x {startup_ms:>11.0f}")
+        finally:
+            shutil.rmtree(temp_dir)
+
+    days = args.days[0]
+    rate, total = measure_processes(days, args.categories, args.writes, args.processes)
+    expected = args.processes * args.writes
+    print(f"\n{args.processes} processes, {days} days: {rate:.0f} writes/s, "
+          f"{total}/{expected} classifications counted")
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,9 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your_default_secret_key'
     MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5 MB
+    MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS') or 50_000_000)  # width * height
+    # Largest estimated decode buffer for a single image
+    MAX_DECODE_MEMORY_MB = int(os.environ.get('MAX_DECODE_MEMORY_MB') or 256)
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     DEBUG = os.environ.get('DEBUG', 'False') == 'True'  # Set to True for development
     HOST = os.environ.get('HOST') or '0.0.0.0'
@@ -20,13 +23,51 @@ class Config:
         'perro', 'gato', 'auto', 'árbol', 'ave', 'persona', 
         'edificio', 'flor', 'paisaje', 'alimento'
     ]
-      # Cache configuration
+    
+    # Image preprocessing: number of worker processes used to optimize images
+    # ('auto' = one per CPU, 0 = optimize in the request thread)
+    PREPROCESS_WORKERS = os.environ.get('PREPROCESS_WORKERS', '0')
+    # Memory guards: total decode memory for concurrent in-thread decodes, and
+    # address space limit of each worker process (0 = no limit)
+    PREPROCESS_MEMORY_BUDGET_MB = int(os.environ.get('PREPROCESS_MEMORY_BUDGET_MB') or 1024)
+    PREPROCESS_WORKER_MEMORY_MB = int(os.environ.get('PREPROCESS_WORKER_MEMORY_MB') or 1024)
+    
+    # Encoding of the image sent to the vision API: 'jpeg', 'jpeg-fast' or 'webp'
+    # ('avif' is not accepted by the OpenAI API and falls back to 'jpeg')
+    IMAGE_ENCODER_PROFILE = os.environ.get('IMAGE_ENCODER_PROFILE', 'jpeg')
+    
+    # Cache configuration
     USE_CACHE = os.environ.get('USE_CACHE', 'True') == 'True'
     CACHE_EXPIRY_HOURS = int(os.environ.get('CACHE_EXPIRY_HOURS') or 24)
     
     # ImageBB Configuration
     IMAGEBB_API_KEY = os.environ.get('IMAGEBB_API_KEY', 'bf79f82c0d0d19e2d9c15e6247dca5f7')    # Stats configuration
     STATS_ENABLED = os.environ.get('STATS_ENABLED', 'True') == 'True'
+    # Classifications are buffered in memory and written (to the event log or
+    # MongoDB) every STATS_FLUSH_INTERVAL_MS or STATS_FLUSH_BATCH events
+    STATS_FLUSH_INTERVAL_MS = int(os.environ.get('STATS_FLUSH_INTERVAL_MS') or 200)
+    STATS_FLUSH_BATCH = int(os.environ.get('STATS_FLUSH_BATCH') or 100)
+    # MongoDB stats: buffered writes at which recording blocks until they are written
+    STATS_MAX_PENDING = int(os.environ.get('STATS_MAX_PENDING') or 1000)
+    # MongoDB stats: seconds between runs of the history rollup job (0 disables
+    # it) and age a classification must reach before it is rolled up
+    STATS_ROLLUP_INTERVAL_SECONDS = int(os.environ.get('STATS_ROLLUP_INTERVAL_SECONDS') or 300)
+    STATS_ROLLUP_GRACE_SECONDS = int(os.environ.get('STATS_ROLLUP_GRACE_SECONDS') or 300)
+    # Days of daily stats kept by the file-based stats
+    STATS_RETENTION_DAYS = int(os.environ.get('STATS_RETENTION_DAYS') or 30)
+    # Thumbnail and medium renditions generated locally for the history
+    LOCAL_RENDITIONS = os.environ.get('LOCAL_RENDITIONS', 'True') == 'True'
+    RENDITIONS_DIR = os.environ.get('RENDITIONS_DIR', './stats/renditions')
+    # Where history images are stored: "imagebb" or "local" (content-addressed
+    # directory served by /api/images/<hash>)
+    IMAGE_STORAGE_BACKEND = os.environ.get('IMAGE_STORAGE_BACKEND', 'imagebb')
+    IMAGE_STORE_DIR = os.environ.get('IMAGE_STORE_DIR', './stats/images')
+    # Upload images to ImageBB in background threads (durable SQLite outbox)
+    # instead of before answering /api/classify
+    UPLOAD_IN_BACKGROUND = os.environ.get('UPLOAD_IN_BACKGROUND', 'True') == 'True'
+    UPLOAD_OUTBOX_PATH = os.environ.get('UPLOAD_OUTBOX_PATH', './stats/upload_outbox.sqlite3')
+    UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS') or 2)
+    UPLOAD_MAX_ATTEMPTS = int(os.environ.get('UPLOAD_MAX_ATTEMPTS') or 8)
     
     # Database configuration
     # Use "file" for file-based storage or "mongodb" for MongoDB
@@ -7,6 +7,7 @@ import time
 from datetime import datetime
 from pymongo import MongoClient
 from utils.stats_new import ClassificationStats
+from utils.db import create_indexes, migrate_confidence_sums, migrate_timestamps_to_dates, migrate_history_counts
 
 def migrate_to_local_mongodb():
     """
@@ -36,14 +37,14 @@ def migrate_to_local_mongodb():
         # Crear colecciones si no existen
         if "classifications" not in db.list_collection_names():
             db.create_collection("classifications")
-            db.classifications.create_index([("timestamp", -1)])
-            db.classifications.create_index([("category", 1)])
-            print("✅ Colección 'classifications' creada con índices")
+            print("✅ Colección 'classifications' creada")
         
         if "daily_stats" not in db.list_collection_names():
             db.create_collection("daily_stats")
-            db.daily_stats.create_index([("date", -1)])
-            print("✅ Colección 'daily_stats' creada con índices")
+            print("✅ Colección 'daily_stats' creada")
+        
+        create_indexes(db)
+        print("✅ Índices creados")
         
         if "statistics" not in db.list_collection_names():
             db.create_collection("statistics")
@@ -62,7 +63,7 @@ def migrate_to_local_mongodb():
         file_stats = ClassificationStats()
         
         # Obtener estadísticas
-        stats_data = file_stats.get_stats(days=365)  # Obtener todos los datos diarios disponibles
+        stats_data = file_stats.export_aggregates()  # Todos los datos diarios conservados, con histogramas
         
         # Importar estadísticas globales
         print("\nMigrando estadísticas globales...")
@@ -76,6 +77,8 @@ def migrate_to_local_mongodb():
             },
             upsert=True
         )
+        # Las estadísticas de archivo guardan promedios; MongoDB guarda la suma de confianzas
+        migrate_confidence_sums(db)
         print(f"✅ Estadísticas globales migradas: {stats_data.get('total_classifications', 0)} clasificaciones")
         
         # Importar estadísticas diarias
@@ -88,7 +91,8 @@ def migrate_to_local_mongodb():
                     "_id": date,
                     "date": date,
                     "total": daily_data.get("total", 0),
-                    "categories": daily_data.get("categories", {})
+                    "categories": daily_data.get("categories", {}),
+                    "histograms": daily_data.get("histograms", {})
                 },
                 upsert=True
             )
@@ -111,6 +115,12 @@ def migrate_to_local_mongodb():
                     items_migrated += 1
         
         print(f"✅ Historial de clasificaciones migrado: {items_migrated} elementos")
+        # MongoDB guarda las fechas del historial como fechas BSON, no como texto ISO
+        migrate_timestamps_to_dates(db)
+        # Contar el historial migrado
+        migrate_history_counts(db)
+        # Los resúmenes del historial se recalculan en la próxima actualización
+        db.statistics.delete_one({"_id": "rollup_watermark"})
         
         # Mostrar colecciones y conteos
         print("\nResumen de migración:")
@@ -0,0 +1,46 @@
+"""
+Script para actualizar el historial de clasificaciones en MongoDB.
+
+- Convierte a fechas BSON las marcas de tiempo que las versiones anteriores
+  guardaban como texto ISO (se puede interrumpir y volver a ejecutar).
+- Recuenta el historial por categoría en el documento history_counts, que
+  las clasificaciones nuevas mantienen al día.
+
+Ejecutar una vez tras actualizar, con el servidor detenido para que el
+recuento sea exacto.
+"""
+import sys
+from utils.db import (
+    get_database, close_mongo_connection, create_indexes, migrate_timestamps_to_dates, migrate_history_counts
+)
+
+def migrate_history(batch_size=1000):
+    """
+    Convertir las marcas de tiempo de texto del historial a fechas y recontarlo.
+
+    Args:
+        batch_size: Documentos convertidos por lote
+
+    Returns:
+        bool: True si la migración terminó sin errores
+    """
+    try:
+        db = get_database()
+        create_indexes(db)
+        converted = migrate_timestamps_to_dates(db, batch_size=batch_size)
+        # Los resúmenes del historial se recalculan en la próxima actualización
+        if converted:
+            db.statistics.delete_one({"_id": "rollup_watermark"})
+        print(f"✅ Marcas de tiempo convertidas: {converted}")
+        print(f"✅ Registros del historial contados: {migrate_history_counts(db)}")
+        return True
+    except Exception as e:
+        print(f"❌ Error durante la migración: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        close_mongo_connection()
+
+if __name__ == "__main__":
+    sys.exit(0 if migrate_history() else 1)
@@ -81,7 +81,7 @@ def verify_migration(file_stats, mongo_stats):
         
         # Verificar que los IDs estén presentes en MongoDB
         db = get_database()
-        total_file_records = len([f for f in os.listdir(file_stats.history_dir) if f.endswith('.json')])
+        total_file_records = file_stats.history_index.count()
         total_mongo_records = db.classifications.count_documents({})
         
         print(f"📊 Registros en archivos: {total_file_records}")
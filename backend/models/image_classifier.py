@@ -1,18 +1,66 @@
-import os
 import base64
 from openai import OpenAI
-import tempfile
 from io import BytesIO
-from PIL import Image
 from utils.cache import ImageClassificationCache
-from utils.image_processing import optimize_image
+from utils.image_processing import (
+    prepare_image_payload, validate_image, resolve_encoder_profile, DecodeMemoryBudget,
+    ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE, MAX_IMAGE_PIXELS, MAX_DECODE_BYTES
+)
+from utils.preprocessing_pool import get_preprocess_pool
+
+# Cache handling modes accepted by ImageClassifier.classify()
+CACHE_MODE_DEFAULT = 'default'    # Read from and write to the cache
+CACHE_MODE_BYPASS = 'bypass'      # Neither read from nor write to the cache
+CACHE_MODE_REFRESH = 'refresh'    # Skip the cached result but store the new one
+CACHE_MODES = (CACHE_MODE_DEFAULT, CACHE_MODE_BYPASS, CACHE_MODE_REFRESH)
+
+# Image types accepted by the OpenAI vision API
+VISION_API_MIME_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+def resolve_payload_encoder(encoder):
+    """
+    Get the encoder profile for the images sent to the vision API.
+    
+    The history renditions encoded alongside the payload use the same
+    profile, so stores that encode renditions themselves must use it too.
+    
+    Args:
+        encoder: Requested profile name
+        
+    Returns:
+        str: The profile, or the default one if it is unavailable or not
+             accepted by the vision API
+    """
+    encoder = resolve_encoder_profile(encoder)
+    if ENCODER_PROFILES[encoder]['mime_type'] not in VISION_API_MIME_TYPES:
+        print(f"Image encoder profile '{encoder}' is not accepted by the vision API, using '{DEFAULT_ENCODER_PROFILE}'")
+        return DEFAULT_ENCODER_PROFILE
+    return encoder
 
 class ImageClassifier:
-    def __init__(self, api_key, categories, use_cache=True):
+    def __init__(self, api_key, categories, use_cache=True, cache_expiry_hours=24, preprocess_workers=0,
+                 encoder_profile=DEFAULT_ENCODER_PROFILE, max_pixels=MAX_IMAGE_PIXELS,
+                 max_decode_bytes=MAX_DECODE_BYTES, memory_budget_bytes=None, worker_memory_bytes=None,
+                 rendition_sizes=None):
         self.client = OpenAI(api_key=api_key)
         self.categories = categories
+        # Encoding of the image payload sent to the vision API
+        self.encoder_profile = resolve_payload_encoder(encoder_profile)
         self.use_cache = use_cache
-        self.cache = ImageClassificationCache() if use_cache else None
+        self.cache = ImageClassificationCache(expiry_hours=cache_expiry_hours) if use_cache else None
+        # Decode limits checked from the image header before decoding
+        self.max_pixels = max_pixels
+        self.max_decode_bytes = max_decode_bytes
+        # Optimize images in worker processes instead of the request thread,
+        # otherwise bound the memory of concurrent in-thread decodes
+        if preprocess_workers:
+            self.preprocess_pool = get_preprocess_pool(preprocess_workers, worker_memory_bytes, max_pixels)
+            self.memory_budget = None
+        else:
+            self.preprocess_pool = None
+            self.memory_budget = DecodeMemoryBudget(memory_budget_bytes) if memory_budget_bytes else None
+        # Display renditions encoded from the decoded image (None to skip)
+        self.rendition_sizes = rendition_sizes
 
     def _format_prompt(self):
         """Format the prompt for the OpenAI API with the available categories."""
@@ -29,14 +77,62 @@ class ImageClassifier:
         Returns:
             tuple: (category, confidence_percentage)
         """
-        # Check cache first if enabled
-        if self.use_cache:
-            cached_result = self.cache.get(image_data)
+        result = self.classify(image_data)
+        return result['category'], result['confidence']
+    
+    def classify(self, image_data, cache_mode=CACHE_MODE_DEFAULT):
+        """
+        Classify an image and report how the classification cache was used.
+        
+        Args:
+            image_data: The image data as bytes or a file-like object
+            cache_mode: One of CACHE_MODES
+            
+        Returns:
+            dict: 'category', 'confidence', 'cache_status' (HIT, MISS, EXPIRED,
+                  CORRUPT, BYPASS, REFRESH or DISABLED) and 'renditions'
+                  (name -> (bytes, MIME type), empty if the image was not decoded)
+        """
+        if cache_mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{cache_mode}'. Use one of: {', '.join(CACHE_MODES)}")
+        
+        if not self.use_cache:
+            cache_status = 'DISABLED'
+        elif cache_mode == CACHE_MODE_BYPASS:
+            cache_status = 'BYPASS'
+        elif cache_mode == CACHE_MODE_REFRESH:
+            cache_status = 'REFRESH'
+        else:
+            # Check cache first
+            cached_result, cache_status = self.cache.lookup(image_data)
             if cached_result:
-                print("Using cached result for image classification")
-                return cached_result
+                return {
+                    'category': cached_result[0],
+                    'confidence': cached_result[1],
+                    'cache_status': cache_status,
+                    'renditions': {}
+                }
         
-        temp_file_path = None
+        store_in_cache = self.use_cache and cache_mode != CACHE_MODE_BYPASS
+        category, confidence, renditions = self._classify_uncached(image_data, store_in_cache)
+        return {
+            'category': category,
+            'confidence': confidence,
+            'cache_status': cache_status,
+            'renditions': renditions
+        }
+    
+    def _classify_uncached(self, image_data, store_in_cache):
+        """
+        Classify an image with the OpenAI API, optionally storing the result in the cache.
+        
+        Args:
+            image_data: The image data as bytes or a file-like object
+            store_in_cache: Whether to store the result in the cache
+            
+        Returns:
+            tuple: (category, confidence_percentage, renditions)
+        """
         try:
             # If image_data is a file-like object from Flask, read the content
             if hasattr(image_data, 'read'):
@@ -48,16 +144,18 @@ class ImageClassifier:
                 image_bytes = image_data
             
             # Optimize the image before processing
-            optimized_image = optimize_image(image_bytes)
-            
-            # Convert the optimized image to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(optimized_image.getvalue())
-                temp_file_path = temp_file.name
+            optimized_bytes, mime_type, renditions = prepare_image_payload(
+                image_bytes,
+                executor=self.preprocess_pool,
+                memory_budget=self.memory_budget,
+                encoder=self.encoder_profile,
+                max_pixels=self.max_pixels,
+                max_decode_bytes=self.max_decode_bytes,
+                renditions=self.rendition_sizes
+            )
             
             # Encode the image as base64
-            with open(temp_file_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+            base64_image = base64.b64encode(optimized_bytes).decode('utf-8')
             
             # Create the prompt for classification
             prompt = self._format_prompt()
@@ -74,7 +172,7 @@ class ImageClassifier:
                                 {
                                     "type": "image_url",
                                     "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
+                                        "url": f"data:{mime_type};base64,{base64_image}"
                                     }
                                 }
                             ]
@@ -110,35 +208,28 @@ class ImageClassifier:
                         confidence = float(confidence_match.group(1))
                         
                         # Store result in cache if enabled
-                        if self.use_cache:
+                        if store_in_cache:
                             # Reset file pointer if it's a file-like object
                             if hasattr(image_data, 'seek'):
                                 image_data.seek(0)
                             self.cache.set(image_data, category, confidence)
                         
-                        return category, confidence
+                        return category, confidence, renditions
                     else:
                         # If no confidence percentage is found, default to a high value
-                        if self.use_cache:
+                        if store_in_cache:
                             # Reset file pointer if it's a file-like object
                             if hasattr(image_data, 'seek'):
                                 image_data.seek(0)
                             self.cache.set(image_data, category, 90.0)
-                        return category, 90.0
+                        return category, 90.0, renditions
             
             # If no matching category was found
-            return "Unknown", 0.0
+            return "Unknown", 0.0, renditions
             
         except Exception as e:
             print(f"Error detallado en classify_image: {type(e).__name__} - {str(e)}")
             raise
-        finally:
-            # Always clean up the temporary file
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as cleanup_error:
-                    print(f"Error al eliminar archivo temporal: {str(cleanup_error)}")
 
     def validate_image(self, image_data):
         """
@@ -151,23 +242,9 @@ class ImageClassifier:
             bool: True if the image is valid, otherwise raises ValueError
         """
         try:
-            # If image_data is a file-like object from Flask, read the content
-            if hasattr(image_data, 'read'):
-                image_bytes = image_data.read()
-                if hasattr(image_data, 'seek'):
-                    image_data.seek(0)  # Reset file pointer
-            else:
-                # Assume image_data is already bytes
-                image_bytes = image_data
-            
-            # Try to open the image with Pillow to validate it
-            img = Image.open(BytesIO(image_bytes))
-            img.verify()  # Verify that it's a valid image
-            
-            # Check file size (max 5MB)
-            if len(image_bytes) > 5 * 1024 * 1024:
-                raise ValueError("El tamaño de la imagen excede el límite de 5MB")
-            
+            # Wrap raw bytes so the header can be read as a stream
+            stream = image_data if hasattr(image_data, 'read') else BytesIO(image_data)
+            validate_image(stream, max_pixels=self.max_pixels, max_decode_bytes=self.max_decode_bytes)
             return True
-        except Exception as e:
-            raise ValueError(f"Imagen inválida: {str(e)}")
\ No newline at end of file
+        except ValueError as e:
+            raise ValueError(f"Imagen inválida: {str(e)}")
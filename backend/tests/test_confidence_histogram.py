@@ -0,0 +1,85 @@
+import unittest
+import tempfile
+import shutil
+import random
+import os
+import sys
+from datetime import datetime
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import confidence_histogram
+from utils.stats_new import ClassificationStats
+
+class TestConfidenceHistogram(unittest.TestCase):
+    """Tests for the fixed-bucket confidence histograms."""
+
+    def test_percentiles_match_exact_values(self):
+        """Test that percentiles are within one bucket of the exact ones."""
+        random.seed(1)
+        values = [random.uniform(40, 100) for _ in range(10000)]
+        histogram = {}
+        for value in values:
+            confidence_histogram.add(histogram, value)
+
+        result = confidence_histogram.percentiles(histogram)
+
+        values.sort()
+        for point in confidence_histogram.PERCENTILES:
+            exact = values[int(len(values) * point / 100)]
+            self.assertAlmostEqual(result[f"p{point}"], exact, delta=confidence_histogram.BUCKET_WIDTH)
+
+    def test_bounded_size(self):
+        """Test that the histogram size does not grow with the number of values."""
+        histogram = {}
+        for i in range(50000):
+            confidence_histogram.add(histogram, (i * 7.3) % 101)
+        self.assertLessEqual(len(histogram), confidence_histogram.BUCKET_COUNT)
+        self.assertEqual(sum(histogram.values()), 50000)
+
+    def test_bimodal_and_edges(self):
+        """Test that a bimodal category is visible and edge values are counted."""
+        histogram = {}
+        for value in [20] * 50 + [100] * 50:
+            confidence_histogram.add(histogram, value)
+
+        result = confidence_histogram.percentiles(histogram)
+
+        self.assertLess(result['p10'], 21)
+        self.assertGreater(result['p90'], 99)
+        self.assertIsNone(confidence_histogram.percentiles({}))
+
+class TestStatsPercentiles(unittest.TestCase):
+    """Tests for the percentiles reported by the file-based stats."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history')
+        )
+
+    def tearDown(self):
+        self.stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_category_and_daily_percentiles(self):
+        """Test that get_stats reports p10/p50/p90 per category and per day."""
+        for confidence in range(1, 101):
+            self.stats.record_classification('gato', confidence)
+        self.stats.record_classification('perro', 75.0)
+
+        summary = self.stats.get_stats(days=1)
+
+        gato = summary['categories']['gato']['percentiles']
+        self.assertAlmostEqual(gato['p10'], 10, delta=1)
+        self.assertAlmostEqual(gato['p50'], 50, delta=1)
+        self.assertAlmostEqual(gato['p90'], 90, delta=1)
+        self.assertNotIn('histogram', summary['categories']['gato'])
+        today = summary['daily'][datetime.now().strftime('%Y-%m-%d')]
+        self.assertEqual(today['percentiles']['gato'], gato)
+        self.assertAlmostEqual(today['percentiles']['perro']['p50'], 75, delta=1)
+
+if __name__ == '__main__':
+    unittest.main()
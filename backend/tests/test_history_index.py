@@ -0,0 +1,161 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.history_index import HistoryIndex
+from utils.local_image_store import LocalImageStore
+from utils.stats_new import ClassificationStats
+from utils.history_cursor import encode_cursor, decode_cursor, next_cursor
+
+class TestHistoryIndex(unittest.TestCase):
+    """Tests for the indexed file-based classification history."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.history_dir = os.path.join(self.temp_dir, 'history')
+        self.image_store = LocalImageStore(os.path.join(self.temp_dir, 'images'))
+        self.instances = []
+
+    def tearDown(self):
+        for stats in self.instances:
+            stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _create_stats(self):
+        stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=self.history_dir,
+            image_store=self.image_store
+        )
+        self.instances.append(stats)
+        return stats
+
+    def _record(self, stats, categories):
+        return [
+            stats.record_classification_with_image(category, 80.0, f"image {i}".encode())
+            for i, category in enumerate(categories)
+        ]
+
+    def test_filtered_pages_are_full(self):
+        """Test that the category filter is applied before paginating."""
+        stats = self._create_stats()
+        record_ids = self._record(stats, ['gato', 'perro', 'perro', 'perro'] * 5)
+        gato_ids = record_ids[::4][::-1]
+
+        first_page = stats.get_classification_history(limit=2, offset=0, category='Gato')
+        second_page = stats.get_classification_history(limit=2, offset=2, category='gato')
+
+        self.assertEqual([entry['id'] for entry in first_page + second_page], gato_ids[:4])
+        self.assertEqual(stats.history_index.count('gato'), 5)
+        self.assertEqual(stats.get_classification_history(limit=5, offset=5, category='gato'), [])
+
+    def test_cursor_pages(self):
+        """Test that following next_cursor walks the filtered history once, newest first."""
+        stats = self._create_stats()
+        record_ids = self._record(stats, ['gato', 'perro', 'gato'] * 4)
+        gato_ids = [record_id for record_id, category in zip(record_ids, ['gato', 'perro', 'gato'] * 4)
+                    if category == 'gato'][::-1]
+
+        seen, cursor = [], None
+        while True:
+            page = stats.get_classification_history(limit=3, category='gato', cursor=cursor)
+            seen.extend(entry['id'] for entry in page)
+            cursor = next_cursor(page, 3)
+            if cursor is None:
+                break
+            # Records added meanwhile do not shift the following pages
+            self._record(stats, ['gato'])
+
+        self.assertEqual(seen, gato_ids)
+        self.assertEqual(stats.count_history('gato'), len(gato_ids) + 2)
+        self.assertEqual(stats.count_history(), len(record_ids) + 2)
+
+    def test_invalid_cursor(self):
+        """Test cursor encoding and that malformed cursors are rejected."""
+        cursor = encode_cursor('2024-01-01T00:00:00', 'abc')
+        self.assertEqual(decode_cursor(cursor), ('2024-01-01T00:00:00', 'abc'))
+        for invalid in ('not a cursor', encode_cursor('2024', 'abc')[:-3], 'WzFd'):
+            with self.assertRaises(ValueError):
+                decode_cursor(invalid)
+        with self.assertRaises(ValueError):
+            self._create_stats().get_classification_history(cursor='not a cursor')
+
+    def test_pages_do_not_scan_directory(self):
+        """Test that a page reads its records without listing or stat-ing the history."""
+        stats = self._create_stats()
+        record_ids = self._record(stats, ['gato'] * 10)
+
+        with mock.patch('os.listdir') as listdir, mock.patch('os.path.getmtime') as getmtime:
+            page = stats.get_classification_history(limit=3, offset=1)
+            listdir.assert_not_called()
+            getmtime.assert_not_called()
+
+        self.assertEqual([entry['id'] for entry in page], record_ids[::-1][1:4])
+
+    def test_compact_list_and_detail(self):
+        """Test that the list view keeps only its fields and the detail returns the full record."""
+        stats = self._create_stats()
+        record_id = self._record(stats, ['gato'])[0]
+
+        entry = stats.get_classification_history(compact=True)[0]
+        record = stats.get_classification_record(record_id)
+
+        self.assertEqual(set(entry), {'id', 'timestamp', 'category', 'confidence', 'upload_status', 'image_thumbnail'})
+        self.assertEqual(entry['image_thumbnail'], record['image_thumbnail'])
+        self.assertEqual(record['original_filename'], 'unknown.jpg')
+        self.assertIn('image_data', record)
+        for missing in ('unknown', '../stats', ''):
+            self.assertIsNone(stats.get_classification_record(missing))
+
+    def test_compact_list_skips_legacy_base64_images(self):
+        """Test that records with only a local .jpg are listed without inlining the image."""
+        os.makedirs(self.history_dir)
+        with open(os.path.join(self.history_dir, 'legacy.json'), 'w') as f:
+            json.dump({'id': 'legacy', 'timestamp': '2024-01-01T00:00:00', 'category': 'gato'}, f)
+        with open(os.path.join(self.history_dir, 'legacy.jpg'), 'wb') as f:
+            f.write(b'\xff\xd8' + b'x' * 200000)
+        stats = self._create_stats()
+
+        entry = stats.get_classification_history(compact=True)[0]
+
+        self.assertEqual(entry['id'], 'legacy')
+        self.assertIsNone(entry['image_thumbnail'])
+        self.assertTrue(stats.get_classification_record('legacy')['image_data'].startswith('data:image/jpeg;base64,'))
+
+    def test_existing_history_is_backfilled(self):
+        """Test that records written before the index existed are indexed by timestamp."""
+        os.makedirs(self.history_dir)
+        for record_id, timestamp, category in (('b', '2024-01-02T00:00:00', 'perro'),
+                                               ('a', '2024-01-01T00:00:00', 'gato'),
+                                               ('c', '2024-01-03T00:00:00', 'gato')):
+            with open(os.path.join(self.history_dir, f"{record_id}.json"), 'w') as f:
+                json.dump({'id': record_id, 'timestamp': timestamp, 'category': category}, f)
+
+        index = HistoryIndex(self.history_dir)
+
+        self.assertEqual([record_id for _, record_id in index.page()], ['c', 'b', 'a'])
+        self.assertEqual(index.page(category='gato'), [('2024-01-03T00:00:00', 'c'), ('2024-01-01T00:00:00', 'a')])
+        # Reopening reads the index instead of scanning again
+        with mock.patch('os.listdir') as listdir:
+            self.assertEqual(HistoryIndex(self.history_dir).count(), 3)
+            listdir.assert_not_called()
+
+    def test_instances_share_the_index(self):
+        """Test that records added by another instance show up in the history."""
+        first = self._create_stats()
+        second = self._create_stats()
+        self.assertEqual(second.get_classification_history(), [])
+
+        record_id = self._record(first, ['gato'])[0]
+
+        self.assertEqual([entry['id'] for entry in second.get_classification_history()], [record_id])
+
+if __name__ == '__main__':
+    unittest.main()
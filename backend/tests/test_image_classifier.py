@@ -0,0 +1,76 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+from PIL import Image
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.image_classifier import ImageClassifier, resolve_payload_encoder
+from utils.cache import ImageClassificationCache
+
+def fake_response(text):
+    """Build an object shaped like an OpenAI chat completion."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+class TestImageClassifier(unittest.TestCase):
+    """Tests for ImageClassifier with the OpenAI client mocked out."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        img = Image.new('RGB', (1600, 1200), color='blue')
+        img_io = BytesIO()
+        img.save(img_io, 'PNG')
+        self.image_bytes = img_io.getvalue()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _create_classifier(self, **kwargs):
+        classifier = ImageClassifier(api_key='test-key', categories=['perro', 'gato'], **kwargs)
+        if classifier.use_cache:
+            classifier.cache = ImageClassificationCache(cache_dir=self.temp_dir)
+        classifier.client = mock.MagicMock()
+        classifier.client.chat.completions.create.return_value = fake_response('gato: 87%')
+        return classifier
+
+    def _sent_image_url(self, classifier):
+        messages = classifier.client.chat.completions.create.call_args.kwargs['messages']
+        return messages[0]['content'][1]['image_url']['url']
+
+    def test_data_url_uses_encoder_mime_type(self):
+        """Test that the payload is labelled with the encoder profile's MIME type."""
+        for encoder, mime_type in (('jpeg', 'image/jpeg'), ('webp', 'image/webp')):
+            with self.subTest(encoder):
+                classifier = self._create_classifier(use_cache=False, encoder_profile=encoder)
+
+                self.assertEqual(classifier.classify_image(self.image_bytes), ('gato', 87.0))
+                self.assertTrue(self._sent_image_url(classifier).startswith(f'data:{mime_type};base64,'))
+
+    def test_unsupported_profile_falls_back_to_jpeg(self):
+        """Test that profiles the vision API does not accept are not used."""
+        classifier = self._create_classifier(use_cache=False, encoder_profile='avif')
+
+        self.assertEqual(classifier.encoder_profile, 'jpeg')
+        self.assertEqual(resolve_payload_encoder('avif'), classifier.encoder_profile)
+
+    def test_cache_status(self):
+        """Test the cache status reported for each cache mode."""
+        classifier = self._create_classifier()
+
+        self.assertEqual(classifier.classify(self.image_bytes)['cache_status'], 'MISS')
+        self.assertEqual(classifier.classify(self.image_bytes)['cache_status'], 'HIT')
+        self.assertEqual(classifier.classify(self.image_bytes, cache_mode='refresh')['cache_status'], 'REFRESH')
+        self.assertEqual(classifier.classify(self.image_bytes, cache_mode='bypass')['cache_status'], 'BYPASS')
+        self.assertEqual(classifier.client.chat.completions.create.call_count, 3)
+
+        with self.assertRaises(ValueError):
+            classifier.classify(self.image_bytes, cache_mode='sometimes')
+
+if __name__ == '__main__':
+    unittest.main()
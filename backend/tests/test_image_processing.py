@@ -0,0 +1,350 @@
+import unittest
+import os
+import sys
+import json
+import zlib
+import struct
+import tempfile
+import subprocess
+from io import BytesIO
+from unittest import mock
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_processing import (
+    decode_image, optimize_image, strip_jpeg_metadata, get_preprocessing_metrics,
+    validate_image, read_image_header, estimate_decode_bytes, DecodeMemoryBudget, prepare_image_payload
+)
+from utils.preprocessing_pool import PreprocessPool, parse_worker_count, get_cpu_count
+
+def create_image_bytes(size, image_format='JPEG', mode='RGB', color='red', **save_args):
+    """Create an encoded test image."""
+    img = Image.new(mode, size, color=color)
+    img_io = BytesIO()
+    img.save(img_io, image_format, **save_args)
+    return img_io.getvalue()
+
+def create_exif(orientation=1):
+    """Create an EXIF block with a camera model and the given orientation."""
+    exif = Image.Exif()
+    exif[0x0110] = 'Test Camera'
+    exif[0x0112] = orientation
+    return exif.tobytes()
+
+class TestDecodeImage(unittest.TestCase):
+    """Tests for the reduced-scale decode path."""
+
+    def test_large_jpeg_is_decoded_within_max_size(self):
+        """Test that a large JPEG comes back as RGB no larger than max_size."""
+        image_bytes = create_image_bytes((4000, 3000))
+
+        img = decode_image(image_bytes, max_size=(1024, 1024))
+
+        self.assertEqual(img.mode, 'RGB')
+        self.assertEqual(img.size, (1024, 768))
+
+    def test_palette_png_is_converted_and_resized(self):
+        """Test that modes that cannot be resized directly are still handled."""
+        image_bytes = create_image_bytes((2000, 1000), image_format='PNG', mode='P', color=3)
+
+        img = decode_image(image_bytes, max_size=(1024, 1024))
+
+        self.assertEqual(img.mode, 'RGB')
+        self.assertEqual(img.size, (1024, 512))
+
+    def test_small_image_is_not_upscaled(self):
+        """Test that images within max_size keep their size."""
+        image_bytes = create_image_bytes((300, 200), image_format='PNG', mode='RGBA')
+
+        img = decode_image(image_bytes, max_size=(1024, 1024))
+
+        self.assertEqual(img.mode, 'RGB')
+        self.assertEqual(img.size, (300, 200))
+
+    def test_fast_and_full_decode_produce_same_size(self):
+        """Test that both decode paths of optimize_image agree on the output size."""
+        image_bytes = create_image_bytes((3000, 2000))
+
+        fast = Image.open(optimize_image(image_bytes, fast_decode=True))
+        full = Image.open(optimize_image(image_bytes, fast_decode=False))
+
+        self.assertEqual(fast.size, full.size)
+
+    def test_other_formats_are_rejected(self):
+        """Test that Pillow is restricted to the accepted formats."""
+        image_bytes = create_image_bytes((100, 100), image_format='GIF', mode='P', color=1)
+
+        with self.assertRaises(ValueError):
+            optimize_image(image_bytes)
+
+def png_chunk(chunk_type, data):
+    """Encode a PNG chunk with a valid CRC."""
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+def create_png_bomb(width, height, text_chunks=0):
+    """Create a tiny, well-formed RGBA PNG header declaring huge dimensions."""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    text = b''.join(png_chunk(b'tEXt', b'Comment\x00' + b'x' * 1024) for _ in range(text_chunks))
+    idat = png_chunk(b'IDAT', zlib.compress(b'\x00' * 4096))
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', ihdr) + text + idat + png_chunk(b'IEND', b'')
+
+# Optimizes an image in a fresh interpreter and reports the elapsed time and
+# the peak RSS growth (VmHWM is reset first, so imports are not counted)
+_MEASURE_SCRIPT = """
+import sys, json, time
+sys.path.insert(0, sys.argv[1])
+from utils.image_processing import optimize_image_bytes, configure_decoder_limits
+
+configure_decoder_limits()
+
+def status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+
+image_bytes = open(sys.argv[2], 'rb').read()
+options = json.loads(sys.argv[3])
+with open('/proc/self/clear_refs', 'w') as f:
+    f.write('5')
+baseline_kb = status_kb('VmRSS')
+start = time.perf_counter()
+try:
+    optimize_image_bytes(image_bytes, **options)
+    error = None
+except Exception as e:
+    error = type(e).__name__
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'peak_mb': (status_kb('VmHWM') - baseline_kb) / 1024, 'error': error}))
+"""
+
+@unittest.skipUnless(os.path.exists('/proc/self/clear_refs'), "needs Linux /proc to measure peak RSS")
+class TestDecodeBombs(unittest.TestCase):
+    """Tests with pathological images, measuring decode time and peak RSS."""
+
+    def measure(self, image_bytes, **options):
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        with tempfile.NamedTemporaryFile() as image_file:
+            image_file.write(image_bytes)
+            image_file.flush()
+            result = subprocess.run(
+                [sys.executable, '-c', _MEASURE_SCRIPT, backend_dir, image_file.name, json.dumps(options)],
+                capture_output=True, text=True, check=True
+            )
+        return json.loads(result.stdout)
+
+    def test_huge_dimensions_rejected_before_decoding(self):
+        """Test that a 60000x60000 RGBA PNG (~13GB decoded) is refused from its header."""
+        image_bytes = create_png_bomb(60000, 60000)
+        self.assertLess(len(image_bytes), 1024)
+
+        result = self.measure(image_bytes, max_pixels=10 ** 12)
+
+        self.assertEqual(result['error'], 'ValueError')
+        self.assertLess(result['seconds'], 0.5)
+        self.assertLess(result['peak_mb'], 20)
+
+    def test_progressive_jpeg_stays_within_estimate(self):
+        """Test that progressive JPEGs decode within their (full-resolution) estimate."""
+        image_bytes = create_image_bytes((4000, 3000), progressive=True)
+        header = read_image_header(BytesIO(image_bytes))
+        estimate_mb = estimate_decode_bytes(header, (1024, 1024)) / 1024 / 1024
+
+        result = self.measure(image_bytes)
+        rejected = self.measure(image_bytes, max_decode_bytes=int(estimate_mb * 1024 * 1024) - 1)
+
+        self.assertIsNone(result['error'])
+        self.assertLess(result['peak_mb'], estimate_mb)
+        self.assertLess(result['seconds'], 10)
+        self.assertEqual(rejected['error'], 'ValueError')
+        self.assertLess(rejected['seconds'], 0.5)
+
+    def test_many_text_chunks(self):
+        """Test that a PNG stuffed with metadata chunks fails fast with bounded memory."""
+        image_bytes = create_png_bomb(64, 64, text_chunks=4000)
+
+        result = self.measure(image_bytes)
+
+        self.assertEqual(result['error'], 'ValueError')
+        self.assertLess(result['seconds'], 2)
+        self.assertLess(result['peak_mb'], 30)
+
+class TestDecodeMemoryBudget(unittest.TestCase):
+    """Tests for the in-process decode memory budget."""
+
+    def test_reservations_are_released(self):
+        """Test that reservations are returned and oversized ones are refused."""
+        budget = DecodeMemoryBudget(100, timeout=0.01)
+
+        with budget.reserve(60):
+            self.assertEqual(budget.in_use, 60)
+            with self.assertRaises(MemoryError):
+                with budget.reserve(60):
+                    pass
+        self.assertEqual(budget.in_use, 0)
+
+        with self.assertRaises(ValueError):
+            with budget.reserve(101):
+                pass
+
+class TestPassthrough(unittest.TestCase):
+    """Tests for the pass-through path of optimize_image."""
+
+    def _passthrough_count(self):
+        return get_preprocessing_metrics()['passthrough']
+
+    def test_compliant_jpeg_is_forwarded_untouched(self):
+        """Test that a small baseline RGB JPEG is returned byte for byte."""
+        image_bytes = create_image_bytes((640, 480))
+        before = self._passthrough_count()
+
+        output = optimize_image(image_bytes)
+
+        self.assertEqual(output.getvalue(), image_bytes)
+        self.assertEqual(self._passthrough_count(), before + 1)
+
+    def test_exif_is_stripped_without_reencoding(self):
+        """Test that EXIF is removed while the compressed data is kept."""
+        image_bytes = create_image_bytes((640, 480), exif=create_exif())
+
+        output = optimize_image(image_bytes).getvalue()
+
+        self.assertNotIn(b'Test Camera', output)
+        self.assertTrue(image_bytes.endswith(output[output.index(b'\xff\xda'):]))
+        self.assertEqual(Image.open(BytesIO(output)).size, (640, 480))
+
+    def test_strip_without_metadata_returns_same_object(self):
+        """Test that JPEGs without APP1 segments are not copied."""
+        image_bytes = create_image_bytes((64, 64))
+
+        self.assertIs(strip_jpeg_metadata(image_bytes), image_bytes)
+
+    def test_non_compliant_images_are_reencoded(self):
+        """Test that uploads needing work still go through the full path."""
+        cases = {
+            'progressive': create_image_bytes((640, 480), progressive=True),
+            'rotated': create_image_bytes((640, 480), exif=create_exif(orientation=6)),
+            'too large': create_image_bytes((2048, 1536)),
+            'png': create_image_bytes((640, 480), image_format='PNG'),
+            'grayscale': create_image_bytes((640, 480), mode='L', color=128),
+        }
+        for name, image_bytes in cases.items():
+            with self.subTest(name):
+                before = self._passthrough_count()
+                output = optimize_image(image_bytes).getvalue()
+                self.assertNotEqual(output, image_bytes)
+                self.assertEqual(self._passthrough_count(), before)
+
+    def test_byte_budget(self):
+        """Test that uploads above the byte budget are re-encoded."""
+        image_bytes = create_image_bytes((640, 480))
+
+        output = optimize_image(image_bytes, max_bytes=len(image_bytes) - 1)
+
+        self.assertNotEqual(output.getvalue(), image_bytes)
+
+class TestValidateImage(unittest.TestCase):
+    """Tests for the header-only image validator."""
+
+    def test_jpeg_header(self):
+        """Test that JPEG dimensions are read past a large EXIF block."""
+        exif = Image.Exif()
+        exif[0x010E] = 'x' * 60000
+        stream = BytesIO(create_image_bytes((320, 200), exif=exif.tobytes()))
+
+        header = validate_image(stream)
+
+        self.assertEqual((header['format'], header['width'], header['height']), ('JPEG', 320, 200))
+        self.assertEqual(header['bands'], 3)
+        self.assertFalse(header['progressive'])
+        self.assertEqual(stream.tell(), 0)
+
+    def test_png_header(self):
+        """Test that PNG dimensions and channels come from IHDR."""
+        stream = BytesIO(create_image_bytes((31, 17), image_format='PNG', mode='RGBA'))
+
+        header = read_image_header(stream)
+
+        self.assertEqual((header['format'], header['width'], header['height']), ('PNG', 31, 17))
+        self.assertEqual(header['bands'], 4)
+
+    def test_progressive_jpeg_header(self):
+        """Test that progressive JPEGs are identified."""
+        stream = BytesIO(create_image_bytes((64, 64), progressive=True))
+
+        self.assertTrue(read_image_header(stream)['progressive'])
+
+    def test_rejects_other_types(self):
+        """Test that only JPEG and PNG magic bytes are accepted."""
+        for data in (create_image_bytes((10, 10), image_format='GIF', mode='P', color=1), b'not an image'):
+            with self.assertRaises(ValueError):
+                validate_image(BytesIO(data))
+
+    def test_rejects_truncated_header(self):
+        """Test that headers cut before the frame header are rejected."""
+        data = create_image_bytes((64, 64), exif=create_exif())
+
+        with self.assertRaises(ValueError):
+            validate_image(BytesIO(data[:40]))
+
+    def test_rejects_oversized_content_length(self):
+        """Test that the declared Content-Length is checked before reading."""
+        stream = BytesIO(create_image_bytes((10, 10)))
+
+        with self.assertRaises(ValueError):
+            validate_image(stream, content_length=6 * 1024 * 1024)
+        self.assertEqual(stream.tell(), 0)
+
+    def test_rejects_oversized_file(self):
+        """Test that the file size is checked without relying on Content-Length."""
+        stream = BytesIO(create_image_bytes((10, 10)))
+
+        with self.assertRaises(ValueError):
+            validate_image(stream, max_bytes=100)
+
+    def test_rejects_too_many_pixels(self):
+        """Test the pixel-count limit."""
+        stream = BytesIO(create_image_bytes((200, 100), image_format='PNG'))
+
+        with self.assertRaises(ValueError):
+            validate_image(stream, max_pixels=200 * 100 - 1)
+        self.assertEqual(validate_image(stream, max_pixels=200 * 100)['width'], 200)
+
+class TestPreprocessPool(unittest.TestCase):
+    """Tests for the preprocessing process pool."""
+
+    def test_pool_matches_in_thread_result(self):
+        """Test that optimizing in a worker process gives the same bytes."""
+        image_bytes = create_image_bytes((1500, 1000), image_format='PNG')
+        pool = PreprocessPool(max_workers=1)
+        try:
+            pooled = optimize_image(image_bytes, executor=pool).getvalue()
+        finally:
+            pool.shutdown()
+
+        self.assertEqual(pooled, optimize_image(image_bytes).getvalue())
+
+    def test_errors_keep_their_cause(self):
+        """Test that only undecodable images become ValueError; pool and memory errors propagate."""
+        image_bytes = create_image_bytes((300, 200), image_format='PNG')
+        with self.assertRaises(ValueError):
+            prepare_image_payload(image_bytes[:len(image_bytes) // 2])
+
+        for error in (BrokenProcessPool('worker died'), MemoryError()):
+            executor = mock.Mock()
+            executor.submit.return_value.result.side_effect = error
+            with self.assertRaises(type(error)):
+                prepare_image_payload(image_bytes, executor=executor)
+
+    def test_parse_worker_count(self):
+        """Test the PREPROCESS_WORKERS setting values."""
+        self.assertEqual(parse_worker_count('0'), 0)
+        self.assertEqual(parse_worker_count(''), 0)
+        self.assertEqual(parse_worker_count('3'), 3)
+        self.assertEqual(parse_worker_count('auto'), get_cpu_count())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import imagebb
+
+class TestImageBBUpload(unittest.TestCase):
+    """Tests for the ImageBB uploader with the HTTP session mocked out."""
+
+    def test_binary_multipart_with_timeouts(self):
+        """Test that the image is sent as a binary file over the shared session."""
+        session = mock.MagicMock()
+        session.post.return_value.json.return_value = {'success': True, 'data': {'url': 'https://i.ibb.co/x.jpg'}}
+
+        with mock.patch('utils.imagebb.get_session', return_value=session):
+            result = imagebb.upload_image_to_imagebb(b'\xff\xd8binary', api_key='key', name='cat.jpg')
+
+        self.assertEqual(result, {'url': 'https://i.ibb.co/x.jpg'})
+        kwargs = session.post.call_args.kwargs
+        self.assertEqual(kwargs['files']['image'][1], b'\xff\xd8binary')
+        self.assertNotIn('image', kwargs['data'])
+        self.assertEqual(kwargs['timeout'], (imagebb.CONNECT_TIMEOUT, imagebb.READ_TIMEOUT))
+
+    def test_session_is_shared(self):
+        """Test that every upload reuses the same pooled session."""
+        self.assertIs(imagebb.get_session(), imagebb.get_session())
+
+    def test_upload_with_retry_backs_off(self):
+        """Test that retries wait with growing, jittered delays."""
+        uploader = imagebb.ImageBBUploader(api_key='key')
+
+        with mock.patch.object(uploader, 'upload_image', side_effect=[None, None, {'url': 'u'}]), \
+                mock.patch('utils.imagebb.time.sleep') as sleep:
+            self.assertEqual(uploader.upload_with_retry(b'data', delay=2), {'url': 'u'})
+
+        first, second = (call.args[0] for call in sleep.call_args_list)
+        self.assertTrue(1 <= first <= 2)
+        self.assertTrue(2 <= second <= 4)
+
+if __name__ == '__main__':
+    unittest.main()
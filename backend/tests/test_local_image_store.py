@@ -0,0 +1,90 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+import hashlib
+import threading
+from unittest import mock
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.local_image_store import LocalImageStore
+from utils.stats_new import ClassificationStats
+from tests.test_image_processing import create_image_bytes
+
+class TestLocalImageStore(unittest.TestCase):
+    """Tests for the content-addressed local image store."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = LocalImageStore(os.path.join(self.temp_dir, 'images'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_identical_images_are_stored_once(self):
+        """Test that images are keyed by SHA-256 and deduplicated."""
+        image_bytes = create_image_bytes((64, 64), image_format='PNG')
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+        first = self.store.save(image_bytes)
+        second = self.store.save(image_bytes)
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['id'], image_hash)
+        self.assertEqual(first['url'], f"/api/images/{image_hash}")
+        self.assertEqual(self.store.mime_type(image_hash), 'image/png')
+        files = [name for _, _, names in os.walk(self.store.directory) for name in names]
+        self.assertEqual(files, [image_hash])
+
+    def test_concurrent_saves_of_the_same_image(self):
+        """Test that threads saving the same image do not share a temporary file."""
+        image_bytes = create_image_bytes((64, 64), image_format='PNG') + os.urandom(1024 * 1024)
+        errors = []
+
+        def save():
+            try:
+                self.store.save(image_bytes)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch('os.path.exists', return_value=False):
+            threads = [threading.Thread(target=save) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        files = [name for _, _, names in os.walk(self.store.directory) for name in names]
+        self.assertEqual(files, [hashlib.sha256(image_bytes).hexdigest()])
+
+    def test_rejects_invalid_keys(self):
+        """Test that only SHA-256 keys are looked up."""
+        self.assertFalse(self.store.exists('../../config.py'))
+        self.assertFalse(self.store.exists('0' * 64))
+
+    def test_stats_use_local_store_instead_of_imagebb(self):
+        """Test that records point to the local store without contacting ImageBB."""
+        stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history'),
+            image_store=self.store
+        )
+        image_bytes = create_image_bytes((64, 64))
+
+        with mock.patch('utils.stats_new.upload_image_to_imagebb') as upload:
+            record_id = stats.record_classification_with_image('gato', 87.0, image_bytes)
+            upload.assert_not_called()
+        stats.close()
+
+        with open(os.path.join(stats.history_dir, f"{record_id}.json")) as f:
+            record = json.load(f)
+        self.assertEqual(record['image_hash'], hashlib.sha256(image_bytes).hexdigest())
+        self.assertEqual(record['image_url'], f"/api/images/{record['image_hash']}")
+
+if __name__ == '__main__':
+    unittest.main()
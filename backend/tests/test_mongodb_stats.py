@@ -0,0 +1,406 @@
+import unittest
+import os
+import sys
+import time
+import uuid
+import shutil
+import tempfile
+from unittest import mock
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import MongoClient
+from pymongo.errors import AutoReconnect, PyMongoError
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import (
+    create_indexes, migrate_confidence_sums, migrate_timestamps_to_dates, migrate_history_counts, check_history_timestamps
+)
+from utils.mongodb_stats import HISTORY_SORT, MongoDBStats
+from utils.history_cursor import next_cursor
+from utils.upload_outbox import UploadOutbox
+
+MONGO_TEST_URI = os.environ.get('MONGO_TEST_URI', 'mongodb://localhost:27017')
+
+def _plan_stages(plan):
+    """List the stage names of a query plan tree."""
+    stages = [plan.get("stage")]
+    for child in plan.get("inputStages", []) + [plan[key] for key in ("inputStage", "queryPlan") if key in plan]:
+        stages.extend(_plan_stages(child))
+    return stages
+
+class FakeCollection:
+    """Collection recording the write calls of the write-behind buffer, keeping inserted documents by _id."""
+    
+    def __init__(self, calls, name):
+        self.calls = calls
+        self.name = name
+        self.fail = False
+        self.documents = {}
+    
+    def insert_one(self, document):
+        self.calls.append((self.name, 'insert_one', 1))
+        self.documents[document['_id']] = dict(document)
+    
+    def insert_many(self, documents, ordered=True):
+        self.calls.append((self.name, 'insert_many', len(documents)))
+        for document in documents:
+            self.documents[document['_id']] = dict(document)
+    
+    def find_one(self, query, projection=None):
+        document = self.documents.get(query.get('_id'))
+        return dict(document) if document is not None else None
+    
+    def update_one(self, query, update, upsert=False):
+        document = self.documents.get(query.get('_id'))
+        if document is not None:
+            document.update(update.get('$set', {}))
+        return SimpleNamespace(matched_count=int(document is not None))
+    
+    def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise AutoReconnect("connection lost")
+        self.calls.append((self.name, 'bulk_write', len(operations)))
+
+class FakeDatabase:
+    """Database of FakeCollections."""
+    
+    def __init__(self):
+        self.calls = []
+        self.collections = {}
+    
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(self.calls, name)
+        return self.collections[name]
+    
+    __getattr__ = __getitem__
+
+class TestMongoWriteBuffer(unittest.TestCase):
+    """Tests for the write-behind buffer of MongoDBStats (no server needed)."""
+    
+    def setUp(self):
+        self.db = FakeDatabase()
+    
+    def test_writes_are_batched_and_merged(self):
+        """Test that many classifications become one insert_many and one bulk_write per collection."""
+        stats = MongoDBStats(db=self.db, flush_interval_ms=60000, flush_batch=1000, max_pending=1000)
+        for i in range(100):
+            stats.record_classification('gato' if i % 2 else 'perro', 80.0)
+            stats._insert_classification({'_id': str(i), 'category': 'gato', 'timestamp': str(i)})
+        self.assertEqual(self.db.calls, [])
+        
+        stats.close()
+        
+        self.assertIn(('classifications', 'insert_many', 100), self.db.calls)
+        # global + history_counts, today, minute + hour (two if the test crossed a minute)
+        self.assertIn(('statistics', 'bulk_write', 2), self.db.calls)
+        self.assertIn(('daily_stats', 'bulk_write', 1), self.db.calls)
+        self.assertLessEqual(len(self.db.calls), 4)
+    
+    def test_upload_result_applied_by_another_instance(self):
+        """Test that an upload finished before its record is flushed is applied on a retry."""
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        outbox_path = os.path.join(temp_dir, 'outbox.sqlite3')
+        upload = {'url': 'https://i.ibb.co/x.jpg', 'thumb': {'url': 'https://i.ibb.co/t.jpg'},
+                  'medium': {'url': 'https://i.ibb.co/m.jpg'}, 'delete_url': 'https://ibb.co/d'}
+        writer = MongoDBStats(db=self.db, upload_outbox=UploadOutbox(outbox_path),
+                              flush_interval_ms=60000, flush_batch=1000, max_pending=1000)
+        other = MongoDBStats(db=self.db, flush_interval_ms=60000, flush_batch=1000, max_pending=1000)
+        uploader = mock.Mock(return_value=upload)
+        worker = UploadOutbox(outbox_path, uploader=uploader, base_delay=0)
+        worker.on_result = other.apply_upload_result
+        
+        record_id = writer.record_classification_with_image('gato', 80.0, b'image')
+        # The record is still buffered: nothing is inserted on the request thread
+        self.assertNotIn(record_id, self.db.classifications.documents)
+        worker.process_once()
+        self.assertEqual(worker.get_metrics()['pending'], 1)
+        
+        writer.flush()
+        worker.process_once()
+        
+        uploader.assert_called_once()
+        record = self.db.classifications.documents[record_id]
+        self.assertEqual(record['upload_status'], 'uploaded')
+        self.assertEqual(record['image_url'], upload['url'])
+        self.assertEqual(worker.get_metrics()['pending'], 0)
+        with self.assertRaises(LookupError):
+            other.apply_upload_result('missing', upload)
+        writer.close()
+        other.close()
+    
+    def test_requeued_update_keeps_newer_set_values(self):
+        """Test that a failed flush put back in the buffer does not overwrite newer $set values."""
+        stats = MongoDBStats(db=self.db, flush_interval_ms=60000, flush_batch=1000, max_pending=1000)
+        stats._queue_update("statistics", "global", {"total_classifications": 1}, set_fields={"last_updated": "old"})
+        
+        def write_fails_after_a_newer_update(operations, ordered=True):
+            # Another request queues an update while the flush is writing
+            with stats._lock:
+                stats._queue_update("statistics", "global", {"total_classifications": 1},
+                                    set_fields={"last_updated": "new"})
+            raise AutoReconnect("connection lost")
+        
+        with mock.patch.object(self.db.statistics, 'bulk_write', side_effect=write_fails_after_a_newer_update), \
+                mock.patch.object(stats, '_ensure_flusher'):
+            with self.assertRaises(AutoReconnect):
+                stats.flush()
+        
+        update = stats._updates[("statistics", "global")]
+        self.assertEqual(update["inc"]["total_classifications"], 2)
+        self.assertEqual(update["set"]["last_updated"], "new")
+        stats._flush_failures = 0
+        stats.close()
+    
+    def test_backpressure_and_buffer_limit(self):
+        """Test that a full buffer is written by the caller, failures are kept and the buffer is bounded."""
+        stats = MongoDBStats(db=self.db, flush_interval_ms=60000, flush_batch=1000, max_pending=3, max_buffered=5)
+        daily_key = ('daily_stats', datetime.now().strftime('%Y-%m-%d'))
+        self.db.daily_stats.fail = True
+        
+        # The third write flushes from this thread; the error is logged, not raised
+        for _ in range(3):
+            stats.record_classification('gato', 80.0)
+        self.assertEqual(stats._updates[daily_key]['inc']['total'], 3)
+        # While flushes fail, writes are buffered up to max_buffered, then dropped
+        for _ in range(5):
+            stats.record_classification('gato', 80.0)
+        
+        self.assertEqual(stats._dropped, 1)
+        self.assertEqual(stats._updates[daily_key]['inc']['total'], 7)
+        self.db.daily_stats.fail = False
+        stats.close()
+        self.assertEqual(stats._updates, {})
+        self.assertEqual(stats._dropped, 0)
+    
+    def test_failed_flush_is_retried_without_new_writes(self):
+        """Test that the background thread retries a failed flush on its own."""
+        stats = MongoDBStats(db=self.db, flush_interval_ms=10)
+        self.db.daily_stats.fail = True
+        stats.record_classification('gato', 80.0)
+        time.sleep(0.1)
+        self.db.daily_stats.fail = False
+        
+        deadline = time.monotonic() + 5
+        while stats._flush_failures and time.monotonic() < deadline:
+            time.sleep(0.01)
+        
+        self.assertIn(('daily_stats', 'bulk_write', 1), self.db.calls)
+        self.assertEqual(stats._flush_failures, 0)
+        stats.close()
+
+class MongoTestCase(unittest.TestCase):
+    """Base class running each test against a fresh database, skipped without a MongoDB server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=500)
+        try:
+            cls.client.admin.command('ping')
+        except PyMongoError:
+            cls.client.close()
+            raise unittest.SkipTest(f"MongoDB not available at {MONGO_TEST_URI}")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+
+    def setUp(self):
+        self.db = self.client[f"test_image_classifier_{uuid.uuid4().hex[:8]}"]
+        create_indexes(self.db)
+        self.stats = MongoDBStats(db=self.db)
+
+    def tearDown(self):
+        self.stats.close()
+        self.client.drop_database(self.db.name)
+
+    def _insert_history(self, records):
+        """Insert (id, timestamp, category) history records directly."""
+        for record_id, timestamp, category in records:
+            self.stats._insert_classification({
+                '_id': record_id, 'id': record_id, 'timestamp': datetime.fromisoformat(timestamp), 'category': category
+            })
+
+class TestMongoHistoryPagination(MongoTestCase):
+    """Tests for keyset pagination and counts of the MongoDB history."""
+
+    def test_cursor_pages_with_equal_timestamps(self):
+        """Test that cursor pages neither skip nor repeat records sharing a timestamp."""
+        records = [(f"id-{i:02d}", f"2024-01-01T00:00:{i // 3:02d}", 'gato') for i in range(10)]
+        self._insert_history(records)
+
+        seen, cursor = [], None
+        while True:
+            page = self.stats.get_classification_history(limit=4, cursor=cursor)
+            seen.extend(entry['id'] for entry in page)
+            cursor = next_cursor(page, 4)
+            if cursor is None:
+                break
+
+        expected = [record_id for record_id, _, _ in sorted(records, key=lambda r: (r[1], r[0]), reverse=True)]
+        self.assertEqual(seen, expected)
+
+    def test_history_queries_use_indexes(self):
+        """Test that history pages are index scans without an in-memory sort."""
+        self._insert_history([(f"id-{i:02d}", f"2024-01-01T00:00:{i:02d}", 'gato' if i % 2 else 'perro')
+                              for i in range(20)])
+        self.stats.flush()
+        cursor = next_cursor(self.stats.get_classification_history(limit=5), 5)
+        
+        for category in (None, 'gato'):
+            for page_cursor in (None, cursor):
+                with self.subTest(category=category, cursor=bool(page_cursor)):
+                    query = MongoDBStats._history_query(category, page_cursor)
+                    plan = self.db.classifications.find(query).sort(HISTORY_SORT).limit(5).explain()
+                    stages = _plan_stages(plan["queryPlanner"]["winningPlan"])
+                    self.assertIn("IXSCAN", stages)
+                    self.assertNotIn("COLLSCAN", stages)
+                    self.assertNotIn("SORT", stages)
+    
+    def test_redundant_indexes_are_dropped(self):
+        """Test that the single-field indexes of earlier versions are replaced by the compound ones."""
+        self.db.classifications.create_index([("timestamp", -1)])
+        self.db.classifications.create_index([("category", 1)])
+        
+        create_indexes(self.db)
+        create_indexes(self.db)
+        
+        names = set(self.db.classifications.index_information())
+        self.assertNotIn("timestamp_-1", names)
+        self.assertNotIn("category_1", names)
+        self.assertIn("category_1_timestamp_-1__id_-1", names)
+    
+    def test_timestamps_migration(self):
+        """Test that ISO string timestamps become dates, in batches and only once."""
+        for i in range(5):
+            self.db.classifications.insert_one({
+                "_id": f"id-{i}", "id": f"id-{i}", "category": "gato", "timestamp": f"2024-01-0{i + 1}T10:00:00"
+            })
+        
+        with self.assertRaises(RuntimeError):
+            check_history_timestamps(self.db)
+        
+        self.assertEqual(migrate_timestamps_to_dates(self.db, batch_size=2), 5)
+        self.assertEqual(migrate_timestamps_to_dates(self.db), 0)
+        check_history_timestamps(self.db)
+        
+        history = self.stats.get_classification_history()
+        self.assertEqual([entry['timestamp'] for entry in history][0], '2024-01-05T10:00:00')
+        self.assertEqual(self.db.classifications.count_documents({"timestamp": {"$gte": datetime(2024, 1, 3)}}), 3)
+    
+    def test_history_counts(self):
+        """Test that counts are recounted by the migration and then kept up to date by inserts."""
+        # Records from before the counts existed
+        self.db.classifications.insert_many([{'_id': 'a', 'category': 'gato'}, {'_id': 'b', 'category': 'perro'}])
+        self.assertEqual(self.stats.count_history(), 0)
+        self.assertEqual(migrate_history_counts(self.db), 2)
+        self.assertEqual(self.stats.count_history(), 2)
+
+        self._insert_history([('c', '2024-01-01T00:00:02', 'gato')])
+
+        self.assertEqual(self.stats.count_history(), 3)
+        self.assertEqual(self.stats.count_history('gato'), 2)
+        self.assertEqual(self.stats.count_history('conejo'), 0)
+
+class TestMongoStats(MongoTestCase):
+    """Tests for the aggregate statistics kept in MongoDB."""
+
+    def test_confidence_percentiles(self):
+        """Test that get_stats reports p10/p50/p90 per category and per day."""
+        for confidence in range(1, 101):
+            self.stats.record_classification('gato', confidence)
+
+        summary = self.stats.get_stats(days=1)
+
+        gato = summary['categories']['gato']['percentiles']
+        self.assertAlmostEqual(gato['p50'], 50, delta=1)
+        self.assertAlmostEqual(gato['p90'], 90, delta=1)
+        today = next(iter(summary['daily'].values()))
+        self.assertEqual(today['percentiles']['gato'], gato)
+
+    def test_concurrent_writers_lose_no_updates(self):
+        """Test that parallel record_classification calls are all counted."""
+        writers, per_writer = 16, 50
+        
+        def write(worker):
+            # One MongoDBStats (and write buffer) per writer, like separate workers
+            stats = MongoDBStats(db=self.db, flush_batch=7)
+            for i in range(per_writer):
+                stats.record_classification('gato' if i % 2 else 'perro', 50.0 + worker)
+            stats.close()
+        
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            list(pool.map(write, range(writers)))
+        
+        summary = self.stats.get_stats(days=1)
+        total = writers * per_writer
+        self.assertEqual(summary['total_classifications'], total)
+        self.assertEqual(sum(data['count'] for data in summary['categories'].values()), total)
+        self.assertAlmostEqual(summary['categories']['gato']['avg_confidence'], 50.0 + (writers - 1) / 2)
+        self.assertEqual(next(iter(summary['daily'].values()))['total'], total)
+    
+    def test_legacy_average_migration(self):
+        """Test that a stored running average becomes a confidence sum, once."""
+        self.db.statistics.insert_one({
+            "_id": "global", "total_classifications": 4, "last_updated": None,
+            "categories": {"gato": {"count": 4, "avg_confidence": 80.0}}
+        })
+        
+        self.assertEqual(migrate_confidence_sums(self.db), 1)
+        self.assertEqual(migrate_confidence_sums(self.db), 0)
+        self.stats.record_classification('gato', 90.0)
+        self.stats.flush()
+        
+        gato = self.db.statistics.find_one({"_id": "global"})["categories"]["gato"]
+        self.assertNotIn("avg_confidence", gato)
+        self.assertAlmostEqual(gato["confidence_sum"], 410.0)
+        self.assertAlmostEqual(self.stats.get_stats(days=1)['categories']['gato']['avg_confidence'], 82.0)
+    
+    def test_daily_window_is_zero_filled(self):
+        """Test that get_stats returns every day of the window, and only those."""
+        today = datetime.now()
+        for offset in (0, 2, 40):
+            date = (today - timedelta(days=offset)).strftime('%Y-%m-%d')
+            self.db.daily_stats.insert_one({"_id": date, "date": date, "total": offset + 1, "categories": {}})
+        
+        daily = self.stats.get_stats(days=30)['daily']
+        
+        self.assertEqual(len(daily), 30)
+        self.assertEqual(list(daily), sorted(daily))
+        self.assertEqual(sum(day['total'] for day in daily.values()), 1 + 3)
+        self.assertEqual(daily[(today - timedelta(days=1)).strftime('%Y-%m-%d')]['total'], 0)
+    
+    def test_rollups_are_incremental(self):
+        """Test that each rollup run adds the classifications past the watermark, once."""
+        self._insert_history([('a', '2024-01-01T10:00:00', 'gato'), ('b', '2024-01-02T10:00:00', 'perro'),
+                              ('c', '2024-01-02T12:00:00', 'perro')])
+        self.stats.flush()
+        self.db.classifications.update_many({}, {"$set": {"confidence": 80.0}})
+        
+        self.stats.refresh_rollups(now=datetime(2024, 1, 2, 11, 10))
+        self.stats.refresh_rollups(now=datetime(2024, 1, 2, 11, 10))
+        first = self.stats.get_rollups(start='2024-01-01', end='2024-01-02')
+        self.stats.refresh_rollups(now=datetime(2024, 1, 3))
+        second = self.stats.get_rollups(group='week', start='2024-01-01', end='2024-01-02')
+        
+        self.assertEqual([point['total'] for point in first], [1, 1])
+        self.assertEqual(second[0]['categories']['perro'], {'count': 2, 'avg_confidence': 80.0})
+        self.assertEqual(second[0]['total'], 3)
+    
+    def test_timeseries(self):
+        """Test that classifications are counted in minute, hour and day buckets."""
+        self.stats.record_classification('gato', 80.0)
+        self.stats.record_classification('perro', 90.0)
+
+        for granularity in ('minute', 'hour', 'day'):
+            points = self.stats.get_timeseries(granularity)
+            self.assertEqual(sum(point['total'] for point in points), 2)
+            self.assertEqual(sum(point['categories'].get('gato', 0) for point in points), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+import threading
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.image_processing import prepare_image_payload, RENDITION_SIZES
+from utils.renditions import RenditionStore
+from tests.test_image_processing import create_image_bytes, create_exif
+
+class TestRenditions(unittest.TestCase):
+    """Tests for the display renditions generated at ingest."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = RenditionStore(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_renditions_from_decoded_image(self):
+        """Test that renditions are encoded alongside the API payload."""
+        image_bytes = create_image_bytes((3000, 2000), image_format='PNG')
+
+        _, _, renditions = prepare_image_payload(image_bytes, renditions=RENDITION_SIZES)
+
+        self.assertEqual(set(renditions), {'thumb', 'medium'})
+        self.assertEqual(Image.open(BytesIO(renditions['medium'][0])).size, (640, 427))
+        self.assertEqual(Image.open(BytesIO(renditions['thumb'][0])).size, (180, 120))
+        self.assertEqual(renditions['thumb'][1], 'image/jpeg')
+
+    def test_renditions_are_upright(self):
+        """Test that the EXIF orientation is applied, also on the pass-through path."""
+        image_bytes = create_image_bytes((400, 300), exif=create_exif(orientation=6))
+
+        _, _, renditions = prepare_image_payload(image_bytes, renditions=RENDITION_SIZES)
+
+        self.assertEqual(Image.open(BytesIO(renditions['thumb'][0])).size, (135, 180))
+
+    def test_store_saves_once_per_image(self):
+        """Test that an upload's renditions are generated and written only once."""
+        image_bytes = create_image_bytes((800, 600))
+
+        filenames = self.store.save(image_bytes)
+        with mock.patch('utils.renditions.create_renditions_from_bytes') as create:
+            self.assertEqual(self.store.save(image_bytes), filenames)
+            create.assert_not_called()
+
+        self.assertEqual(set(filenames), {'thumb', 'medium'})
+        for filename in filenames.values():
+            self.assertTrue(self.store.is_valid_filename(filename))
+            self.assertTrue(os.path.exists(os.path.join(self.temp_dir, filename)))
+
+    def test_concurrent_saves_of_the_same_image(self):
+        """Test that threads saving the same upload do not share a temporary file."""
+        image_bytes = create_image_bytes((800, 600))
+        _, _, renditions = prepare_image_payload(image_bytes, renditions=RENDITION_SIZES)
+        errors = []
+
+        def save():
+            try:
+                self.store.save(image_bytes, renditions)
+            except Exception as e:
+                errors.append(e)
+
+        with mock.patch.object(self.store, '_existing', return_value={}):
+            threads = [threading.Thread(target=save) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(os.listdir(self.temp_dir)), 2)
+
+    def test_invalid_filenames(self):
+        """Test that only rendition file names can be served."""
+        self.assertFalse(self.store.is_valid_filename('../config.py'))
+        self.assertFalse(self.store.is_valid_filename('history.json'))
+
+if __name__ == '__main__':
+    unittest.main()
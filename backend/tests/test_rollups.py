@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from datetime import date, datetime
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import rollups
+from utils.stats_new import ClassificationStats
+
+class TestRollups(unittest.TestCase):
+    """Tests for grouping rollup rows into periods."""
+
+    def test_weekly_and_monthly_groups(self):
+        """Test that rows are summed per period with their average confidence."""
+        rows = [
+            {'date': '2024-01-01', 'category': 'gato', 'count': 2, 'confidence_sum': 160.0},
+            {'date': '2024-01-07', 'category': 'gato', 'count': 2, 'confidence_sum': 180.0},
+            {'date': '2024-01-08', 'category': 'perro', 'count': 1, 'confidence_sum': None}
+        ]
+        start, end = rollups.parse_range('week', '2024-01-03', '2024-01-10')
+
+        weeks = rollups.summarize(rows, 'week', start, end)
+
+        self.assertEqual(start, date(2024, 1, 1))
+        self.assertEqual(weeks, [
+            {'start': '2024-01-01', 'total': 4, 'categories': {'gato': {'count': 4, 'avg_confidence': 85.0}}},
+            {'start': '2024-01-08', 'total': 1, 'categories': {'perro': {'count': 1, 'avg_confidence': None}}}
+        ])
+        months = rollups.summarize(rows, 'month', *rollups.parse_range('month', '2024-01-15', '2024-02-01'))
+        self.assertEqual([(point['start'], point['total']) for point in months], [('2024-01-01', 5), ('2024-02-01', 0)])
+
+    def test_parse_range(self):
+        """Test range defaults and validation."""
+        today = date(2024, 3, 31)
+        self.assertEqual(rollups.parse_range('day', today=today), (date(2024, 3, 2), today))
+        for args in (('year',), ('day', '31/03/2024'), ('day', '2024-02-01', '2024-01-01'),
+                     ('day', '2000-01-01', '2024-01-01')):
+            with self.assertRaises(ValueError):
+                rollups.parse_range(*args)
+
+class TestStatsRollups(unittest.TestCase):
+    """Tests for the rollups of the file-based stats."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history')
+        )
+
+    def tearDown(self):
+        self.stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_rollups_from_daily_stats(self):
+        """Test that today's counts and average confidence are reported per category."""
+        for category, confidence in (('gato', 80.0), ('gato', 90.0), ('perro', 70.0)):
+            self.stats.record_classification(category, confidence)
+        today = datetime.now().date().isoformat()
+
+        points = self.stats.get_rollups(start=today, end=today)
+        gato_only = self.stats.get_rollups(start=today, end=today, category='gato')
+
+        self.assertEqual(points, [{'start': today, 'total': 3, 'categories': {
+            'gato': {'count': 2, 'avg_confidence': 85.0},
+            'perro': {'count': 1, 'avg_confidence': 70.0}
+        }}])
+        self.assertEqual(list(gato_only[0]['categories']), ['gato'])
+
+if __name__ == '__main__':
+    unittest.main()
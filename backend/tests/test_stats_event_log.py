@@ -0,0 +1,209 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.stats_new import ClassificationStats
+
+def record_many(stats_file, history_dir, count):
+    """Record classifications from a separate worker process."""
+    stats = ClassificationStats(stats_file=stats_file, history_dir=history_dir, compact_every=50, flush_batch=7)
+    for i in range(count):
+        stats.record_classification('gato' if i % 2 else 'perro', 80.0)
+    stats.close()
+
+class TestStatsEventLog(unittest.TestCase):
+    """Tests for the event log behind the file-based statistics."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.stats_file = os.path.join(self.temp_dir, 'stats.json')
+        self.history_dir = os.path.join(self.temp_dir, 'history')
+        self.instances = []
+
+    def tearDown(self):
+        for stats in self.instances:
+            stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _create_stats(self, **kwargs):
+        stats = ClassificationStats(stats_file=self.stats_file, history_dir=self.history_dir, **kwargs)
+        self.instances.append(stats)
+        return stats
+
+    def test_restart_replays_log(self):
+        """Test that aggregates are rebuilt from the log without a snapshot write."""
+        stats = self._create_stats()
+        stats.record_classification('gato', 80.0)
+        stats.record_classification('gato', 90.0)
+        stats.record_classification('perro', 70.0)
+        stats.close()
+        self.assertFalse(os.path.exists(self.stats_file))
+
+        restarted = self._create_stats()
+
+        self.assertEqual(restarted.stats['total_classifications'], 3)
+        self.assertEqual(restarted.stats['categories']['gato']['count'], 2)
+        self.assertAlmostEqual(restarted.stats['categories']['gato']['avg_confidence'], 85.0)
+        self.assertEqual(restarted.stats['daily'], stats.stats['daily'])
+
+    def test_writes_are_batched(self):
+        """Test that classifications reach the log in batches, not one write each."""
+        stats = self._create_stats(flush_batch=3, flush_interval_ms=60000)
+        stats.record_classification('gato', 80.0)
+        stats.record_classification('gato', 80.0)
+        with open(stats.log_file) as f:
+            self.assertEqual(len(f.readlines()), 1)  # header only
+
+        stats.record_classification('gato', 80.0)
+        with open(stats.log_file) as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+    def test_compaction_writes_snapshot_and_rotates_log(self):
+        """Test that compaction snapshots the aggregates and empties the log."""
+        stats = self._create_stats(compact_every=3, flush_batch=1)
+        for _ in range(4):
+            stats.record_classification('gato', 80.0)
+
+        with open(self.stats_file) as f:
+            snapshot = json.load(f)
+        self.assertEqual(snapshot['total_classifications'], 3)
+        with open(stats.log_file) as f:
+            self.assertEqual(len(f.readlines()), 2)  # header and one event
+
+        # Snapshot plus log tail, without counting the compacted events twice
+        self.assertEqual(self._create_stats().stats['total_classifications'], 4)
+
+    def test_instances_merge_each_others_events(self):
+        """Test that instances sharing the files see each other's classifications, across compactions."""
+        first = self._create_stats(compact_every=4)
+        second = self._create_stats(compact_every=4)
+
+        for _ in range(3):
+            first.record_classification('gato', 80.0)
+            second.record_classification('perro', 90.0)
+        # Buffered classifications are visible to other instances once flushed
+        first.flush()
+        second.flush()
+
+        for stats in (first, second):
+            summary = stats.get_stats()
+            self.assertEqual(summary['total_classifications'], 6)
+            self.assertEqual(summary['categories']['gato']['count'], 3)
+            self.assertEqual(summary['categories']['perro']['count'], 3)
+
+    def test_concurrent_threads(self):
+        """Test that no classification is lost with concurrent threads."""
+        stats = self._create_stats(compact_every=100, flush_batch=10)
+        threads = [
+            threading.Thread(target=lambda: [stats.record_classification('gato', 80.0) for _ in range(200)])
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(stats.get_stats()['total_classifications'], 1600)
+        stats.close()
+        self.assertEqual(self._create_stats().stats['total_classifications'], 1600)
+
+    def test_concurrent_processes(self):
+        """Test that several worker processes produce correct totals."""
+        workers = [
+            multiprocessing.Process(target=record_many, args=(self.stats_file, self.history_dir, 150))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        summary = self._create_stats().get_stats()
+        self.assertEqual(summary['total_classifications'], 600)
+        self.assertEqual(summary['categories']['gato']['count'], 300)
+        self.assertEqual(summary['categories']['perro']['count'], 300)
+
+    def test_get_stats_is_read_only(self):
+        """Test that reading a short window neither drops older days nor writes the stats file."""
+        old_date = (datetime.now() - timedelta(days=5)).strftime('%Y-%m-%d')
+        with open(self.stats_file, 'w') as f:
+            json.dump({'total_classifications': 1, 'categories': {'gato': {'count': 1, 'avg_confidence': 80.0}},
+                       'daily': {old_date: {'total': 1, 'categories': {'gato': 1}}}, 'last_updated': None}, f)
+        mtime = os.path.getmtime(self.stats_file)
+        stats = self._create_stats()
+
+        self.assertEqual(list(stats.get_stats(days=1)['daily']), [datetime.now().strftime('%Y-%m-%d')])
+
+        self.assertIn(old_date, stats.get_stats(days=7)['daily'])
+        self.assertEqual(stats.get_stats(days=7)['daily'][old_date]['total'], 1)
+        self.assertEqual(os.path.getmtime(self.stats_file), mtime)
+
+    def test_summaries_are_memoized(self):
+        """Test that summaries are reused until a classification changes them."""
+        stats = self._create_stats()
+        first = stats.get_stats(days=7)
+        self.assertIs(stats.get_stats(days=7), first)
+
+        stats.record_classification('gato', 80.0)
+
+        second = stats.get_stats(days=7)
+        self.assertIsNot(second, first)
+        self.assertEqual(second['total_classifications'], 1)
+        self.assertEqual(first['total_classifications'], 0)
+
+    def test_retention_on_compaction(self):
+        """Test that daily data older than retention_days is dropped when compacting."""
+        old_date = (datetime.now() - timedelta(days=40)).strftime('%Y-%m-%d')
+        with open(self.stats_file, 'w') as f:
+            json.dump({'total_classifications': 1, 'categories': {'gato': {'count': 1, 'avg_confidence': 80.0}},
+                       'daily': {old_date: {'total': 1, 'categories': {'gato': 1}}}, 'last_updated': None}, f)
+        stats = self._create_stats(compact_every=2, flush_batch=1, retention_days=30)
+
+        stats.record_classification('gato', 80.0)
+        self.assertIn(old_date, stats.stats['daily'])
+        stats.record_classification('gato', 80.0)
+
+        with open(self.stats_file) as f:
+            snapshot = json.load(f)
+        self.assertNotIn(old_date, snapshot['daily'])
+        self.assertEqual(snapshot['total_classifications'], 3)
+
+    def test_torn_tail_is_dropped(self):
+        """Test that a line cut short by a crash is ignored and later appends stay readable."""
+        stats = self._create_stats()
+        stats.record_classification('gato', 80.0)
+        stats.close()
+        with open(stats.log_file, 'a') as f:
+            f.write('{"timestamp": "2024-')
+
+        restarted = self._create_stats()
+        self.assertEqual(restarted.stats['total_classifications'], 1)
+        restarted.record_classification('perro', 70.0)
+        restarted.close()
+
+        self.assertEqual(self._create_stats().stats['total_classifications'], 2)
+
+    def test_corrupt_snapshot_is_kept(self):
+        """Test that an unreadable snapshot is moved aside instead of overwritten."""
+        with open(self.stats_file, 'w') as f:
+            f.write('{"total_classifications": 12')
+
+        stats = self._create_stats()
+
+        self.assertEqual(stats.stats['total_classifications'], 0)
+        self.assertFalse(os.path.exists(self.stats_file))
+        corrupt = [name for name in os.listdir(self.temp_dir) if name.startswith('stats.json.corrupt-')]
+        self.assertEqual(len(corrupt), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import timeseries
+from utils.stats_new import ClassificationStats
+
+class TestRingBuffers(unittest.TestCase):
+    """Tests for the minute and hour ring buffers."""
+
+    def test_ring_keeps_a_fixed_number_of_buckets(self):
+        """Test that new buckets replace the ones a full turn older."""
+        series = {}
+        start = datetime(2024, 1, 1)
+        _, slots = timeseries.RESOLUTIONS['minute']
+        for minute in range(slots + 10):
+            timeseries.add(series, 'minute', (start + timedelta(minutes=minute)).isoformat(), 'gato')
+
+        self.assertEqual(len(series), slots)
+        starts = sorted(bucket['start'] for bucket in series.values())
+        self.assertEqual(starts[0], timeseries.bucket_label(start + timedelta(minutes=10), 'minute'))
+
+    def test_counts_and_late_events(self):
+        """Test that a bucket counts by category and events older than the ring are dropped."""
+        series = {}
+        timeseries.add(series, 'hour', '2024-01-01T10:15:00', 'gato')
+        timeseries.add(series, 'hour', '2024-01-01T10:45:00', 'perro')
+        _, slots = timeseries.RESOLUTIONS['hour']
+        timeseries.add(series, 'hour', (datetime(2024, 1, 1, 10) - timedelta(hours=slots)).isoformat(), 'gato')
+
+        self.assertEqual(list(series.values()), [
+            {'start': '2024-01-01T10:00', 'total': 2, 'categories': {'gato': 1, 'perro': 1}}
+        ])
+
+    def test_parse_range(self):
+        """Test range defaults and validation."""
+        now = datetime(2024, 1, 1, 12, 30, 15)
+        self.assertEqual(timeseries.parse_range('minute', now=now),
+                         (datetime(2024, 1, 1, 11, 30), datetime(2024, 1, 1, 12, 30)))
+        for args in (('week',), ('hour', 'yesterday'), ('hour', '2024-01-02', '2024-01-01')):
+            with self.assertRaises(ValueError):
+                timeseries.parse_range(*args)
+        with self.assertRaises(ValueError):
+            timeseries.bucket_range('day', datetime(1990, 1, 1), datetime(2024, 1, 1))
+
+class TestStatsTimeseries(unittest.TestCase):
+    """Tests for the time series of the file-based stats."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history')
+        )
+
+    def tearDown(self):
+        self.stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_every_granularity(self):
+        """Test that a classification is counted at minute, hour and day resolution."""
+        self.stats.record_classification('gato', 80.0)
+        self.stats.record_classification('perro', 90.0)
+
+        for granularity, length in (('minute', 61), ('hour', 25), ('day', 8)):
+            points = self.stats.get_timeseries(granularity)
+            self.assertEqual(len(points), length)
+            # Both land in the last bucket, unless a minute boundary passed meanwhile
+            self.assertEqual(sum(point['total'] for point in points[-2:]), 2)
+            self.assertEqual(sum(point['total'] for point in points), 2)
+
+    def test_range_is_limited_to_retention(self):
+        """Test that buckets older than the ring buffer are not returned."""
+        start = (datetime.now() - timedelta(days=1)).isoformat()
+
+        points = self.stats.get_timeseries('minute', start=start)
+
+        self.assertEqual(len(points), timeseries.RESOLUTIONS['minute'][1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+import sys
+import time
+import sqlite3
+from contextlib import closing
+from unittest import mock
+
+# Add the parent directory to the path to import modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.upload_outbox import UploadOutbox
+from utils.stats_new import ClassificationStats
+
+UPLOAD_RESULT = {
+    'url': 'https://i.ibb.co/abc/full.jpg',
+    'thumb': {'url': 'https://i.ibb.co/abc/thumb.jpg'},
+    'medium': {'url': 'https://i.ibb.co/abc/medium.jpg'},
+    'delete_url': 'https://ibb.co/abc/delete'
+}
+
+class TestUploadOutbox(unittest.TestCase):
+    """Tests for the durable background upload outbox."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'outbox.sqlite3')
+        self.uploader = mock.Mock(return_value=UPLOAD_RESULT)
+        self.results = []
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _create_outbox(self, **kwargs):
+        outbox = UploadOutbox(self.db_path, uploader=self.uploader, base_delay=0, **kwargs)
+        outbox.on_result = lambda record_id, result: self.results.append((record_id, result))
+        return outbox
+
+    def test_jobs_survive_restarts(self):
+        """Test that enqueued uploads are processed by a later outbox instance."""
+        self._create_outbox().enqueue('record-1', b'image', name='cat.jpg')
+
+        outbox = self._create_outbox()
+        self.assertEqual(outbox.get_metrics()['pending'], 1)
+        self.assertTrue(outbox.process_once())
+        self.assertFalse(outbox.process_once())
+
+        self.uploader.assert_called_once_with(b'image', name='cat.jpg')
+        self.assertEqual(self.results, [('record-1', UPLOAD_RESULT)])
+        self.assertEqual(outbox.get_metrics()['pending'], 0)
+
+    def test_retries_then_gives_up(self):
+        """Test that failed uploads are retried and marked failed after max_attempts."""
+        self.uploader.return_value = None
+        outbox = self._create_outbox(max_attempts=3)
+        outbox.enqueue('record-1', b'image')
+
+        while outbox.process_once():
+            pass
+
+        self.assertEqual(self.uploader.call_count, 3)
+        self.assertEqual(self.results, [('record-1', None)])
+        metrics = outbox.get_metrics()
+        self.assertEqual((metrics['pending'], metrics['failed']), (0, 1))
+        self.assertEqual(metrics['counters']['retries'], 2)
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            self.assertEqual(conn.execute('SELECT length(image) FROM uploads').fetchall(), [(0,)])
+
+    def test_existing_failed_jobs_release_their_image(self):
+        """Test that images of jobs marked failed by earlier versions are cleared on open."""
+        outbox = self._create_outbox()
+        outbox.enqueue('record-1', b'image')
+        outbox.enqueue('record-2', b'image')
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("UPDATE uploads SET status = 'failed' WHERE record_id = 'record-1'")
+
+        self._create_outbox()
+
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            sizes = conn.execute('SELECT record_id, length(image) FROM uploads ORDER BY id').fetchall()
+        self.assertEqual(sizes, [('record-1', 0), ('record-2', 5)])
+
+    def test_failed_callback_does_not_upload_again(self):
+        """Test that the stored upload result is reused when patching the record fails."""
+        outbox = self._create_outbox()
+        outbox.on_result = mock.Mock(side_effect=[Exception('database down'), None])
+        outbox.enqueue('record-1', b'image')
+
+        outbox.process_once()
+        outbox.process_once()
+
+        self.uploader.assert_called_once()
+        outbox.on_result.assert_called_with('record-1', UPLOAD_RESULT)
+        self.assertEqual(outbox.get_metrics()['pending'], 0)
+
+    def test_retry_delay_backs_off(self):
+        """Test the exponential backoff bounds."""
+        outbox = UploadOutbox(self.db_path, base_delay=2, max_delay=60)
+
+        for attempts, upper in ((1, 2), (2, 4), (3, 8), (10, 60)):
+            delay = outbox.retry_delay(attempts)
+            self.assertGreaterEqual(delay, upper / 2)
+            self.assertLessEqual(delay, upper)
+
+    def test_worker_threads(self):
+        """Test that started workers pick up new jobs."""
+        outbox = self._create_outbox()
+        outbox.start()
+        try:
+            outbox.enqueue('record-1', b'image')
+            deadline = time.time() + 5
+            while not self.results and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            outbox.stop()
+
+        self.assertEqual(self.results, [('record-1', UPLOAD_RESULT)])
+
+class TestStatsWithOutbox(unittest.TestCase):
+    """Tests for history records completed by the outbox."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.outbox = UploadOutbox(os.path.join(self.temp_dir, 'outbox.sqlite3'), uploader=mock.Mock(return_value=UPLOAD_RESULT))
+        self.stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history'),
+            upload_outbox=self.outbox
+        )
+        self.outbox.on_result = self.stats.apply_upload_result
+
+    def tearDown(self):
+        self.stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _read_record(self, record_id):
+        with open(os.path.join(self.stats.history_dir, f"{record_id}.json")) as f:
+            return json.load(f)
+
+    def test_record_is_patched_after_upload(self):
+        """Test that recording does not upload and the record gets the URLs later."""
+        with mock.patch('utils.stats_new.upload_image_to_imagebb') as upload:
+            record_id = self.stats.record_classification_with_image(
+                'gato', 87.0, b'image', renditions={'thumb': 'http://localhost/api/renditions/t.jpg'}
+            )
+            upload.assert_not_called()
+
+        record = self._read_record(record_id)
+        self.assertEqual(record['upload_status'], 'pending')
+        self.assertIsNone(record['image_url'])
+        mtime = os.path.getmtime(os.path.join(self.stats.history_dir, f"{record_id}.json"))
+
+        self.outbox.process_once()
+
+        record = self._read_record(record_id)
+        self.assertEqual(record['upload_status'], 'uploaded')
+        self.assertEqual(record['image_url'], UPLOAD_RESULT['url'])
+        self.assertEqual(record['image_thumbnail'], 'http://localhost/api/renditions/t.jpg')
+        self.assertEqual(record['image_medium'], UPLOAD_RESULT['medium']['url'])
+        # The history is ordered by modification time
+        self.assertEqual(os.path.getmtime(os.path.join(self.stats.history_dir, f"{record_id}.json")), mtime)
+
+    def test_repeat_image_reuses_background_upload(self):
+        """Test that once uploaded, the same image is not queued again."""
+        first_id = self.stats.record_classification_with_image('gato', 87.0, b'image')
+        self.outbox.process_once()
+
+        second_id = self.stats.record_classification_with_image('gato', 90.0, b'image')
+
+        self.assertEqual(self.outbox.get_metrics()['pending'], 0)
+        self.assertEqual(self._read_record(second_id)['image_url'], self._read_record(first_id)['image_url'])
+
+class TestUploadDedupe(unittest.TestCase):
+    """Tests for the hash -> uploaded URLs index of the file-based stats."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.instances = []
+
+    def tearDown(self):
+        for stats in self.instances:
+            stats.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _create_stats(self):
+        stats = ClassificationStats(
+            stats_file=os.path.join(self.temp_dir, 'stats.json'),
+            history_dir=os.path.join(self.temp_dir, 'history')
+        )
+        self.instances.append(stats)
+        return stats
+
+    def test_identical_bytes_upload_once(self):
+        """Test that repeat images reuse the URLs, also from another instance."""
+        with mock.patch('utils.stats_new.upload_image_to_imagebb', return_value=UPLOAD_RESULT) as upload:
+            self._create_stats().record_classification_with_image('gato', 87.0, b'image')
+            self._create_stats().record_classification_with_image('gato', 80.0, b'image')
+            self._create_stats().record_classification_with_image('perro', 95.0, b'other image')
+
+        self.assertEqual(upload.call_count, 2)
+
+    def test_concurrent_instances_keep_every_upload(self):
+        """Test that uploads remembered by instances sharing the index are all kept."""
+        first, second = self._create_stats(), self._create_stats()
+        for i in range(20):
+            (first if i % 2 else second).remember_upload(f"hash-{i}", UPLOAD_RESULT)
+
+        reopened = self._create_stats()
+        for i in range(20):
+            self.assertEqual(reopened.find_upload(f"hash-{i}")['url'], UPLOAD_RESULT['url'])
+            self.assertIsNotNone(first.find_upload(f"hash-{i}"))
+
+    def test_json_index_is_imported(self):
+        """Test that the upload_index.json of earlier versions is carried over."""
+        with open(os.path.join(self.temp_dir, 'upload_index.json'), 'w') as f:
+            json.dump({'abc': {'url': UPLOAD_RESULT['url']}}, f)
+
+        self.assertEqual(self._create_stats().find_upload('abc'), {'url': UPLOAD_RESULT['url']})
+        # Imported once: the log now has the entry
+        self.assertEqual(self._create_stats().find_upload('abc'), {'url': UPLOAD_RESULT['url']})
+        with open(os.path.join(self.temp_dir, 'upload_index.log')) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -80,6 +80,48 @@ class TestCache(unittest.TestCase):
         result = cache.get(self.test_image)
         self.assertIsNone(result)
 
+    def test_lookup_status_and_metrics(self):
+        """Test that lookups report their outcome and update the counters."""
+        # Miss on an empty cache
+        result, status = self.cache.lookup(self.test_image)
+        self.assertIsNone(result)
+        self.assertEqual(status, 'MISS')
+
+        # Hit after setting an entry
+        self.test_image.seek(0)
+        self.cache.set(self.test_image, 'gato', 80.0)
+        self.test_image.seek(0)
+        result, status = self.cache.lookup(self.test_image)
+        self.assertEqual(result, ('gato', 80.0))
+        self.assertEqual(status, 'HIT')
+
+        # Corrupt entry
+        image_hash = self.cache._get_image_hash(self.test_image)
+        with open(self.cache._get_cache_file_path(image_hash), 'w') as f:
+            f.write('{not json')
+        result, status = self.cache.lookup(self.test_image)
+        self.assertIsNone(result)
+        self.assertEqual(status, 'CORRUPT')
+
+        metrics = self.cache.get_metrics()
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['misses'], 1)
+        self.assertEqual(metrics['corrupt'], 1)
+        self.assertEqual(metrics['lookups'], 3)
+        self.assertEqual(metrics['writes'], 1)
+        self.assertEqual(sum(metrics['lookup_latency_ms']['histogram'].values()), 3)
+
+    def test_lookup_expired(self):
+        """Test that expired entries are reported as such."""
+        cache = ImageClassificationCache(cache_dir=self.temp_dir, expiry_hours=0)
+        cache.set(self.test_image, 'perro', 95.5)
+        self.test_image.seek(0)
+
+        result, status = cache.lookup(self.test_image)
+        self.assertIsNone(result)
+        self.assertEqual(status, 'EXPIRED')
+        self.assertEqual(cache.get_metrics()['expired'], 1)
+
 class TestStats(unittest.TestCase):
     """Tests for the ClassificationStats class."""
     
@@ -2,8 +2,18 @@ import hashlib
 import os
 import json
 import time
+import threading
 from datetime import datetime, timedelta
 
+# Lookup outcomes reported by ImageClassificationCache.lookup()
+CACHE_HIT = 'HIT'
+CACHE_MISS = 'MISS'
+CACHE_EXPIRED = 'EXPIRED'
+CACHE_CORRUPT = 'CORRUPT'
+
+# Upper bounds (in milliseconds) of the lookup latency histogram buckets
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250)
+
 class ImageClassificationCache:
     """
     Simple cache for image classification results.
@@ -20,8 +30,76 @@ class ImageClassificationCache:
         self.cache_dir = cache_dir
         self.expiry_hours = expiry_hours
         
+        # In-memory instrumentation (per process)
+        self._metrics_lock = threading.Lock()
+        self._reset_metrics()
+        
         # Create cache directory if it doesn't exist
         os.makedirs(cache_dir, exist_ok=True)
+    
+    def _reset_metrics(self):
+        """Reset the lookup counters and latency histogram."""
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'corrupt': 0,
+            'writes': 0,
+            'write_errors': 0
+        }
+        # One bucket per bound plus an overflow bucket
+        self._latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self._latency_total_ms = 0.0
+        self._metrics_since = time.time()
+    
+    def _record_lookup(self, status, elapsed_ms):
+        """Record the outcome and latency of a cache lookup."""
+        counter = {
+            CACHE_HIT: 'hits',
+            CACHE_MISS: 'misses',
+            CACHE_EXPIRED: 'expired',
+            CACHE_CORRUPT: 'corrupt'
+        }[status]
+        
+        bucket = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        
+        with self._metrics_lock:
+            self._counters[counter] += 1
+            self._latency_buckets[bucket] += 1
+            self._latency_total_ms += elapsed_ms
+    
+    def get_metrics(self):
+        """
+        Get the cache instrumentation counters.
+        
+        Returns:
+            dict: Lookup counters, hit ratio and lookup latency histogram
+        """
+        with self._metrics_lock:
+            counters = dict(self._counters)
+            buckets = list(self._latency_buckets)
+            total_ms = self._latency_total_ms
+            since = self._metrics_since
+        
+        lookups = counters['hits'] + counters['misses'] + counters['expired'] + counters['corrupt']
+        histogram = {f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, buckets)}
+        histogram['gt_' + str(LATENCY_BUCKETS_MS[-1]) + 'ms'] = buckets[-1]
+        
+        return {
+            **counters,
+            'lookups': lookups,
+            'hit_ratio': counters['hits'] / lookups if lookups else 0.0,
+            'lookup_latency_ms': {
+                'avg': total_ms / lookups if lookups else 0.0,
+                'histogram': histogram
+            },
+            'expiry_hours': self.expiry_hours,
+            'since': datetime.fromtimestamp(since).isoformat()
+        }
         
     def _get_image_hash(self, image_data):
         """
@@ -58,9 +136,27 @@ class ImageClassificationCache:
         Returns:
             tuple: (category, confidence) if cache hit, None if cache miss
         """
+        result, _ = self.lookup(image_data)
+        return result
+    
+    def lookup(self, image_data):
+        """
+        Get cached classification result for an image along with the lookup outcome.
+        
+        Args:
+            image_data: Image data as bytes or file-like object
+            
+        Returns:
+            tuple: ((category, confidence) or None, status) where status is one of
+                   CACHE_HIT, CACHE_MISS, CACHE_EXPIRED or CACHE_CORRUPT
+        """
+        start = time.perf_counter()
         image_hash = self._get_image_hash(image_data)
         cache_file = self._get_cache_file_path(image_hash)
         
+        result = None
+        status = CACHE_MISS
+        
         if os.path.exists(cache_file):
             try:
                 with open(cache_file, 'r') as f:
@@ -69,16 +165,20 @@ class ImageClassificationCache:
                 # Check if cache is expired
                 timestamp = cache_data.get('timestamp', 0)
                 if time.time() - timestamp < self.expiry_hours * 3600:
-                    return cache_data['category'], cache_data['confidence']
+                    result = (cache_data['category'], cache_data['confidence'])
+                    status = CACHE_HIT
                 else:
                     # Remove expired cache file
+                    status = CACHE_EXPIRED
                     os.remove(cache_file)
             except (json.JSONDecodeError, KeyError, OSError):
                 # If there's any error reading the cache, ignore it
+                status = CACHE_CORRUPT
                 if os.path.exists(cache_file):
                     os.remove(cache_file)
         
-        return None
+        self._record_lookup(status, (time.perf_counter() - start) * 1000)
+        return result, status
     
     def set(self, image_data, category, confidence):
         """
@@ -105,10 +205,14 @@ class ImageClassificationCache:
             with open(cache_file, 'w') as f:
                 json.dump(cache_data, f)
             
+            with self._metrics_lock:
+                self._counters['writes'] += 1
             return True
         except OSError:
             # If there's any error writing the cache, just log and continue
             print(f"Error writing to cache file {cache_file}")
+            with self._metrics_lock:
+                self._counters['write_errors'] += 1
             return False
     
     def clear_expired(self):
@@ -0,0 +1,63 @@
+"""
+Fixed-bucket histograms of classification confidence.
+
+Confidences (0-100) are counted in BUCKET_COUNT buckets of BUCKET_WIDTH
+points, stored as {"<bucket index>": count}. A histogram never holds more
+than BUCKET_COUNT keys however many classifications it counts, two
+histograms merge by adding counts, and in MongoDB a classification is
+added with a single $inc on "<path>.<bucket index>". Percentiles are
+interpolated within a bucket, so they are accurate to BUCKET_WIDTH points.
+"""
+
+BUCKET_WIDTH = 1
+BUCKET_COUNT = 100 // BUCKET_WIDTH
+
+# Percentiles reported by /api/stats
+PERCENTILES = (10, 50, 90)
+
+def bucket_key(confidence):
+    """
+    Get the histogram key of a confidence.
+
+    Args:
+        confidence: Confidence percentage (clamped to 0-100)
+
+    Returns:
+        str: The bucket index as a string (a valid JSON / MongoDB field name)
+    """
+    index = int(min(max(confidence, 0), 100) // BUCKET_WIDTH)
+    return str(min(index, BUCKET_COUNT - 1))
+
+def add(histogram, confidence):
+    """Count a confidence in a histogram (modified in place)."""
+    key = bucket_key(confidence)
+    histogram[key] = histogram.get(key, 0) + 1
+
+def percentiles(histogram, points=PERCENTILES):
+    """
+    Estimate percentiles of the counted confidences.
+
+    Args:
+        histogram: Dict of bucket index -> count
+        points: Percentiles to estimate (0-100)
+
+    Returns:
+        dict: {'p10': value, ...} rounded to 0.1, or None if the histogram is empty
+    """
+    buckets = sorted((int(key), count) for key, count in (histogram or {}).items() if count > 0)
+    total = sum(count for _, count in buckets)
+    if not total:
+        return None
+
+    result = {}
+    for point in points:
+        rank = total * point / 100
+        seen = 0
+        for index, count in buckets:
+            if seen + count >= rank:
+                # Assume values are spread evenly within the bucket
+                value = (index + (rank - seen) / count) * BUCKET_WIDTH
+                break
+            seen += count
+        result[f"p{point}"] = round(min(value, 100), 1)
+    return result
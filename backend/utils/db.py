@@ -2,12 +2,19 @@
 MongoDB database utilities for the Image Classifier API.
 """
 import os
-from pymongo import MongoClient
+from datetime import datetime
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import OperationFailure
 from config import Config
 
 # MongoDB connection singleton
 _client = None
 
+# Single-field history indexes created by earlier versions. Each one is a
+# prefix of a compound index of create_indexes, which serves the same
+# queries, so they only cost writes and memory.
+_REDUNDANT_HISTORY_INDEXES = ('timestamp_-1', 'category_1')
+
 def get_mongo_client():
     """
     Get MongoDB client instance (singleton pattern).
@@ -73,15 +80,13 @@ def init_db():
     """
     db = get_database()
     
-    # Create indexes if they don't exist
     if 'classifications' not in db.list_collection_names():
         db.create_collection('classifications')
-        db.classifications.create_index([("timestamp", -1)])
-        db.classifications.create_index([("category", 1)])
     
     if 'daily_stats' not in db.list_collection_names():
         db.create_collection('daily_stats')
-        db.daily_stats.create_index([("date", -1)])
+    
+    create_indexes(db)
     
     if 'statistics' not in db.list_collection_names():
         db.create_collection('statistics')
@@ -94,4 +99,170 @@ def init_db():
                 "categories": {}
             })
     
+    migrate_confidence_sums(db)
+    check_history_timestamps(db)
+    
+    # Counts kept by increments since the upgrade miss the older records until recounted
+    counted = (db.statistics.find_one({"_id": "history_counts"}, {"total": 1}) or {}).get("total", 0)
+    stored = db.classifications.estimated_document_count()
+    if counted < stored:
+        print(f"WARNING: history counts ({counted}) are behind the history ({stored} records); "
+              f"run 'python migrate_history.py' to recount them")
+    
     print("Database initialized successfully")
+
+def create_indexes(db):
+    """
+    Create the indexes used by the stats and history queries (no-op if they exist).
+    
+    Args:
+        db: MongoDB database
+    """
+    # History pages, newest first, keyset-paginated on (timestamp, _id):
+    # unfiltered, and filtered by category
+    db.classifications.create_index([("timestamp", -1), ("_id", -1)])
+    db.classifications.create_index([("category", 1), ("timestamp", -1), ("_id", -1)])
+    for name in _REDUNDANT_HISTORY_INDEXES:
+        if name in db.classifications.index_information():
+            try:
+                db.classifications.drop_index(name)
+            except OperationFailure:
+                pass  # Dropped meanwhile by another worker
+    
+    db.daily_stats.create_index([("date", -1)])
+    
+    # Rollups are queried by date range, optionally for one category
+    db.classification_rollups.create_index([("date", 1), ("category", 1)])
+    
+    # Minute and hour buckets: range queries, and expiry once out of retention
+    db.stats_timeseries.create_index([("resolution", 1), ("start", 1)])
+    db.stats_timeseries.create_index([("expires_at", 1)], expireAfterSeconds=0)
+
+def check_history_timestamps(db):
+    """
+    Refuse to run on a history whose timestamps were not converted to dates.
+    
+    History pages, date ranges and retention compare timestamps with BSON
+    dates, which never match ISO strings: records stored by earlier versions
+    would silently be missing from the history after its first page.
+    
+    Args:
+        db: MongoDB database
+        
+    Raises:
+        RuntimeError: If a history record still has a string timestamp
+    """
+    legacy = db.classifications.find_one({"timestamp": {"$type": "string"}}, {"_id": 1})
+    if legacy is not None:
+        raise RuntimeError(
+            f"History record {legacy['_id']} has a text timestamp from an earlier version; "
+            f"run 'python migrate_history.py' before starting the server"
+        )
+
+def migrate_timestamps_to_dates(db, batch_size=1000):
+    """
+    Convert history timestamps stored as ISO strings to BSON dates.
+    
+    Documents are converted in batches of batch_size, in _id order, each
+    update only matching while the document still has the same string, so
+    it can run while the server is writing and be interrupted and resumed.
+    Timestamps are local times, stored as naive datetimes like new records.
+    
+    Run by the migration scripts (see migrate_history.py), not at
+    startup: on a large history it takes a while.
+    
+    Args:
+        db: MongoDB database
+        batch_size: Documents read and updated per round trip
+        
+    Returns:
+        int: Number of documents converted
+    """
+    converted = 0
+    last_id = None
+    while True:
+        query = {"timestamp": {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.classifications.find(query, {"timestamp": 1}).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        
+        operations = []
+        for doc in batch:
+            try:
+                timestamp = datetime.fromisoformat(doc["timestamp"])
+                if timestamp.tzinfo:
+                    timestamp = timestamp.astimezone().replace(tzinfo=None)
+            except ValueError:
+                print(f"Skipping history record {doc['_id']} with invalid timestamp: {doc['timestamp']}")
+                continue
+            operations.append(UpdateOne(
+                {"_id": doc["_id"], "timestamp": doc["timestamp"]},
+                {"$set": {"timestamp": timestamp}}
+            ))
+        if operations:
+            converted += db.classifications.bulk_write(operations, ordered=False).modified_count
+    
+    if converted:
+        print(f"Converted {converted} history timestamps to dates")
+    return converted
+
+def migrate_confidence_sums(db):
+    """
+    Replace the running avg_confidence of the global category stats by a
+    confidence_sum (avg * count), which classifications update with $inc.
+    
+    Each category is converted by a single update that only matches it
+    while it has no confidence_sum, so running this again (or from several
+    workers at once) changes nothing.
+    
+    Args:
+        db: MongoDB database
+        
+    Returns:
+        int: Number of categories converted
+    """
+    global_stats = db.statistics.find_one({"_id": "global"}, {"categories": 1}) or {}
+    converted = 0
+    for category, data in global_stats.get("categories", {}).items():
+        if "confidence_sum" in data:
+            continue
+        path = f"categories.{category}"
+        result = db.statistics.update_one(
+            {"_id": "global", f"{path}.confidence_sum": {"$exists": False}},
+            [
+                # Computed on the server from the stored values
+                {"$set": {f"{path}.confidence_sum": {"$multiply": [
+                    {"$ifNull": [f"${path}.avg_confidence", 0]},
+                    {"$ifNull": [f"${path}.count", 0]}
+                ]}}},
+                {"$unset": f"{path}.avg_confidence"}
+            ]
+        )
+        converted += result.modified_count
+    return converted
+
+
+def migrate_history_counts(db):
+    """
+    Recount the history into the history_counts document, which new
+    records then keep up to date with buffered increments.
+    
+    Replaces the counts with an aggregation over the collection: run it
+    from the migration scripts, while no server is writing the history,
+    or records inserted during the aggregation may be counted twice.
+    
+    Args:
+        db: MongoDB database
+        
+    Returns:
+        int: Total number of history records
+    """
+    counts = {"_id": "history_counts", "total": 0, "categories": {}}
+    for group in db.classifications.aggregate([{"$group": {"_id": "$category", "count": {"$sum": 1}}}]):
+        counts["categories"][group["_id"]] = group["count"]
+        counts["total"] += group["count"]
+    db.statistics.replace_one({"_id": "history_counts"}, counts, upsert=True)
+    return counts["total"]
@@ -0,0 +1,167 @@
+"""
+Append-only JSON-lines event log with snapshot support.
+
+The first line of the log is a header with a random log_id. A snapshot of
+the aggregates records the (log_id, offset) position it covers, so on
+startup only the events after that position are replayed:
+
+- same log_id: replay the events after the snapshot's offset
+- other log_id: the log was started after the snapshot was written
+  (compaction rotates the log only once the snapshot is safely on disk),
+  so replay the whole log
+
+The log can be shared by several processes: writers append and rotate
+while holding locked(), an exclusive lock on a `.lock` file next to the
+log, and keep no file open between calls, so a rotation by one process is
+seen by the others on their next read.
+
+A line cut short by a crash is dropped when the log is opened.
+"""
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+class EventLog:
+    """
+    Append-only log of JSON events.
+    """
+
+    def __init__(self, path):
+        """
+        Open the log, creating it if needed.
+
+        Args:
+            path: Path of the log file
+        """
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        # Re-entrant within a process; the file lock is taken by the outermost holder
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+
+        with self.locked():
+            if self.read_log_id() is None:
+                self._start_new_log()
+            else:
+                self._truncate_torn_tail()
+
+    @contextmanager
+    def locked(self):
+        """Hold the log's exclusive lock, across threads and processes."""
+        with self._thread_lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1 and fcntl is not None:
+                    # Closing the lock file releases the lock
+                    with open(self.lock_path, 'a') as lock_file:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                        yield
+                else:
+                    yield
+            finally:
+                self._lock_depth -= 1
+
+    def read_log_id(self):
+        """Read the log_id from the header line, or None if the log has no valid header."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.loads(f.readline()).get('log_id')
+        except (OSError, json.JSONDecodeError, AttributeError):
+            return None
+
+    def _start_new_log(self):
+        """Atomically replace the log with an empty one under a new log_id."""
+        log_id = uuid.uuid4().hex
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'log_id': log_id}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def _truncate_torn_tail(self):
+        """Drop a last line left incomplete by a crash, so new events start on a fresh line."""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def position(self):
+        """
+        Get the current end of the log.
+
+        Returns:
+            tuple: (log_id, byte offset)
+        """
+        return self.read_log_id(), os.path.getsize(self.path)
+
+    def append(self, events):
+        """
+        Append events with a single write. Call while holding locked().
+
+        Args:
+            events: List of JSON-serializable dicts
+
+        Returns:
+            tuple: (log_id, byte offset) of the new end of the log
+        """
+        data = ''.join(json.dumps(event, separators=(',', ':')) + '\n' for event in events)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(data)
+        return self.position()
+
+    def read_since(self, log_id=None, offset=0):
+        """
+        Read the events after a position.
+
+        Args:
+            log_id: log_id recorded in the snapshot or by the last read (None if there is none)
+            offset: Byte offset recorded with it
+
+        Returns:
+            tuple: (list of events in order, (log_id, byte offset) read up to)
+        """
+        events = []
+        with open(self.path, 'rb') as f:
+            header = f.readline()
+            try:
+                current_id = json.loads(header).get('log_id')
+            except (json.JSONDecodeError, AttributeError):
+                current_id = None
+            end = len(header)
+            if log_id == current_id and offset > end:
+                f.seek(offset)
+                end = offset
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn line, dropped the next time the log is opened
+                    break
+                end += len(line)
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    print(f"Skipping corrupt line in event log {self.path}")
+        return events, (current_id, end)
+
+    def rotate(self):
+        """
+        Start a new, empty log. Call while holding locked(), only after a
+        snapshot covering every event in the current log has been written.
+
+        Returns:
+            tuple: (log_id, byte offset) of the end of the new log
+        """
+        self._start_new_log()
+        return self.position()
+
+    def size(self):
+        """Get the log size in bytes."""
+        return os.path.getsize(self.path)
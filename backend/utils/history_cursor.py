@@ -0,0 +1,63 @@
+"""
+Opaque cursors for keyset pagination of the classification history.
+
+The history is ordered newest first by (timestamp, id). A cursor encodes
+the key of the last entry of a page, and the next page holds the entries
+strictly before it, so every page costs the same no matter how deep it
+is, and records added meanwhile don't shift the following pages.
+"""
+import json
+import base64
+import binascii
+
+def encode_cursor(timestamp, record_id):
+    """
+    Build the cursor of the page after an entry.
+
+    Args:
+        timestamp: Timestamp of the last entry of the page (ISO format)
+        record_id: ID of the last entry of the page
+
+    Returns:
+        str: URL-safe opaque cursor
+    """
+    data = json.dumps([timestamp, record_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """
+    Get the (timestamp, id) key encoded in a cursor.
+
+    Args:
+        cursor: Cursor returned by encode_cursor
+
+    Returns:
+        tuple: (timestamp, record_id)
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        timestamp, record_id = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid history cursor")
+    if not isinstance(timestamp, str) or not isinstance(record_id, str):
+        raise ValueError("Invalid history cursor")
+    return timestamp, record_id
+
+def next_cursor(history, limit):
+    """
+    Get the cursor of the page after a history page.
+
+    Args:
+        history: The page entries (with 'timestamp' and 'id')
+        limit: Page size requested
+
+    Returns:
+        str: The cursor, or None if this was the last page
+    """
+    if len(history) < limit or not history:
+        return None
+    last = history[-1]
+    return encode_cursor(last['timestamp'], last['id'])
@@ -0,0 +1,152 @@
+"""
+Index of the file-based classification history.
+
+Every history record is listed once, in append order, in an event log
+(history_index.log in the history directory) as {"id", "timestamp",
+"category"}. In memory the entries are kept sorted by (timestamp, id),
+plus one sorted list per category, so a page of the history only reads
+the records on that page instead of stat-ing every file in the directory.
+
+Several processes can share the index: each one appends under the log's
+lock and picks up the others' entries before answering a query.
+"""
+import os
+import json
+import bisect
+import threading
+from datetime import datetime
+
+from utils.event_log import EventLog
+
+class HistoryIndex:
+    """
+    Timestamp-ordered index of history records with a per-category secondary index.
+    """
+
+    def __init__(self, history_dir, log_file=None):
+        """
+        Open the index, building it from the history directory if needed.
+
+        Args:
+            history_dir: Directory holding the <id>.json history records
+            log_file: Index log path (defaults to history_index.log in history_dir)
+        """
+        self.history_dir = history_dir
+        self.log = EventLog(log_file or os.path.join(history_dir, 'history_index.log'))
+        self._lock = threading.Lock()
+        self._entries = []
+        self._by_category = {}
+        self._ids = set()
+        self._position = (None, 0)
+
+        with self._lock, self.log.locked():
+            self._refresh()
+            if not self._entries:
+                self._backfill()
+
+    def _backfill(self):
+        """Index the records written before the index existed. Caller holds both locks."""
+        entries = []
+        for name in os.listdir(self.history_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.history_dir, name)
+            try:
+                with open(path, 'r') as f:
+                    metadata = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                print(f"Skipping unreadable history file {name}")
+                continue
+            entry = self._entry(metadata)
+            if not entry['timestamp']:
+                # Legacy records were ordered by modification time
+                entry['timestamp'] = datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+            entries.append(entry)
+
+        if entries:
+            entries.sort(key=lambda entry: (entry['timestamp'], entry['id']))
+            self._position = self.log.append(entries)
+            for entry in entries:
+                self._insert(entry)
+            print(f"Indexed {len(entries)} history records")
+
+    @staticmethod
+    def _entry(metadata):
+        """Get the index entry of a history record."""
+        return {
+            'id': metadata['id'],
+            'timestamp': metadata.get('timestamp') or '',
+            'category': metadata.get('category') or ''
+        }
+
+    def _insert(self, entry):
+        """Add an entry to the in-memory indexes, keeping them sorted."""
+        if entry['id'] in self._ids:
+            return
+        self._ids.add(entry['id'])
+        key = (entry['timestamp'], entry['id'])
+        bisect.insort(self._entries, key)
+        bisect.insort(self._by_category.setdefault(entry['category'].lower(), []), key)
+
+    def _refresh(self):
+        """
+        Load the entries other processes appended since the last read.
+        Caller holds the thread lock; appends are whole lines, so reading
+        needs no file lock.
+        """
+        if self.log.read_log_id() != self._position[0]:
+            self._entries, self._by_category, self._ids = [], {}, set()
+            self._position = (None, 0)
+        entries, self._position = self.log.read_since(*self._position)
+        for entry in entries:
+            self._insert(entry)
+
+    def add(self, metadata):
+        """
+        Index a new history record.
+
+        Args:
+            metadata: The record (with 'id', 'timestamp' and 'category')
+        """
+        entry = self._entry(metadata)
+        with self._lock, self.log.locked():
+            self._refresh()
+            self._position = self.log.append([entry])
+            self._insert(entry)
+
+    def page(self, limit=50, offset=0, category=None, before=None):
+        """
+        Get a page of records, newest first.
+
+        Args:
+            limit: Maximum number of records to return
+            offset: Number of newer records to skip
+            category: Only records of this category (case-insensitive) if provided
+            before: Only records older than this (timestamp, id) key, from a cursor
+
+        Returns:
+            list: (timestamp, id) keys of the records
+        """
+        with self._lock:
+            self._refresh()
+            keys = self._by_category.get(category.lower(), []) if category else self._entries
+            end = bisect.bisect_left(keys, tuple(before)) if before else len(keys)
+            end = max(end - offset, 0)
+            start = max(end - limit, 0)
+            return keys[start:end][::-1]
+
+    def count(self, category=None):
+        """
+        Count the indexed records.
+
+        Args:
+            category: Only records of this category (case-insensitive) if provided
+
+        Returns:
+            int: Number of records
+        """
+        with self._lock:
+            self._refresh()
+            if category:
+                return len(self._by_category.get(category.lower(), []))
+            return len(self._entries)
@@ -1,6 +1,156 @@
-from PIL import Image, ImageOps
+import os
+import threading
+from contextlib import contextmanager
+from PIL import Image, ImageOps, PngImagePlugin
 from io import BytesIO
 
+# Image formats accepted for uploads. Pillow is only allowed to try these
+# decoders, so uploads are never handed to any other plugin.
+ACCEPTED_FORMATS = ('JPEG', 'PNG')
+
+# Modes that can be resized directly, so downscaling can happen before the
+# conversion to RGB instead of converting every pixel at native resolution.
+# Modes with alpha are left out: resizing them premultiplies the alpha channel,
+# which costs more than converting to RGB first.
+_RESIZABLE_MODES = ('RGB', 'L', 'CMYK')
+
+# Upload limits enforced by validate_image
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+MAX_IMAGE_PIXELS = 50_000_000
+
+# Largest estimated decode buffer allowed for a single image (see estimate_decode_bytes)
+MAX_DECODE_BYTES = 256 * 1024 * 1024
+
+# Total text decoded from PNG tEXt/zTXt/iTXt chunks (Pillow's default is 64 MB)
+MAX_PNG_TEXT_MEMORY = 1024 * 1024
+
+# Outbound encoder profiles: Pillow format, MIME type and save() parameters.
+# 'jpeg' is the original setting; optimize=True makes it one of the slowest
+# JPEG encodes, 'jpeg-fast' skips the extra Huffman pass. The WebP method and
+# AVIF speed are the fastest settings (see benchmarks/bench_encoders.py):
+# slower ones cost several times the encode time for a few percent of bytes.
+ENCODER_PROFILES = {
+    'jpeg': {
+        'format': 'JPEG',
+        'mime_type': 'image/jpeg',
+        'params': {'quality': 85, 'optimize': True}
+    },
+    'jpeg-fast': {
+        'format': 'JPEG',
+        'mime_type': 'image/jpeg',
+        'params': {'quality': 85, 'subsampling': '4:2:0', 'optimize': False}
+    },
+    'webp': {
+        'format': 'WEBP',
+        'mime_type': 'image/webp',
+        'params': {'quality': 80, 'method': 0}
+    },
+    'avif': {
+        'format': 'AVIF',
+        'mime_type': 'image/avif',
+        'params': {'quality': 60, 'speed': 10}
+    }
+}
+DEFAULT_ENCODER_PROFILE = 'jpeg'
+
+# Largest upload (in bytes) forwarded untouched by the pass-through path
+PASSTHROUGH_MAX_BYTES = 1024 * 1024
+
+# Display renditions stored for the history (name -> bounding box)
+RENDITION_SIZES = {
+    'medium': (640, 640),
+    'thumb': (180, 180)
+}
+
+# JPEG markers
+_JPEG_SOI = 0xD8
+_JPEG_SOS = 0xDA
+_JPEG_SOF0 = 0xC0  # Baseline DCT
+_JPEG_APP1 = 0xE1  # EXIF and XMP metadata
+_JPEG_SOF_MARKERS = (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF)
+_EXIF_ORIENTATION = 0x0112
+# Transposition that displays an image upright for each EXIF orientation
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90
+}
+_JPEG_MAGIC = b'\xff\xd8\xff'
+
+# Errors Pillow raises for files it cannot decode (reported as ValueError)
+_INVALID_IMAGE_ERRORS = (OSError, SyntaxError, Image.DecompressionBombError)
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Channels of each PNG color type once decoded (palette images decode to RGB(A))
+_PNG_BANDS = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}
+
+# Share of optimize_image calls taking each path (per process)
+_path_counters_lock = threading.Lock()
+_path_counters = {'passthrough': 0, 'reencoded': 0}
+
+def configure_decoder_limits(max_pixels=MAX_IMAGE_PIXELS, max_text_memory=MAX_PNG_TEXT_MEMORY):
+    """
+    Set Pillow's process-wide decode limits.
+    
+    Called once at application setup and in each preprocessing worker, so
+    the limits follow the configuration instead of this module's defaults.
+    
+    Args:
+        max_pixels: Pillow's decompression bomb threshold (it raises at twice this value)
+        max_text_memory: Total text decoded from PNG tEXt/zTXt/iTXt chunks
+    """
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    PngImagePlugin.MAX_TEXT_MEMORY = max_text_memory
+
+def open_image(image_bytes):
+    """
+    Open an image restricting Pillow to the accepted formats.
+    
+    Args:
+        image_bytes: The image data as bytes
+        
+    Returns:
+        PIL.Image: The lazily-decoded image
+    """
+    return Image.open(BytesIO(image_bytes), formats=ACCEPTED_FORMATS)
+
+def decode_image(image_bytes, max_size=(1024, 1024)):
+    """
+    Decode an image to RGB at (or just above) the requested size.
+    
+    JPEGs are decoded by libjpeg directly at the smallest 1/2, 1/4 or 1/8
+    scale that still covers max_size, and other images are reduced before
+    being converted to RGB.
+    
+    Args:
+        image_bytes: The image data as bytes
+        max_size: Maximum size (width, height) the image will be shrunk to
+        
+    Returns:
+        PIL.Image: The decoded RGB image, no larger than max_size
+    """
+    img = open_image(image_bytes)
+    
+    if img.format == 'JPEG':
+        # Only takes effect before the image is loaded
+        img.draft('RGB', max_size)
+    
+    if img.mode in _RESIZABLE_MODES and (img.width > max_size[0] or img.height > max_size[1]):
+        img.thumbnail(max_size, Image.LANCZOS)
+    
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # Modes like 'P' can only be resized after the conversion
+    if img.width > max_size[0] or img.height > max_size[1]:
+        img.thumbnail(max_size, Image.LANCZOS)
+    
+    return img
+
 def resize_image(image_data, target_size=(224, 224)):
     """
     Resize an image to the target size.
@@ -25,29 +175,347 @@ def resize_image(image_data, target_size=(224, 224)):
     image = image.resize(target_size, Image.LANCZOS)  # LANCZOS is the replacement for ANTIALIAS
     return image
 
-def optimize_image(image_data, max_size=(1024, 1024), quality=85):
+def is_encoder_available(encoder):
     """
-    Optimizes an image for processing.
+    Check whether an encoder profile is known and supported by this Pillow build.
     
     Args:
-        image_data: The image data as bytes or a file-like object
-        max_size: Maximum size (width, height) to resize to
-        quality: JPEG compression quality (1-100)
+        encoder: Name of a profile in ENCODER_PROFILES
         
     Returns:
-        BytesIO: File-like object with the optimized image
+        bool: True if images can be saved with the profile
     """
-    try:
-        # Handle file-like objects
-        if hasattr(image_data, 'read'):
-            image_bytes = image_data.read()
-            if hasattr(image_data, 'seek'):
-                image_data.seek(0)  # Reset file pointer
+    if encoder not in ENCODER_PROFILES:
+        return False
+    # Plugins only register a save handler when their codec library is present
+    Image.init()
+    return ENCODER_PROFILES[encoder]['format'] in Image.SAVE
+
+def resolve_encoder_profile(encoder):
+    """
+    Get the name of the profile to use, falling back to the default one.
+    
+    Args:
+        encoder: Requested profile name
+        
+    Returns:
+        str: The requested profile if available, otherwise DEFAULT_ENCODER_PROFILE
+    """
+    if is_encoder_available(encoder):
+        return encoder
+    print(f"Image encoder profile '{encoder}' is not available, using '{DEFAULT_ENCODER_PROFILE}'")
+    return DEFAULT_ENCODER_PROFILE
+
+def encode_image(img, encoder=DEFAULT_ENCODER_PROFILE, quality=None):
+    """
+    Encode an image with an encoder profile.
+    
+    Args:
+        img: The PIL image (RGB)
+        encoder: Name of a profile in ENCODER_PROFILES
+        quality: Optional quality overriding the profile's
+        
+    Returns:
+        tuple: (encoded bytes, MIME type)
+    """
+    profile = ENCODER_PROFILES[encoder]
+    params = dict(profile['params'])
+    if quality is not None:
+        params['quality'] = quality
+    
+    output = BytesIO()
+    img.save(output, format=profile['format'], **params)
+    return output.getvalue(), profile['mime_type']
+
+def create_renditions(img, sizes=RENDITION_SIZES, encoder=DEFAULT_ENCODER_PROFILE, orientation=1):
+    """
+    Encode downscaled copies of an already-decoded image for display.
+    
+    Args:
+        img: Decoded RGB image (left untouched)
+        sizes: Mapping of rendition name to maximum size (width, height)
+        encoder: Name of the encoder profile (see ENCODER_PROFILES)
+        orientation: EXIF orientation of the original upload
+        
+    Returns:
+        dict: Rendition name -> (encoded bytes, MIME type)
+    """
+    transpose = _ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        img = img.transpose(transpose)
+    
+    renditions = {}
+    # Largest first, so each rendition is resized from the previous one
+    for name, size in sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1], reverse=True):
+        if img.width > size[0] or img.height > size[1]:
+            img = img.copy()
+            img.thumbnail(size, Image.LANCZOS)
+        renditions[name] = encode_image(img, encoder)
+    return renditions
+
+def create_renditions_from_bytes(image_bytes, sizes=RENDITION_SIZES, encoder=DEFAULT_ENCODER_PROFILE):
+    """
+    Decode an image at reduced scale and encode its display renditions.
+    
+    Args:
+        image_bytes: The image data as bytes
+        sizes, encoder: See create_renditions
+        
+    Returns:
+        dict: Rendition name -> (encoded bytes, MIME type)
+    """
+    largest = max(sizes.values(), key=lambda size: size[0] * size[1])
+    orientation = open_image(image_bytes).getexif().get(_EXIF_ORIENTATION, 1)
+    return create_renditions(decode_image(image_bytes, largest), sizes, encoder, orientation)
+
+def iter_jpeg_segments(jpeg_bytes):
+    """
+    Iterate over the header segments of a JPEG, up to the start of scan.
+    
+    Args:
+        jpeg_bytes: The JPEG data as bytes
+        
+    Yields:
+        tuple: (marker, start, end) offsets of each segment, including the
+               0xFF marker prefix. The last segment yielded is the SOS one,
+               whose end is the end of the data.
+    """
+    if len(jpeg_bytes) < 4 or jpeg_bytes[0] != 0xFF or jpeg_bytes[1] != _JPEG_SOI:
+        raise ValueError("Not a JPEG image")
+    
+    pos = 2
+    while pos + 4 <= len(jpeg_bytes):
+        if jpeg_bytes[pos] != 0xFF:
+            raise ValueError("Invalid JPEG marker")
+        marker = jpeg_bytes[pos + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            pos += 1
+            continue
+        if marker == _JPEG_SOS:
+            yield marker, pos, len(jpeg_bytes)
+            return
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            # Standalone markers without a length field
+            yield marker, pos, pos + 2
+            pos += 2
+            continue
+        end = pos + 2 + int.from_bytes(jpeg_bytes[pos + 2:pos + 4], 'big')
+        if end > len(jpeg_bytes):
+            break
+        yield marker, pos, end
+        pos = end
+    
+    raise ValueError("Truncated JPEG header")
+
+def strip_jpeg_metadata(jpeg_bytes):
+    """
+    Remove the APP1 (EXIF/XMP) segments of a JPEG without re-encoding it.
+    
+    Args:
+        jpeg_bytes: The JPEG data as bytes
+        
+    Returns:
+        bytes: The JPEG without metadata (the original object if there was none)
+    """
+    kept = [jpeg_bytes[:2]]
+    stripped = False
+    for marker, start, end in iter_jpeg_segments(jpeg_bytes):
+        if marker == _JPEG_APP1:
+            stripped = True
         else:
-            image_bytes = image_data
+            kept.append(jpeg_bytes[start:end])
+    
+    return b''.join(kept) if stripped else jpeg_bytes
+
+def is_passthrough_compliant(img, image_bytes, max_size=(1024, 1024), max_bytes=PASSTHROUGH_MAX_BYTES):
+    """
+    Check from header metadata alone whether an upload can be forwarded untouched.
+    
+    Compliant uploads are baseline RGB JPEGs within max_size and max_bytes
+    whose EXIF orientation (if any) does not require a rotation, since the
+    EXIF block is stripped on the way out.
+    
+    Args:
+        img: The lazily-opened image (pixels are not decoded)
+        image_bytes: The image data as bytes
+        max_size: Maximum size (width, height) allowed
+        max_bytes: Maximum encoded size allowed
+        
+    Returns:
+        bool: True if the upload can be forwarded as-is
+    """
+    if img.format != 'JPEG' or img.mode != 'RGB' or len(image_bytes) > max_bytes:
+        return False
+    if img.width > max_size[0] or img.height > max_size[1]:
+        return False
+    if img.getexif().get(_EXIF_ORIENTATION, 1) != 1:
+        return False
+    
+    try:
+        sof_markers = [marker for marker, _, _ in iter_jpeg_segments(image_bytes) if marker in _JPEG_SOF_MARKERS]
+    except ValueError:
+        return False
+    return sof_markers == [_JPEG_SOF0]
+
+def _count_path(path):
+    """Count an optimize_image call under the given path."""
+    with _path_counters_lock:
+        _path_counters[path] += 1
+
+def get_preprocessing_metrics():
+    """
+    Get the share of optimize_image calls that took the pass-through path.
+    
+    Returns:
+        dict: Counters per path and the pass-through share
+    """
+    with _path_counters_lock:
+        counters = dict(_path_counters)
+    
+    total = counters['passthrough'] + counters['reencoded']
+    return {
+        **counters,
+        'total': total,
+        'passthrough_share': counters['passthrough'] / total if total else 0.0
+    }
+
+def estimate_decode_bytes(header, max_size=None):
+    """
+    Estimate the memory needed to decode an image, from its header alone.
+    
+    Args:
+        header: Image header as returned by read_image_header
+        max_size: Target size when decoding with decode_image, which lets
+                  baseline JPEGs be decoded at a reduced scale
+        
+    Returns:
+        int: Estimated peak bytes of pixel (and coefficient) buffers
+    """
+    width, height = header['width'], header['height']
+    # Images are converted to RGB, so at least 3 bytes per pixel
+    bands = max(header['bands'], 3)
+    
+    if header['format'] == 'JPEG' and header['progressive']:
+        # libjpeg buffers every DCT coefficient (2 bytes per sample) of a
+        # progressive JPEG at full resolution, whatever the output scale
+        return width * height * header['bands'] * 2 + width * height * bands
+    
+    if header['format'] == 'JPEG' and max_size:
+        # Same scale selection as Image.draft()
+        ratio = min(width // max_size[0], height // max_size[1])
+        scale = next((s for s in (8, 4, 2) if ratio >= s), 1)
+        return -(-width // scale) * -(-height // scale) * bands
+    
+    return width * height * bands
+
+def check_decode_limits(header, max_pixels=MAX_IMAGE_PIXELS, max_decode_bytes=MAX_DECODE_BYTES, max_size=None):
+    """
+    Reject images whose dimensions make decoding them too expensive.
+    
+    Args:
+        header: Image header as returned by read_image_header
+        max_pixels: Maximum allowed width * height
+        max_decode_bytes: Maximum estimated decode memory
+        max_size: Target decode size (see estimate_decode_bytes)
         
+    Returns:
+        int: The estimated decode memory, otherwise raises ValueError
+    """
+    if header['width'] * header['height'] > max_pixels:
+        raise ValueError(
+            f"Image dimensions {header['width']}x{header['height']} exceed the maximum of {max_pixels} pixels."
+        )
+    
+    decode_bytes = estimate_decode_bytes(header, max_size)
+    if decode_bytes > max_decode_bytes:
+        raise ValueError(
+            f"Decoding this image would need about {decode_bytes // (1024 * 1024)}MB, "
+            f"more than the {max_decode_bytes // (1024 * 1024)}MB allowed."
+        )
+    return decode_bytes
+
+class DecodeMemoryBudget:
+    """
+    Bounds the memory used by images being decoded concurrently in one process.
+    
+    Each decode reserves its estimated size and waits while the budget is
+    exhausted, so a burst of large uploads queues up instead of pushing the
+    worker into OOM.
+    """
+    
+    def __init__(self, limit_bytes, timeout=30):
+        """
+        Initialize the budget.
+        
+        Args:
+            limit_bytes: Total bytes that can be reserved at once
+            timeout: Seconds to wait for a reservation before giving up
+        """
+        self.limit_bytes = limit_bytes
+        self.timeout = timeout
+        self.in_use = 0
+        self._condition = threading.Condition()
+    
+    @contextmanager
+    def reserve(self, nbytes):
+        """
+        Reserve memory for the duration of a with-block.
+        
+        Args:
+            nbytes: Bytes to reserve
+            
+        Raises:
+            ValueError: If nbytes can never fit in the budget
+            MemoryError: If the reservation timed out
+        """
+        if nbytes > self.limit_bytes:
+            raise ValueError("Decoding this image would exceed the server's memory budget.")
+        
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.in_use + nbytes <= self.limit_bytes, self.timeout):
+                raise MemoryError("Timed out waiting for image decode memory")
+            self.in_use += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_use -= nbytes
+                self._condition.notify_all()
+
+def optimize_image_bytes(image_bytes, max_size=(1024, 1024), quality=None, fast_decode=True,
+                         passthrough=True, max_bytes=PASSTHROUGH_MAX_BYTES, encoder=DEFAULT_ENCODER_PROFILE,
+                         max_pixels=MAX_IMAGE_PIXELS, max_decode_bytes=MAX_DECODE_BYTES, renditions=None):
+    """
+    Optimize an image, taking and returning plain bytes.
+    
+    This is the CPU-bound part of optimize_image. It has no side effects, so it
+    can run in a worker process (see utils.preprocessing_pool).
+    
+    Args:
+        image_bytes: The image data as bytes
+        renditions: Optional rendition sizes (see create_renditions) to encode
+                    from the decoded image, capped at max_size
+        See optimize_image for the other arguments
+        
+    Returns:
+        tuple: (optimized image bytes, path, MIME type, renditions) where path
+               is 'passthrough' or 'reencoded' and renditions maps each
+               requested name to (bytes, MIME type)
+    """
+    # Refuse decompression bombs from the header, before allocating anything
+    header = read_image_header(BytesIO(image_bytes))
+    check_decode_limits(header, max_pixels, max_decode_bytes, max_size if fast_decode else None)
+    
+    if passthrough and is_passthrough_compliant(open_image(image_bytes), image_bytes, max_size, max_bytes):
+        rendered = create_renditions_from_bytes(image_bytes, renditions, encoder) if renditions else {}
+        return strip_jpeg_metadata(image_bytes), 'passthrough', 'image/jpeg', rendered
+    
+    if fast_decode:
+        img = decode_image(image_bytes, max_size)
+    else:
         # Open the image
-        img = Image.open(BytesIO(image_bytes))
+        img = open_image(image_bytes)
         
         # Convert to RGB if needed (e.g., if RGBA or indexed modes)
         if img.mode != 'RGB':
@@ -56,53 +524,232 @@ def optimize_image(image_data, max_size=(1024, 1024), quality=85):
         # Resize if necessary
         if img.width > max_size[0] or img.height > max_size[1]:
             img.thumbnail(max_size, Image.LANCZOS)
+    
+    # Display renditions reuse the decoded image, before any enhancement
+    rendered = {}
+    if renditions:
+        orientation = open_image(image_bytes).getexif().get(_EXIF_ORIENTATION, 1)
+        rendered = create_renditions(img, renditions, encoder, orientation)
+    
+    # Apply basic image enhancements
+    img = ImageOps.autocontrast(img, cutoff=0.5)
+    
+    # Encode the optimized image
+    optimized_bytes, mime_type = encode_image(img, encoder, quality)
+    return optimized_bytes, 'reencoded', mime_type, rendered
+
+def prepare_image_payload(image_data, executor=None, memory_budget=None, **options):
+    """
+    Optimize an image and report the MIME type of the result.
+    
+    Args:
+        image_data: The image data as bytes or a file-like object
+        executor: Optional concurrent.futures executor to run the work in
+                  (e.g. the process pool from utils.preprocessing_pool)
+        memory_budget: Optional DecodeMemoryBudget bounding concurrent
+                       in-process decodes (ignored with an executor, whose
+                       workers enforce their own memory limit)
+        **options: Arguments for optimize_image_bytes (max_size, quality,
+                   fast_decode, passthrough, max_bytes, encoder, max_pixels,
+                   max_decode_bytes, renditions)
+        
+    Returns:
+        tuple: (optimized image bytes, MIME type, renditions)
         
-        # Apply basic image enhancements
-        img = ImageOps.autocontrast(img, cutoff=0.5)
+    Raises:
+        ValueError: If the image is invalid, cannot be decoded or exceeds the decode limits
+        MemoryError: If the decode memory budget timed out or a worker ran out of memory
+        BrokenProcessPool: If a pool worker died while processing the image
+    """
+    # Handle file-like objects
+    if hasattr(image_data, 'read'):
+        image_bytes = image_data.read()
+        if hasattr(image_data, 'seek'):
+            image_data.seek(0)  # Reset file pointer
+    else:
+        image_bytes = image_data
+    
+    # Only errors from decoding the image are the client's; failures of the
+    # pool or the server propagate as they are
+    future = executor.submit(optimize_image_bytes, image_bytes, **options) if executor is not None else None
+    try:
+        if future is not None:
+            optimized_bytes, path, mime_type, renditions = future.result()
+        elif memory_budget is not None:
+            header = read_image_header(BytesIO(image_bytes))
+            max_size = options.get('max_size', (1024, 1024)) if options.get('fast_decode', True) else None
+            with memory_budget.reserve(estimate_decode_bytes(header, max_size)):
+                optimized_bytes, path, mime_type, renditions = optimize_image_bytes(image_bytes, **options)
+        else:
+            optimized_bytes, path, mime_type, renditions = optimize_image_bytes(image_bytes, **options)
+    except _INVALID_IMAGE_ERRORS as e:
+        raise ValueError(f"Error optimizing image: {str(e)}") from e
+    
+    _count_path(path)
+    return optimized_bytes, mime_type, renditions
+
+def optimize_image(image_data, max_size=(1024, 1024), quality=None, executor=None, **options):
+    """
+    Optimizes an image for processing.
+    
+    Args:
+        image_data: The image data as bytes or a file-like object
+        max_size: Maximum size (width, height) to resize to
+        quality: Compression quality (1-100), defaults to the encoder profile's
+        executor: Optional concurrent.futures executor to run the work in
+                  (e.g. the process pool from utils.preprocessing_pool)
+        **options: Other optimize_image_bytes arguments:
+            fast_decode: Decode at reduced scale (see decode_image) instead of
+                         decoding the full-resolution image first
+            passthrough: Forward compliant uploads (see is_passthrough_compliant)
+                         with only their EXIF stripped instead of re-encoding them
+            max_bytes: Largest upload forwarded by the pass-through path
+            encoder: Name of the encoder profile (see ENCODER_PROFILES)
+            max_pixels, max_decode_bytes: Decode limits (see check_decode_limits)
         
-        # Save the optimized image to a buffer
-        output = BytesIO()
-        img.save(output, format='JPEG', quality=quality, optimize=True)
-        output.seek(0)
+    Returns:
+        BytesIO: File-like object with the optimized image
+    """
+    optimized_bytes, _, _ = prepare_image_payload(
+        image_data, executor=executor, max_size=max_size, quality=quality, **options
+    )
+    return BytesIO(optimized_bytes)
+
+
+def validate_content_length(content_length, max_bytes=MAX_UPLOAD_BYTES):
+    """
+    Reject a request body from its declared Content-Length, before reading it.
+    
+    Args:
+        content_length: The request's Content-Length (None if not declared)
+        max_bytes: Maximum allowed size in bytes
         
-        return output
-    except Exception as e:
-        raise ValueError(f"Error optimizing image: {str(e)}")
+    Returns:
+        bool: True if acceptable, otherwise raises ValueError
+    """
+    if content_length is not None and content_length > max_bytes:
+        raise ValueError(f"File size exceeds the maximum limit of {max_bytes // (1024 * 1024)}MB.")
+    return True
 
+def _read_exact(stream, size):
+    """Read exactly size bytes from a stream or raise ValueError."""
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("The file is not a valid image.")
+    return data
+
+def _read_png_header(stream):
+    """Read the dimensions of a PNG from its IHDR chunk (stream is past the signature)."""
+    chunk = _read_exact(stream, 8 + 13)
+    if chunk[4:8] != b'IHDR':
+        raise ValueError("The file is not a valid image.")
+    width = int.from_bytes(chunk[8:12], 'big')
+    height = int.from_bytes(chunk[12:16], 'big')
+    color_type = chunk[17]
+    return {
+        'format': 'PNG',
+        'width': width,
+        'height': height,
+        'bands': _PNG_BANDS.get(color_type, 4),
+        'progressive': chunk[20] == 1  # Adam7 interlacing
+    }
 
-def validate_image(file):
+def _read_jpeg_header(stream):
+    """Read the dimensions of a JPEG from its SOF segment (stream is past SOI)."""
+    while True:
+        marker = _read_exact(stream, 2)
+        if marker[0] != 0xFF:
+            raise ValueError("The file is not a valid image.")
+        if marker[1] == 0xFF:
+            # Fill byte: the next byte is the actual marker
+            stream.seek(-1, os.SEEK_CUR)
+            continue
+        if 0xD0 <= marker[1] <= 0xD7 or marker[1] == 0x01:
+            continue
+        if marker[1] in (_JPEG_SOS, 0xD9):
+            # Reached image data without a frame header
+            raise ValueError("The file is not a valid image.")
+        
+        length = int.from_bytes(_read_exact(stream, 2), 'big')
+        if length < 2:
+            raise ValueError("The file is not a valid image.")
+        if marker[1] in _JPEG_SOF_MARKERS:
+            frame = _read_exact(stream, 6)
+            return {
+                'format': 'JPEG',
+                'width': int.from_bytes(frame[3:5], 'big'),
+                'height': int.from_bytes(frame[1:3], 'big'),
+                'bands': frame[5],
+                'progressive': marker[1] in (0xC2, 0xC6, 0xCA, 0xCE)
+            }
+        # Skip the segment (e.g. a 64 KB EXIF block) without reading it
+        stream.seek(length - 2, os.SEEK_CUR)
+
+def read_image_header(stream):
     """
-    Validate an image file.
+    Identify a JPEG or PNG from its magic bytes and read its dimensions.
+    
+    Only the header is read: the PNG IHDR chunk or the JPEG segments up to the
+    frame header. The stream position is restored afterwards.
     
     Args:
-        file: A file-like object from Flask's request.files
+        stream: A seekable file-like object
         
     Returns:
-        bool: True if valid, otherwise raises ValueError
+        dict: 'format' ('JPEG' or 'PNG'), 'width', 'height', 'bands' (channels
+              once decoded) and 'progressive'
     """
-    import imghdr
-    from flask import current_app
+    position = stream.tell()
+    try:
+        magic = stream.read(len(_PNG_SIGNATURE))
+        if magic == _PNG_SIGNATURE:
+            header = _read_png_header(stream)
+        elif magic[:3] == _JPEG_MAGIC:
+            stream.seek(position + 2)
+            header = _read_jpeg_header(stream)
+        else:
+            raise ValueError("Invalid image type. Only JPEG and PNG are allowed.")
+    finally:
+        stream.seek(position)
     
-    # Check if the file is actually an image
-    file_contents = file.read()
-    file.seek(0)  # Reset file pointer
+    if header['width'] == 0 or header['height'] == 0:
+        raise ValueError("The file is not a valid image.")
+    return header
+
+def validate_image(file, content_length=None, max_bytes=MAX_UPLOAD_BYTES, max_pixels=MAX_IMAGE_PIXELS,
+                   max_decode_bytes=MAX_DECODE_BYTES):
+    """
+    Validate an image file.
+    
+    The body size is checked from the Content-Length (when given) and the
+    stream length, and the type and dimensions from the header, so invalid
+    uploads are rejected without reading or decoding the whole image.
     
-    image_type = imghdr.what(None, h=file_contents)
-    if not image_type or image_type not in ['jpeg', 'png']:
-        raise ValueError("Invalid image type. Only JPEG and PNG are allowed.")
+    Args:
+        file: A file-like object from Flask's request.files (or any seekable stream)
+        content_length: The request's Content-Length, if known
+        max_bytes: Maximum allowed size in bytes
+        max_pixels: Maximum allowed width * height
+        max_decode_bytes: Maximum estimated memory to decode the image (at
+                          full scale, see estimate_decode_bytes)
+        
+    Returns:
+        dict: The image header (see read_image_header), otherwise raises ValueError
+    """
+    validate_content_length(content_length, max_bytes)
     
-    # Validate the file size (max 5MB)
-    file_size = len(file_contents)
-    if file_size > 5 * 1024 * 1024:  # 5MB
-        raise ValueError("File size exceeds the maximum limit of 5MB.")
+    # Validate the file size without reading it
+    position = file.tell()
+    file.seek(0, os.SEEK_END)
+    file_size = file.tell() - position
+    file.seek(position)
+    if file_size > max_bytes:
+        raise ValueError(f"File size exceeds the maximum limit of {max_bytes // (1024 * 1024)}MB.")
     
-    # Try to open the image with PIL to ensure it's a valid image
-    try:
-        Image.open(BytesIO(file_contents))
-    except Exception:
-        raise ValueError("The file is not a valid image.")
+    header = read_image_header(file)
+    check_decode_limits(header, max_pixels, max_decode_bytes)
     
-    return True
+    return header
 
 
 def get_image_format(filename):
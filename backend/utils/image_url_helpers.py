@@ -24,5 +24,35 @@ def prepare_image_urls_for_frontend(item):
             result["image_thumbnail"] = result["image_url"]
         if "image_medium" not in result or not result["image_medium"]:
             result["image_medium"] = result["image_url"]
+    elif result.get("image_medium") or result.get("image_thumbnail"):
+        # Upload still pending: show the locally stored rendition
+        result["image_data"] = result.get("image_medium") or result.get("image_thumbnail")
     
     return result
+
+# Fields of a history entry in the list view (/api/history); the rest are
+# returned by the detail view (/api/history/<id>)
+HISTORY_LIST_FIELDS = ('id', 'timestamp', 'category', 'confidence', 'upload_status')
+
+# Image fields the list view picks its thumbnail from, smallest first
+_THUMBNAIL_SOURCES = ('image_thumbnail', 'image_medium', 'image_url')
+
+# MongoDB projection reading only what the list view needs
+HISTORY_LIST_PROJECTION = dict.fromkeys(HISTORY_LIST_FIELDS + _THUMBNAIL_SOURCES, 1)
+HISTORY_LIST_PROJECTION['_id'] = 0
+
+def compact_history_item(item):
+    """
+    Build the list view of a classification record.
+    
+    Args:
+        item (dict): Classification record (full, or read with HISTORY_LIST_PROJECTION)
+        
+    Returns:
+        dict: The HISTORY_LIST_FIELDS of the record plus a single image_thumbnail URL,
+              None for records with only an inline base64 image (see the detail view)
+    """
+    result = {field: item.get(field) for field in HISTORY_LIST_FIELDS}
+    result["image_thumbnail"] = next((item[source] for source in _THUMBNAIL_SOURCES
+                                      if item.get(source) and not item[source].startswith('data:')), None)
+    return result
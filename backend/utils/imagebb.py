@@ -1,7 +1,9 @@
 import requests
-import base64
 import os
 import time
+import random
+import threading
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # Cargar variables de entorno
@@ -10,6 +12,56 @@ load_dotenv()
 # API key predeterminada
 DEFAULT_API_KEY = 'bf79f82c0d0d19e2d9c15e6247dca5f7'
 
+# Endpoint de subida (configurable para pruebas contra un servidor local)
+UPLOAD_URL = os.environ.get('IMAGEBB_UPLOAD_URL', 'https://api.imgbb.com/1/upload')
+
+# Timeouts (segundos) de conexión y de lectura de la respuesta
+CONNECT_TIMEOUT = float(os.environ.get('IMAGEBB_CONNECT_TIMEOUT') or 5)
+READ_TIMEOUT = float(os.environ.get('IMAGEBB_READ_TIMEOUT') or 30)
+
+# Conexiones reutilizables por host en la sesión compartida
+POOL_SIZE = int(os.environ.get('IMAGEBB_POOL_SIZE') or 10)
+
+# Sesión HTTP compartida (singleton)
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Obtiene la sesión HTTP compartida para las subidas.
+    
+    La sesión mantiene un pool de conexiones keep-alive, por lo que las
+    subidas consecutivas no repiten el handshake TCP/TLS.
+    
+    Returns:
+        requests.Session: La sesión compartida
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def backoff_delay(attempt, base_delay=2, max_delay=60):
+    """
+    Calcula la espera antes de un reintento (exponencial con jitter).
+    
+    Args:
+        attempt: Número de intentos fallidos hasta ahora (empezando en 1)
+        base_delay: Espera tras el primer fallo (segundos)
+        max_delay: Espera máxima (segundos)
+        
+    Returns:
+        float: Espera en segundos
+    """
+    delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+    # El jitter evita que los reintentos de varias subidas coincidan
+    return random.uniform(delay / 2, delay)
+
 def upload_image_to_imagebb(image_data, api_key=None, name=None):
     """
     Sube una imagen a ImageBB.
@@ -25,7 +77,6 @@ def upload_image_to_imagebb(image_data, api_key=None, name=None):
     try:
         # Usar la API key proporcionada o la predeterminada
         api_key = api_key or os.environ.get('IMAGEBB_API_KEY', DEFAULT_API_KEY)
-        upload_url = "https://api.imgbb.com/1/upload"
         
         # Si image_data es un objeto tipo archivo, obtener los bytes
         if hasattr(image_data, 'read'):
@@ -34,21 +85,21 @@ def upload_image_to_imagebb(image_data, api_key=None, name=None):
                 image_data.seek(0)  # Reset file pointer
         else:
             img_bytes = image_data
-            
-        # Codificar imagen en base64
-        base64_image = base64.b64encode(img_bytes).decode('utf-8')
-        
-        # Preparar payload para la petición
-        payload = {
-            'key': api_key,
-            'image': base64_image,
-        }
         
+        # Preparar payload para la petición. La imagen se envía como archivo
+        # binario (multipart) en lugar de base64, que ocupa un 33% más
+        payload = {'key': api_key}
         if name:
             payload['name'] = name
+        files = {'image': (name or 'image', img_bytes, 'application/octet-stream')}
             
         # Realizar la petición a la API de ImageBB
-        response = requests.post(upload_url, data=payload)
+        response = get_session().post(
+            UPLOAD_URL,
+            data=payload,
+            files=files,
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
         response.raise_for_status()  # Lanzar excepción si hay error HTTP
         
         result = response.json()
@@ -73,7 +124,7 @@ class ImageBBUploader:
             api_key: API key de ImageBB. Si no se proporciona, se intentará leer de las variables de entorno.
         """
         self.api_key = api_key or os.environ.get('IMAGEBB_API_KEY', DEFAULT_API_KEY)
-        self.upload_url = "https://api.imgbb.com/1/upload"
+        self.upload_url = UPLOAD_URL
         
     def upload_image(self, image_data, name=None):
         """
@@ -96,7 +147,8 @@ class ImageBBUploader:
             image_data: Bytes de la imagen o objeto tipo archivo
             name: Nombre para la imagen (opcional)
             max_retries: Número máximo de intentos
-            delay: Tiempo de espera entre intentos (segundos)
+            delay: Espera tras el primer fallo (segundos); se duplica en cada
+                   reintento, con jitter (ver backoff_delay)
             
         Returns:
             dict: Datos de la imagen subida o None si fallan todos los intentos
@@ -108,7 +160,8 @@ class ImageBBUploader:
                 
             # Si hay error pero quedan intentos, esperar y reintentar
             if attempt < max_retries - 1:
-                print(f"Reintentando subida de imagen ({attempt+1}/{max_retries})...")
-                time.sleep(delay)
+                wait = backoff_delay(attempt + 1, base_delay=delay)
+                print(f"Reintentando subida de imagen ({attempt+1}/{max_retries}) en {wait:.1f}s...")
+                time.sleep(wait)
                 
         return None
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Content-addressed local storage for history images.
+
+An alternative to ImageBB (IMAGE_STORAGE_BACKEND=local): every image is
+written once under the SHA-256 of its bytes, so identical uploads share a
+file and a stored image never changes, which makes it safe to cache forever.
+"""
+import os
+import re
+import hashlib
+import threading
+
+_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# MIME type of the stored images, by magic bytes
+_MIME_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png')
+)
+
+class LocalImageStore:
+    """
+    File-based store keeping each distinct image once, keyed by SHA-256.
+    """
+
+    def __init__(self, directory='./stats/images', url_builder=None):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Directory to store images in
+            url_builder: Function image_hash -> URL the image is served at
+                         (defaults to the relative /api/images/<hash> path)
+        """
+        # Convert relative paths to absolute paths if they are relative
+        if not os.path.isabs(directory):
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            directory = os.path.join(base_dir, directory)
+
+        self.directory = directory
+        self.url_builder = url_builder or (lambda image_hash: f"/api/images/{image_hash}")
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, image_hash):
+        """
+        Get the file path of an image.
+
+        Args:
+            image_hash: SHA-256 of the image (hex)
+
+        Returns:
+            str: The path (two-character fan-out keeps directories small)
+        """
+        return os.path.join(self.directory, image_hash[:2], image_hash)
+
+    def is_valid_hash(self, image_hash):
+        """Check that a requested key has the SHA-256 hex format."""
+        return bool(_HASH_PATTERN.match(image_hash))
+
+    def exists(self, image_hash):
+        """Check whether an image is stored."""
+        return self.is_valid_hash(image_hash) and os.path.exists(self.path(image_hash))
+
+    def save(self, image_bytes, name=None):
+        """
+        Store an image unless an identical one is already stored.
+
+        Args:
+            image_bytes: The image data as bytes
+            name: Unused, accepted for compatibility with upload_image_to_imagebb
+
+        Returns:
+            dict: Upload data shaped like ImageBB's ('id', 'url'), with no
+                  thumbnails or delete URL
+        """
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        path = self.path(image_hash)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see partial files;
+            # its name is unique per thread, as requests may save the same image
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(image_bytes)
+            os.replace(temp_path, path)
+
+        return {
+            'id': image_hash,
+            'url': self.url_builder(image_hash),
+            'delete_url': None
+        }
+
+    def mime_type(self, image_hash):
+        """
+        Get the MIME type of a stored image from its magic bytes.
+
+        Returns:
+            str: The MIME type ('application/octet-stream' if unknown)
+        """
+        with open(self.path(image_hash), 'rb') as f:
+            header = f.read(8)
+        for magic, mime_type in _MIME_TYPES:
+            if header.startswith(magic):
+                return mime_type
+        return 'application/octet-stream'
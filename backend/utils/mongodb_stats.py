@@ -4,24 +4,106 @@ MongoDB-based statistics manager for image classifications.
 import os
 import time
 import hashlib
-from datetime import datetime, timedelta
-from utils.db import get_database
-from utils.imagebb import upload_image_to_imagebb
-from utils.image_url_helpers import prepare_image_urls_for_frontend
+import threading
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from utils.db import get_database, migrate_confidence_sums, migrate_timestamps_to_dates, migrate_history_counts
+from utils.history_cursor import decode_cursor
+from utils import confidence_histogram, rollups, timeseries
+from utils.imagebb import upload_image_to_imagebb, backoff_delay
+from utils.image_url_helpers import prepare_image_urls_for_frontend, compact_history_item, HISTORY_LIST_PROJECTION
+
+def _upload_index_entry(upload_result):
+    """Keep the URL fields of an ImageBB upload result for the dedupe index."""
+    return {
+        "url": upload_result.get('url'),
+        "thumb": {"url": upload_result.get('thumb', {}).get('url')},
+        "medium": {"url": upload_result.get('medium', {}).get('url')},
+        "delete_url": upload_result.get('delete_url')
+    }
+
+def _upload_fields(metadata, upload_result):
+    """Get the ImageBB URL fields of a classification, keeping local renditions."""
+    return {
+        "image_url": upload_result.get('url'),
+        "image_thumbnail": metadata.get("image_thumbnail") or upload_result.get('thumb', {}).get('url'),
+        "image_medium": metadata.get("image_medium") or upload_result.get('medium', {}).get('url'),
+        "delete_url": upload_result.get('delete_url')
+    }
+
+# Longest wait (seconds) between retries of a failed flush
+FLUSH_RETRY_MAX_DELAY = 30
+
+# Newest first; _id breaks timestamp ties for keyset pagination
+HISTORY_SORT = [("timestamp", -1), ("_id", -1)]
 
 class MongoDBStats:
     """
     Tracks and stores statistics for image classifications using MongoDB.
     """
     
-    def __init__(self):
+    def __init__(self, upload_outbox=None, image_store=None, db=None,
+                 flush_interval_ms=200, flush_batch=100, max_pending=1000, max_buffered=None,
+                 rollup_grace_seconds=300):
         """
         Initialize the MongoDB statistics tracker.
+        
+        Classification records and stats increments are buffered in memory
+        (increments to the same document are merged) and written by a
+        background thread with insert_many / bulk_write, at most
+        flush_interval_ms after a classification. Writes that fail stay
+        buffered and are retried by the background thread with exponential
+        backoff. Reads flush first, so a process sees its own
+        classifications while MongoDB accepts writes.
+        
+        Args:
+            upload_outbox: Optional UploadOutbox; images are then uploaded in the
+                           background instead of while recording
+            image_store: Optional LocalImageStore used instead of ImageBB
+            db: Database to use (defaults to the configured one)
+            flush_interval_ms: Maximum time classifications stay buffered
+            flush_batch: Buffered writes that trigger a flush right away
+            max_pending: Buffered writes at which recording blocks and flushes
+                         itself (1 writes synchronously), unless flushes are failing
+            max_buffered: Buffered writes above which new classifications are
+                          dropped while MongoDB fails (defaults to 10 * max_pending)
+            rollup_grace_seconds: Classifications younger than this are left for
+                                  the next rollup run (they may still be buffered
+                                  by another worker)
         """
-        self.db = get_database()
+        self.upload_outbox = upload_outbox
+        self.image_store = image_store
+        self.db = db if db is not None else get_database()
         self.classifications = self.db.classifications
         self.statistics = self.db.statistics
         self.daily_stats = self.db.daily_stats
+        # Uploaded images by content hash (_id is the SHA-256)
+        self.uploads = self.db.uploads
+        # Minute and hour classification counts, expired by a TTL index on expires_at
+        self.timeseries = self.db.stats_timeseries
+        # Per-category, per-day rollups of the history (see refresh_rollups)
+        self.rollups = self.db.classification_rollups
+        self.rollup_grace = timedelta(seconds=rollup_grace_seconds)
+        self._rollup_stop = threading.Event()
+        
+        # Write-behind buffer
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_batch = flush_batch
+        self.max_pending = max_pending
+        self.max_buffered = max_buffered or 10 * max_pending
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._inserts = []
+        # (collection name, _id) -> merged update
+        self._updates = {}
+        self._pending = 0
+        self._flush_wakeup = threading.Event()
+        self._flusher = None
+        self._closed = False
+        # Consecutive failed flushes, and classifications dropped meanwhile
+        self._flush_failures = 0
+        self._dropped = 0
     
     def record_classification(self, category, confidence):
         """
@@ -31,64 +113,244 @@ class MongoDBStats:
             category: The classified category
             confidence: The confidence score
         """
-        # Get the current date
-        today = datetime.now().strftime('%Y-%m-%d')
+        now = datetime.now()
+        today = now.strftime('%Y-%m-%d')
+        bucket = confidence_histogram.bucket_key(confidence)
         
-        # Update global statistics
-        global_stats = self.statistics.find_one({"_id": "global"})
-        if not global_stats:
-            # Initialize global stats if not found
-            global_stats = {
-                "_id": "global",
-                "total_classifications": 0,
-                "categories": {},
-                "last_updated": None
-            }
-        
-        # Update total counts
-        global_stats["total_classifications"] = global_stats.get("total_classifications", 0) + 1
-        
-        # Update category stats
-        if category not in global_stats["categories"]:
-            global_stats["categories"][category] = {
-                "count": 0,
-                "avg_confidence": 0
+        with self._lock:
+            if self._buffer_full():
+                return
+            
+            # Global statistics: one atomic $inc, concurrent workers never overwrite each other
+            self._queue_update("statistics", "global", {
+                "total_classifications": 1,
+                f"categories.{category}.count": 1,
+                f"categories.{category}.confidence_sum": confidence,
+                f"categories.{category}.histogram.{bucket}": 1
+            }, set_fields={"last_updated": now.isoformat()})
+            
+            # Daily stats
+            self._queue_update("daily_stats", today, {
+                "total": 1,
+                f"categories.{category}": 1,
+                f"histograms.{category}.{bucket}": 1
+            }, set_on_insert={"date": today})
+            
+            # Minute and hour buckets
+            for resolution in timeseries.RESOLUTIONS:
+                self._queue_timeseries(resolution, now, category)
+            
+            must_flush = self._buffered()
+        if must_flush:
+            self._try_flush()
+    
+    def _queue_timeseries(self, resolution, moment, category):
+        """Count a classification in its bucket of a resolution."""
+        seconds, slots = timeseries.RESOLUTIONS[resolution]
+        start = timeseries.bucket_start(moment, resolution)
+        self._queue_update(
+            "stats_timeseries",
+            f"{resolution}:{timeseries.bucket_label(start, resolution)}",
+            {"total": 1, f"categories.{category}": 1},
+            set_on_insert={
+                "resolution": resolution,
+                "start": start,
+                # Same retention as the file-based ring buffers
+                "expires_at": datetime.now(timezone.utc) + timedelta(seconds=seconds * slots)
             }
+        )
+    
+    def _queue_update(self, collection, doc_id, inc, set_fields=None, set_on_insert=None, upsert=True):
+        """Buffer an $inc (plus optional $set / $setOnInsert), merged with earlier ones on the same document."""
+        key = (collection, doc_id)
+        update = self._updates.get(key)
+        if update is None:
+            update = self._updates[key] = {"inc": {}, "set": {}, "set_on_insert": {}, "upsert": upsert}
+        for field, amount in inc.items():
+            update["inc"][field] = update["inc"].get(field, 0) + amount
+        # Later values win for $set; the first ones for $setOnInsert
+        update["set"].update(set_fields or {})
+        for field, value in (set_on_insert or {}).items():
+            update["set_on_insert"].setdefault(field, value)
+    
+    def _requeue_update(self, key, update):
+        """
+        Put back a merged update whose write failed (called with _lock held).
         
-        category_stats = global_stats["categories"][category]
-        old_count = category_stats["count"]
-        old_avg = category_stats["avg_confidence"]
-        
-        # Calculate new average confidence
-        if old_count == 0:
-            new_avg = confidence
-        else:
-            new_avg = (old_avg * old_count + confidence) / (old_count + 1)
+        It is older than any update queued for the same document since, so
+        its $setOnInsert values win but its $set values do not.
+        """
+        queued = self._updates.get(key)
+        if queued is None:
+            self._updates[key] = update
+            return
+        for field, amount in update["inc"].items():
+            queued["inc"][field] = queued["inc"].get(field, 0) + amount
+        for field, value in update["set"].items():
+            queued["set"].setdefault(field, value)
+        queued["set_on_insert"].update(update["set_on_insert"])
+        queued["upsert"] = queued["upsert"] or update["upsert"]
+    
+    def _buffer_full(self):
+        """
+        Check whether a new write must be dropped (called with _lock held).
         
-        # Update category stats
-        category_stats["count"] = old_count + 1
-        category_stats["avg_confidence"] = new_avg
+        Returns:
+            bool: True if max_buffered writes are waiting for MongoDB to recover
+        """
+        if self._pending < self.max_buffered:
+            return False
+        if not self._dropped:
+            print(f"Stats write buffer full ({self._pending} writes), dropping classifications until MongoDB recovers")
+        self._dropped += 1
+        return True
+    
+    def _buffered(self):
+        """
+        Count a buffered write and make sure it gets flushed (called with _lock held).
         
-        # Update timestamp
-        global_stats["last_updated"] = datetime.now().isoformat()
+        Returns:
+            bool: True if the caller must flush itself, after releasing _lock
+        """
+        self._pending += 1
+        if self._closed or (self._pending >= self.max_pending and not self._flush_failures):
+            # Backpressure: the buffer is full (e.g. MongoDB is slow). While flushes
+            # fail, the background thread retries them instead
+            return True
+        self._ensure_flusher()
+        self._flush_wakeup.set()
+        return False
+    
+    def _ensure_flusher(self):
+        """Start the background flush thread if it is not running (called with _lock held)."""
+        if not self._closed and (self._flusher is None or not self._flusher.is_alive()):
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+    
+    def _flush_loop(self):
+        """
+        Background thread flushing the buffer at most flush_interval after a
+        write, and retrying failed flushes with exponential backoff.
+        """
+        while True:
+            if self._flush_failures:
+                # Retry the writes put back by the failed flush, even without new ones;
+                # new writes do not shorten the wait
+                delay = backoff_delay(self._flush_failures, self.flush_interval, FLUSH_RETRY_MAX_DELAY)
+                deadline = time.monotonic() + delay
+                while not self._closed and time.monotonic() < deadline:
+                    self._flush_wakeup.wait(max(deadline - time.monotonic(), 0))
+                    self._flush_wakeup.clear()
+            else:
+                self._flush_wakeup.wait()
+                self._flush_wakeup.clear()
+                # Flush right away once a batch is full, otherwise wait for more writes
+                deadline = time.monotonic() + self.flush_interval
+                while self._pending < self.flush_batch and not self._closed and time.monotonic() < deadline:
+                    self._flush_wakeup.wait(max(deadline - time.monotonic(), 0))
+                    self._flush_wakeup.clear()
+            if self._closed:
+                return  # close() flushes
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing stats to MongoDB (attempt {self._flush_failures}): {e}")
+    
+    def _try_flush(self):
+        """
+        Flush before a read or when the buffer is full. If MongoDB rejects the
+        writes, log the error instead of failing the request: the writes stay
+        buffered and the background thread retries them.
+        """
+        try:
+            self.flush()
+        except PyMongoError as e:
+            print(f"Error flushing stats to MongoDB: {e}")
+    
+    def flush(self):
+        """
+        Write the buffered classification records and stats increments.
         
-        # Save global stats
-        self.statistics.replace_one({"_id": "global"}, global_stats, upsert=True)
+        Records are inserted with one insert_many and the increments with one
+        bulk_write per collection, all unordered. Writes that fail are put
+        back in the buffer and retried by the background thread.
         
-        # Update daily stats
-        daily_update_result = self.daily_stats.update_one(
-            {"_id": today},
-            {
-                "$inc": {
-                    "total": 1,
-                    f"categories.{category}": 1
-                },
-                "$setOnInsert": {"date": today}
-            },
-            upsert=True
-        )
+        Raises:
+            PyMongoError: If a write failed
+        """
+        with self._flush_lock:
+            with self._lock:
+                inserts, updates = self._inserts, self._updates
+                self._inserts, self._updates, self._pending = [], {}, 0
+            if not inserts and not updates:
+                return
+            
+            error = None
+            # Records first: the history counts increments follow their inserts
+            try:
+                if inserts:
+                    self.classifications.insert_many(inserts, ordered=False)
+                inserts = []
+            except BulkWriteError as e:
+                failed = {failure["index"] for failure in e.details.get("writeErrors", [])
+                          if failure.get("code") != 11000}  # duplicates were inserted by an earlier attempt
+                inserts = [doc for index, doc in enumerate(inserts) if index in failed]
+                error = e
+            except PyMongoError as e:
+                error = e
+            
+            failed_updates = {}
+            by_collection = {}
+            for key, update in updates.items():
+                by_collection.setdefault(key[0], []).append(key)
+            for collection, keys in by_collection.items():
+                operations = [self._update_operation(key[1], updates[key]) for key in keys]
+                try:
+                    self.db[collection].bulk_write(operations, ordered=False)
+                except BulkWriteError as e:
+                    for failure in e.details.get("writeErrors", []):
+                        failed_updates[keys[failure["index"]]] = updates[keys[failure["index"]]]
+                    error = e
+                except PyMongoError as e:
+                    # Unknown outcome: retry all of them (increments may be counted twice)
+                    failed_updates.update((key, updates[key]) for key in keys)
+                    error = e
+            
+            if error is not None:
+                with self._lock:
+                    self._inserts[:0] = inserts
+                    for key, update in failed_updates.items():
+                        self._requeue_update(key, update)
+                    self._pending += len(inserts) + len(failed_updates)
+                    self._flush_failures += 1
+                    self._ensure_flusher()
+                raise error
+            
+            with self._lock:
+                if self._dropped:
+                    print(f"MongoDB accepts writes again, {self._dropped} classifications were dropped")
+                self._flush_failures = 0
+                self._dropped = 0
+    
+    @staticmethod
+    def _update_operation(doc_id, update):
+        """Build the UpdateOne of a merged buffered update."""
+        document = {"$inc": update["inc"]}
+        if update["set"]:
+            document["$set"] = update["set"]
+        if update["set_on_insert"]:
+            document["$setOnInsert"] = update["set_on_insert"]
+        return UpdateOne({"_id": doc_id}, document, upsert=update["upsert"])
     
-    def record_classification_with_image(self, category, confidence, image_data, original_filename=None):
+    def close(self):
+        """Write the buffered classifications and stop the background threads."""
+        self._closed = True
+        self._rollup_stop.set()
+        self._flush_wakeup.set()
+        self.flush()
+    
+    def record_classification_with_image(self, category, confidence, image_data, original_filename=None,
+                                         renditions=None):
         """
         Record a new classification with the image.
         
@@ -97,12 +359,15 @@ class MongoDBStats:
             confidence: The confidence score
             image_data: The image data (file-like object or bytes)
             original_filename: Original filename if available
+            renditions: URLs of locally stored renditions ('thumb', 'medium'),
+                        preferred over the ImageBB ones
         
         Returns:
             str: The unique ID of the recorded classification
         """
         # Generate a unique ID for this classification
-        timestamp = datetime.now().isoformat()
+        now = datetime.now()
+        timestamp = now.isoformat()
         unique_id = f"{timestamp}-{hashlib.md5(str(time.time()).encode()).hexdigest()[:8]}"
         
         # Record basic classification data
@@ -117,31 +382,55 @@ class MongoDBStats:
             else:
                 img_bytes = image_data
             
-            # Upload the image to ImageBB
+            renditions = renditions or {}
             image_name = original_filename or f"{category}_{unique_id}.jpg"
-            upload_result = upload_image_to_imagebb(img_bytes, name=image_name)
-            
-            if not upload_result:
-                raise Exception("Failed to upload image to ImageBB")
             
             # Create metadata for this classification
             metadata = {
                 "_id": unique_id,
                 "id": unique_id,
-                "timestamp": timestamp,
+                "timestamp": now,  # BSON date
                 "category": category,
                 "confidence": confidence,
                 "original_filename": original_filename or 'unknown.jpg',
-                "image_url": upload_result.get('url'),
-                "image_thumbnail": upload_result.get('thumb', {}).get('url'),
-                "image_medium": upload_result.get('medium', {}).get('url'),
-                "delete_url": upload_result.get('delete_url')
+                "image_url": None,
+                "image_thumbnail": renditions.get('thumb'),
+                "image_medium": renditions.get('medium'),
+                "delete_url": None
             }
             
+            image_hash = hashlib.sha256(img_bytes).hexdigest()
+            metadata["image_hash"] = image_hash
+            
+            previous_upload = self.find_upload(image_hash) if self.image_store is None else None
+            if self.image_store is not None:
+                # Store the image locally (no external round trip)
+                upload_result = self.image_store.save(img_bytes, name=image_name)
+            elif previous_upload:
+                # The same image was uploaded before: reuse its URLs
+                upload_result = previous_upload
+            elif self.upload_outbox is not None:
+                # Buffer the record and upload the image in the background. If an
+                # upload worker finishes before the record is flushed,
+                # apply_upload_result raises LookupError and the outbox retries later
+                metadata["upload_status"] = "pending"
+                if self._insert_classification(metadata):
+                    self.upload_outbox.enqueue(unique_id, img_bytes, name=image_name)
+                return unique_id
+            else:
+                # Upload the image to ImageBB
+                upload_result = upload_image_to_imagebb(img_bytes, name=image_name)
+                
+                if not upload_result:
+                    raise Exception("Failed to upload image to ImageBB")
+                self.remember_upload(image_hash, upload_result)
+            
+            metadata.update(_upload_fields(metadata, upload_result))
+            
             # Insert the classification into MongoDB
-            self.classifications.insert_one(metadata)
+            self._insert_classification(metadata)
             
-            print(f"Image uploaded to ImageBB and recorded in MongoDB: {upload_result.get('url')}")
+            print(f"Image saved and recorded in MongoDB: {upload_result.get('url')}")
             return unique_id
             
         except Exception as e:
@@ -150,7 +439,133 @@ class MongoDBStats:
             traceback.print_exc()
             return None
     
-    def get_classification_history(self, limit=50, offset=0, category=None):
+    def apply_upload_result(self, record_id, upload_result):
+        """
+        Patch a classification with the result of its background upload
+        (callback of UploadOutbox).
+        
+        Args:
+            record_id: The classification ID
+            upload_result: ImageBB upload data, or None if the upload failed for good
+            
+        Raises:
+            LookupError: If there is no such record (the outbox then retries the job)
+        """
+        if not upload_result:
+            self.classifications.update_one({"_id": record_id}, {"$set": {"upload_status": "failed"}})
+            return
+        
+        current = self.classifications.find_one(
+            {"_id": record_id}, {"image_thumbnail": 1, "image_medium": 1, "image_hash": 1}
+        )
+        if current is None:
+            raise LookupError(f"Classification {record_id} not found")
+        fields = _upload_fields(current, upload_result)
+        fields["upload_status"] = "uploaded"
+        result = self.classifications.update_one({"_id": record_id}, {"$set": fields})
+        if result.matched_count == 0:
+            raise LookupError(f"Classification {record_id} not found")
+        if current.get("image_hash"):
+            self.remember_upload(current["image_hash"], upload_result)
+    
+    def find_upload(self, image_hash):
+        """
+        Look up the ImageBB URLs of an image uploaded before.
+        
+        Args:
+            image_hash: SHA-256 of the image bytes (hex)
+            
+        Returns:
+            dict: Upload data (url, thumb, medium, delete_url) or None
+        """
+        return self.uploads.find_one({"_id": image_hash}, {"_id": 0})
+    
+    def remember_upload(self, image_hash, upload_result):
+        """
+        Add an uploaded image to the hash -> URLs index.
+        
+        Args:
+            image_hash: SHA-256 of the image bytes (hex)
+            upload_result: ImageBB upload data
+        """
+        self.uploads.update_one(
+            {"_id": image_hash},
+            {"$setOnInsert": _upload_index_entry(upload_result)},
+            upsert=True
+        )
+    
+    def _insert_classification(self, metadata):
+        """
+        Insert a history record and count it in the history counts.
+        
+        The count is a buffered $inc (upsert) flushed with the insert, so
+        it never depends on the document existing beforehand.
+        
+        Args:
+            metadata: The record
+            
+        Returns:
+            bool: False if the record was dropped because the buffer is full
+        """
+        with self._lock:
+            if self._buffer_full():
+                return False
+            self._inserts.append(metadata)
+            self._queue_update("statistics", "history_counts",
+                               {"total": 1, f"categories.{metadata['category']}": 1})
+            must_flush = self._buffered()
+        if must_flush:
+            self._try_flush()
+        return True
+    
+    def count_history(self, category=None):
+        """
+        Count the history records.
+        
+        Read from the history_counts document, kept up to date by each
+        insert (records from before it existed are counted once by
+        utils.db.migrate_history_counts).
+        
+        Args:
+            category: Only count this category if provided
+            
+        Returns:
+            int: Number of records
+        """
+        self._try_flush()
+        counts = self.statistics.find_one({"_id": "history_counts"}) or {}
+        if category:
+            return counts.get("categories", {}).get(category, 0)
+        return counts.get("total", 0)
+    
+    @staticmethod
+    def _history_query(category=None, cursor=None):
+        """
+        Build the history filter, served by the (timestamp, _id) or
+        (category, timestamp, _id) index with HISTORY_SORT.
+        
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+        query = {}
+        if category:
+            query["category"] = category
+        if cursor:
+            # Keyset pagination: entries before the cursor's (timestamp, _id)
+            timestamp, record_id = decode_cursor(cursor)
+            try:
+                timestamp = datetime.fromisoformat(timestamp)
+            except ValueError:
+                raise ValueError("Invalid history cursor")
+            # The $lte bound keeps the index scan on the remaining range
+            query["timestamp"] = {"$lte": timestamp}
+            query["$or"] = [
+                {"timestamp": {"$lt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$lt": record_id}}
+            ]
+        return query
+    
+    def get_classification_history(self, limit=50, offset=0, category=None, cursor=None, compact=False):
         """
         Get the classification history.
         
@@ -158,28 +573,56 @@ class MongoDBStats:
             limit: Maximum number of entries to return
             offset: Offset for pagination
             category: Filter by category if provided
+            cursor: Return the entries after this cursor (see utils.history_cursor)
+            compact: Return only the list view fields (see compact_history_item),
+                     reading only those from MongoDB
             
         Returns:
             list: List of classification entries with metadata
+            
+        Raises:
+            ValueError: If the cursor is malformed
         """
-        # Build query
-        query = {}
-        if category:
-            query["category"] = category
+        self._try_flush()
         
         # Execute query with pagination
-        cursor = self.classifications.find(
-            query,
-            {"_id": 0}  # Exclude MongoDB _id from results
-        ).sort("timestamp", -1).skip(offset).limit(limit)        # Convert cursor to list and ensure image_data field exists
+        results = self.classifications.find(
+            self._history_query(category, cursor),
+            HISTORY_LIST_PROJECTION if compact else {"_id": 0}  # Exclude MongoDB _id from results
+        ).sort(HISTORY_SORT)
+        if offset:
+            results = results.skip(offset)
+        results = results.limit(limit)
+        
+        # Convert cursor to list and ensure image_data field exists
         history = []
-        for item in cursor:
+        for item in results:
+            # Timestamps are BSON dates in MongoDB, ISO strings in the API
+            if isinstance(item.get("timestamp"), datetime):
+                item["timestamp"] = item["timestamp"].isoformat()
             # Use our utility function to prepare image URLs
-            processed_item = prepare_image_urls_for_frontend(item)
-            history.append(processed_item)
+            history.append(compact_history_item(item) if compact else prepare_image_urls_for_frontend(item))
         
         return history
     
+    def get_classification_record(self, record_id):
+        """
+        Get a single classification record with all its fields.
+        
+        Args:
+            record_id: The record ID
+            
+        Returns:
+            dict: The record, or None if there is no such record
+        """
+        self._try_flush()
+        item = self.classifications.find_one({"_id": record_id}, {"_id": 0})
+        if item is None:
+            return None
+        if isinstance(item.get("timestamp"), datetime):
+            item["timestamp"] = item["timestamp"].isoformat()
+        return prepare_image_urls_for_frontend(item)
+    
     def get_stats(self, days=7):
         """
         Get classification statistics.
@@ -190,6 +633,8 @@ class MongoDBStats:
         Returns:
             dict: Statistics data
         """
+        self._try_flush()
+        
         # Get global stats
         global_stats = self.statistics.find_one({"_id": "global"}, {"_id": 0})
         if not global_stats:
@@ -205,29 +650,190 @@ class MongoDBStats:
         for i in range(days):
             date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
             recent_dates.append(date)
+        recent_dates.sort()
         
-        # Get daily stats for recent days
+        # Get daily stats for recent days in one range query (_id is the date)
+        stored = {}
+        if recent_dates:
+            for stats in self.daily_stats.find({"_id": {"$gte": recent_dates[0], "$lte": recent_dates[-1]}}):
+                stored[stats["_id"]] = stats
+        
+        # Fill in the days without classifications
         daily_stats = {}
-        for date in sorted(recent_dates):
-            stats = self.daily_stats.find_one({"_id": date}, {"_id": 0})
+        for date in recent_dates:
+            stats = stored.get(date)
             if stats:
                 daily_stats[date] = {
                     "total": stats.get("total", 0),
-                    "categories": stats.get("categories", {})
+                    "categories": stats.get("categories", {}),
+                    "percentiles": {
+                        name: confidence_histogram.percentiles(histogram)
+                        for name, histogram in stats.get("histograms", {}).items()
+                    }
                 }
             else:
-                daily_stats[date] = {"total": 0, "categories": {}}
+                daily_stats[date] = {"total": 0, "categories": {}, "percentiles": {}}
+        
+        # Report percentiles instead of the raw histograms
+        categories = {}
+        for name, data in global_stats.get("categories", {}).items():
+            count = data.get("count", 0)
+            categories[name] = {
+                "count": count,
+                "avg_confidence": data.get("confidence_sum", 0) / count if count else 0,
+                "percentiles": confidence_histogram.percentiles(data.get("histogram"))
+            }
         
         # Prepare summary
         summary = {
             "total_classifications": global_stats.get("total_classifications", 0),
-            "categories": global_stats.get("categories", {}),
+            "categories": categories,
             "daily": daily_stats,
             "last_updated": global_stats.get("last_updated")
         }
         
         return summary
     
+    def get_timeseries(self, granularity='hour', start=None, end=None):
+        """
+        Get classification counts over time.
+        
+        Args:
+            granularity: 'minute' (last 6 hours), 'hour' (last 35 days) or 'day'
+            start: ISO start of the range (defaults to a window before end)
+            end: ISO end of the range (defaults to now)
+            
+        Returns:
+            list: {'start', 'total', 'categories'} per bucket, oldest first
+            
+        Raises:
+            ValueError: If the granularity or range is invalid
+        """
+        start, end = timeseries.parse_range(granularity, start, end)
+        self._try_flush()
+        if granularity == 'day':
+            starts = timeseries.bucket_range(granularity, start, end)
+            cursor = self.daily_stats.find({"_id": {
+                "$gte": timeseries.bucket_label(start, granularity),
+                "$lte": timeseries.bucket_label(end, granularity)
+            }})
+        else:
+            starts = timeseries.bucket_range(granularity, start, end,
+                                             retained=timeseries.RESOLUTIONS[granularity][1])
+            if not starts:
+                return []
+            cursor = self.timeseries.find({
+                "resolution": granularity,
+                "start": {"$gte": starts[0], "$lte": end}
+            })
+        buckets = {}
+        for doc in cursor:
+            label = doc["_id"].split(":", 1)[1] if granularity != 'day' else doc["_id"]
+            buckets[label] = doc
+        return timeseries.points(starts, granularity, buckets)
+    
+    def refresh_rollups(self, now=None):
+        """
+        Bring the classification_rollups collection up to date with the history.
+        
+        A watermark (statistics document "rollup_watermark") records up to
+        when the history was rolled up. Each run aggregates only the
+        classifications from the start of the watermark's day up to now minus
+        the grace period, and $merges the per-day, per-category rows, replacing
+        the rows of the days it recomputed. Re-running a day gives the same rows,
+        so a run that fails before moving the watermark, or two workers running
+        at once, never count a classification twice.
+        
+        Args:
+            now: Current time (for tests)
+            
+        Returns:
+            datetime: The new watermark
+        """
+        self._try_flush()
+        until = (now or datetime.now()) - self.rollup_grace
+        watermark = (self.statistics.find_one({"_id": "rollup_watermark"}) or {}).get("timestamp")
+        
+        match = {"timestamp": {"$lt": until}, "category": {"$type": "string"}}
+        if watermark is not None:
+            match["timestamp"]["$gte"] = timeseries.bucket_start(watermark, 'day')
+        
+        self.classifications.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                    "category": "$category"
+                },
+                "count": {"$sum": 1},
+                "confidence_sum": {"$sum": "$confidence"}
+            }},
+            {"$project": {
+                "_id": {"$concat": ["$_id.date", ":", "$_id.category"]},
+                "date": "$_id.date",
+                "category": "$_id.category",
+                "count": 1,
+                "confidence_sum": 1
+            }},
+            {"$merge": {
+                "into": self.rollups.name,
+                "on": "_id",
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ])
+        
+        # $max: a slower concurrent run never moves the watermark back
+        self.statistics.update_one(
+            {"_id": "rollup_watermark"},
+            {"$max": {"timestamp": until}},
+            upsert=True
+        )
+        return until
+    
+    def start_rollups(self, interval_seconds):
+        """
+        Refresh the rollups now and then every interval_seconds, in a
+        background thread stopped by close().
+        
+        Args:
+            interval_seconds: Seconds between runs
+        """
+        def run():
+            while True:
+                try:
+                    self.refresh_rollups()
+                except Exception as e:
+                    print(f"Error refreshing classification rollups: {e}")
+                if self._rollup_stop.wait(interval_seconds):
+                    return
+        
+        threading.Thread(target=run, daemon=True).start()
+    
+    def get_rollups(self, group='day', start=None, end=None, category=None):
+        """
+        Get per-category counts and average confidence over a date range,
+        read from the rollups (up to the last refresh_rollups run).
+        
+        Args:
+            group: Period of each point: 'day', 'week' or 'month'
+            start: First day (YYYY-MM-DD, defaults to 30 days before end)
+            end: Last day (YYYY-MM-DD, defaults to today)
+            category: Only include this category if provided
+            
+        Returns:
+            list: {'start', 'total', 'categories'} per period (see utils.rollups.summarize)
+            
+        Raises:
+            ValueError: If the group or range is invalid
+        """
+        start, end = rollups.parse_range(group, start, end)
+        query = {"date": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+        if category:
+            query["category"] = category
+        rows = self.rollups.find(query, {"_id": 0, "date": 1, "category": 1, "count": 1, "confidence_sum": 1})
+        return rollups.summarize(rows, group, start, end)
+    
     def migrate_from_file_based(self, file_stats):
         """
         Migrate data from file-based stats to MongoDB.
@@ -240,7 +846,7 @@ class MongoDBStats:
         """
         try:
             # Get all data from file-based stats
-            stats_data = file_stats.get_stats(days=365)  # Get all available daily data
+            stats_data = file_stats.export_aggregates()  # All retained daily data, with histograms
             
             # Import global stats
             self.statistics.replace_one(
@@ -253,6 +859,8 @@ class MongoDBStats:
                 },
                 upsert=True
             )
+            # The file stats keep running averages
+            migrate_confidence_sums(self.db)
             
             # Import daily stats
             for date, daily_data in stats_data.get("daily", {}).items():
@@ -262,7 +870,8 @@ class MongoDBStats:
                         "_id": date,
                         "date": date,
                         "total": daily_data.get("total", 0),
-                        "categories": daily_data.get("categories", {})
+                        "categories": daily_data.get("categories", {}),
+                        "histograms": daily_data.get("histograms", {})
                     },
                     upsert=True
                 )
@@ -278,6 +887,13 @@ class MongoDBStats:
                         item["_id"] = item_id
                         self.classifications.insert_one(item)
             
+            # The file history keeps ISO string timestamps
+            migrate_timestamps_to_dates(self.db)
+            
+            # Count the migrated history, and roll it up again on the next refresh
+            migrate_history_counts(self.db)
+            self.statistics.delete_one({"_id": "rollup_watermark"})
+            
             return True
             
         except Exception as e:
@@ -0,0 +1,157 @@
+"""
+Optional process pool for the CPU-bound image preprocessing stage.
+
+Decode, resize, autocontrast and JPEG encode hold the GIL for most of their
+runtime, so in a threaded server concurrent requests serialize on it. Running
+utils.image_processing.optimize_image_bytes in worker processes (bytes in,
+bytes out) lets them use every core.
+"""
+import os
+import threading
+import multiprocessing
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.image_processing import configure_decoder_limits, MAX_IMAGE_PIXELS
+
+# Process pool singleton
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_cpu_count():
+    """
+    Get the number of CPUs this process may run on.
+
+    Returns:
+        int: Usable CPU count (respects CPU affinity and container cpusets)
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def parse_worker_count(value):
+    """
+    Parse a PREPROCESS_WORKERS setting.
+
+    Args:
+        value: 'auto' (one worker per CPU), '0'/'' (disabled) or a number
+
+    Returns:
+        int: Number of worker processes, 0 if the pool is disabled
+    """
+    if value is None or str(value).strip() == '':
+        return 0
+    if str(value).strip().lower() == 'auto':
+        return get_cpu_count()
+    return max(0, int(value))
+
+def _limit_worker_memory(limit_bytes):
+    """
+    Cap the address space of a worker process.
+    
+    An allocation beyond the cap raises MemoryError inside the worker (and is
+    reported for that image only) instead of letting the OOM killer pick a
+    process.
+    """
+    if resource is not None and limit_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+def _init_worker(limit_bytes, max_pixels):
+    """Set up a worker process: memory cap and Pillow decode limits."""
+    _limit_worker_memory(limit_bytes)
+    configure_decoder_limits(max_pixels)
+
+class PreprocessPool:
+    """
+    Process pool for image preprocessing that recovers from dead workers.
+    """
+
+    def __init__(self, max_workers=None, memory_limit_bytes=None, max_pixels=MAX_IMAGE_PIXELS):
+        """
+        Initialize the pool. Worker processes are started on first use.
+
+        Args:
+            max_workers: Number of worker processes (defaults to the CPU count)
+            memory_limit_bytes: Address space limit of each worker (None for no limit)
+            max_pixels: Pillow decompression bomb threshold in the workers
+        """
+        self.max_workers = max_workers or get_cpu_count()
+        self.memory_limit_bytes = memory_limit_bytes
+        self.max_pixels = max_pixels
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver/spawn avoid forking a process that holds locks
+                # from the server's threads (database clients, logging...)
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_bytes, self.max_pixels)
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Submit a call to the pool (same interface as Executor.submit).
+
+        If a worker died (e.g. killed by the OOM killer) the broken executor
+        is replaced by a new one before submitting.
+
+        Returns:
+            concurrent.futures.Future: The pending result
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            return self._get_executor().submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """Stop the worker processes."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+def get_preprocess_pool(max_workers=None, memory_limit_bytes=None, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Get the shared preprocessing pool (singleton pattern).
+
+    Args:
+        max_workers: Number of worker processes used when the pool is created
+        memory_limit_bytes: Address space limit of each worker process
+        max_pixels: Pillow decompression bomb threshold in the workers
+
+    Returns:
+        PreprocessPool: The shared pool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PreprocessPool(max_workers, memory_limit_bytes, max_pixels)
+        return _pool
+
+def shutdown_preprocess_pool():
+    """Shut down the shared preprocessing pool if it was created."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
@@ -0,0 +1,107 @@
+"""
+Local storage for the display renditions (thumbnail, medium) of uploads.
+
+Renditions are stored once per distinct upload under the SHA-256 of the
+original bytes, so their file names never change content and can be cached
+by browsers indefinitely.
+"""
+import os
+import re
+import hashlib
+import threading
+from utils.image_processing import create_renditions_from_bytes, RENDITION_SIZES, DEFAULT_ENCODER_PROFILE
+
+# File extension for each rendition MIME type
+RENDITION_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+    'image/avif': 'avif',
+    'image/png': 'png'
+}
+
+# <sha256>_<rendition name>.<extension>
+_FILENAME_PATTERN = re.compile(r'^[0-9a-f]{64}_[a-z]+\.[a-z]+$')
+
+class RenditionStore:
+    """
+    File-based store for image renditions.
+    """
+
+    def __init__(self, directory='./stats/renditions', sizes=RENDITION_SIZES, encoder=DEFAULT_ENCODER_PROFILE):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Directory to store rendition files
+            sizes: Rendition names and maximum sizes (see create_renditions)
+            encoder: Encoder profile used for renditions generated by the store
+        """
+        # Convert relative paths to absolute paths if they are relative
+        if not os.path.isabs(directory):
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            directory = os.path.join(base_dir, directory)
+
+        self.directory = directory
+        self.sizes = sizes
+        self.encoder = encoder
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _existing(self, image_hash):
+        """Get the stored rendition files of an image, by rendition name."""
+        found = {}
+        for name in self.sizes:
+            for extension in RENDITION_EXTENSIONS.values():
+                filename = f"{image_hash}_{name}.{extension}"
+                if os.path.exists(os.path.join(self.directory, filename)):
+                    found[name] = filename
+                    break
+        return found
+
+    def save(self, image_bytes, renditions=None):
+        """
+        Store the renditions of an upload, unless they are already stored.
+
+        Args:
+            image_bytes: The original upload as bytes
+            renditions: Renditions already encoded from the decoded image
+                        (name -> (bytes, MIME type)); generated from
+                        image_bytes when missing
+
+        Returns:
+            dict: Rendition name -> file name
+        """
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+        existing = self._existing(image_hash)
+        if all(name in existing for name in self.sizes):
+            return existing
+
+        if not renditions:
+            renditions = create_renditions_from_bytes(image_bytes, self.sizes, self.encoder)
+
+        filenames = {}
+        for name, (data, mime_type) in renditions.items():
+            filename = f"{image_hash}_{name}.{RENDITION_EXTENSIONS.get(mime_type, 'bin')}"
+            path = os.path.join(self.directory, filename)
+            # Write to a temporary file first so readers never see partial files;
+            # its name is unique per thread, as requests may save the same image
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            filenames[name] = filename
+
+        return filenames
+
+    def is_valid_filename(self, filename):
+        """
+        Check that a requested file name is a rendition of this store.
+
+        Args:
+            filename: The requested file name
+
+        Returns:
+            bool: True if the name has the rendition format
+        """
+        return bool(_FILENAME_PATTERN.match(filename))
@@ -0,0 +1,118 @@
+"""
+Per-category, per-day rollups of the classification history.
+
+Analytics over date ranges (confidence by category per week, how often a
+category shows up over time, ...) are answered from rollup rows instead of
+the raw history. A row is {'date': 'YYYY-MM-DD', 'category', 'count',
+'confidence_sum'}; queries group the rows of a range into day, week
+(starting on Monday) or month periods.
+
+In MongoDB the rows are materialized in the classification_rollups
+collection by a periodic aggregation (see MongoDBStats.refresh_rollups);
+the file-based stats already keep them in their daily data.
+"""
+from datetime import date, datetime, timedelta
+
+GROUPS = ('day', 'week', 'month')
+
+# Range returned when the request gives no start
+DEFAULT_DAYS = 30
+
+# Longest range a query may cover
+MAX_DAYS = 3 * 366
+
+def period_start(day, group):
+    """
+    Get the first day of the period holding a day.
+
+    Args:
+        day: date
+        group: 'day', 'week' or 'month'
+
+    Returns:
+        date: The period start
+    """
+    if group == 'week':
+        return day - timedelta(days=day.weekday())
+    if group == 'month':
+        return day.replace(day=1)
+    return day
+
+def parse_range(group, start=None, end=None, today=None):
+    """
+    Validate a rollup query and fill in its defaults.
+
+    Args:
+        group: 'day', 'week' or 'month'
+        start: First day of the range (YYYY-MM-DD, defaults to DEFAULT_DAYS before end)
+        end: Last day of the range (YYYY-MM-DD, defaults to today)
+        today: Current date (for tests)
+
+    Returns:
+        tuple: (start, end) dates, start moved back to the start of its period
+
+    Raises:
+        ValueError: If the group or a date is invalid, start is after end or
+                    the range is longer than MAX_DAYS
+    """
+    if group not in GROUPS:
+        raise ValueError(f"Invalid group '{group}', use one of: {', '.join(GROUPS)}")
+    try:
+        end = date.fromisoformat(end) if end else (today or datetime.now().date())
+        start = date.fromisoformat(start) if start else end - timedelta(days=DEFAULT_DAYS - 1)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date, use YYYY-MM-DD")
+    if start > end:
+        raise ValueError("start must be before end")
+    start = period_start(start, group)
+    if (end - start).days >= MAX_DAYS:
+        raise ValueError(f"Range too long, at most {MAX_DAYS} days")
+    return start, end
+
+def summarize(rows, group, start, end):
+    """
+    Group rollup rows into the periods of a range.
+
+    Args:
+        rows: Iterable of {'date', 'category', 'count', 'confidence_sum'};
+              confidence_sum may be None if unknown
+        group: 'day', 'week' or 'month'
+        start: First day of the range (a period start, from parse_range)
+        end: Last day of the range
+
+    Returns:
+        list: {'start', 'total', 'categories': {category: {'count', 'avg_confidence'}}}
+              per period, oldest first, zeros where nothing was classified
+    """
+    periods = {}
+    day = start
+    while day <= end:
+        periods.setdefault(period_start(day, group).isoformat(), {})
+        day += timedelta(days=1)
+
+    for row in rows:
+        day = date.fromisoformat(row['date'])
+        categories = periods.get(period_start(day, group).isoformat())
+        if categories is None or day > end:
+            continue
+        totals = categories.setdefault(row['category'], {'count': 0, 'confidence_sum': 0, 'confidence_count': 0})
+        totals['count'] += row['count']
+        if row.get('confidence_sum') is not None:
+            totals['confidence_sum'] += row['confidence_sum']
+            totals['confidence_count'] += row['count']
+
+    points = []
+    for period, categories in periods.items():
+        points.append({
+            'start': period,
+            'total': sum(totals['count'] for totals in categories.values()),
+            'categories': {
+                name: {
+                    'count': totals['count'],
+                    'avg_confidence': (round(totals['confidence_sum'] / totals['confidence_count'], 2)
+                                       if totals['confidence_count'] else None)
+                }
+                for name, totals in categories.items()
+            }
+        })
+    return points
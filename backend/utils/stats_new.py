@@ -3,25 +3,64 @@ import json
 import base64
 import time
 import hashlib
+import threading
 import requests
 from datetime import datetime, timedelta
 from collections import defaultdict
 from config import Config
 from utils.imagebb import upload_image_to_imagebb
-from utils.image_url_helpers import prepare_image_urls_for_frontend
+from utils.image_url_helpers import prepare_image_urls_for_frontend, compact_history_item
+from utils.event_log import EventLog
+from utils.history_index import HistoryIndex
+from utils.history_cursor import decode_cursor
+from utils import confidence_histogram, rollups, timeseries
+
+def _upload_index_entry(upload_result):
+    """Keep the URL fields of an ImageBB upload result for the dedupe index."""
+    return {
+        'url': upload_result.get('url'),
+        'thumb': {'url': upload_result.get('thumb', {}).get('url')},
+        'medium': {'url': upload_result.get('medium', {}).get('url')},
+        'delete_url': upload_result.get('delete_url')
+    }
+
+def _apply_upload_result(metadata, upload_result):
+    """Fill a history record with ImageBB URLs, keeping local renditions."""
+    metadata['image_url'] = upload_result.get('url')
+    metadata['image_thumbnail'] = metadata.get('image_thumbnail') or upload_result.get('thumb', {}).get('url')
+    metadata['image_medium'] = metadata.get('image_medium') or upload_result.get('medium', {}).get('url')
+    metadata['delete_url'] = upload_result.get('delete_url')
+    if 'upload_status' in metadata:
+        metadata['upload_status'] = 'uploaded'
 
 class ClassificationStats:
     """
     Tracks statistics for image classifications.
     """
     
-    def __init__(self, stats_file='./stats/classification_stats.json', history_dir='./stats/history'):
+    def __init__(self, stats_file='./stats/classification_stats.json', history_dir='./stats/history',
+                 upload_outbox=None, image_store=None, upload_index_file=None, compact_every=1000,
+                 flush_interval_ms=200, flush_batch=100, retention_days=30, compact_interval=3600):
         """
         Initialize the statistics tracker.
         
         Args:
             stats_file: File path to store statistics
             history_dir: Directory to store classification history with images
+            upload_outbox: Optional UploadOutbox; images are then uploaded in the
+                           background instead of while recording
+            image_store: Optional LocalImageStore used instead of ImageBB
+            upload_index_file: Log mapping image SHA-256 to uploaded URLs
+                               (defaults to upload_index.log next to stats_file)
+            compact_every: Classifications appended to the event log before it
+                           is compacted into the stats_file snapshot
+            flush_interval_ms: Maximum time classifications stay buffered in
+                               memory before being appended to the event log
+            flush_batch: Buffered classifications that trigger an immediate flush
+            retention_days: Days of daily stats kept, older ones are dropped
+                            when the log is compacted
+            compact_interval: Seconds after which a non-empty log is compacted
+                              even with fewer than compact_every events
         """
         # Convert relative paths to absolute paths if they are relative
         if not os.path.isabs(stats_file):
@@ -35,6 +74,9 @@ class ClassificationStats:
         self.stats_file = stats_file
         self.stats_dir = os.path.dirname(stats_file)
         self.history_dir = history_dir
+        self.upload_outbox = upload_outbox
+        self.image_store = image_store
+        self.upload_index_file = upload_index_file or os.path.join(self.stats_dir, 'upload_index.log')
         
         print(f"Stats file: {self.stats_file}")
         print(f"History directory: {self.history_dir}")
@@ -43,18 +85,131 @@ class ClassificationStats:
         os.makedirs(self.stats_dir, exist_ok=True)
         os.makedirs(self.history_dir, exist_ok=True)
         
-        # Initialize or load stats
+        # Uploaded images by content hash. Each upload is appended to a log
+        # shared by all processes; the entries other processes appended are
+        # read from the last position read on a lookup miss.
+        self._upload_index_lock = threading.Lock()
+        self.upload_log = EventLog(self.upload_index_file)
+        with self._upload_index_lock, self.upload_log.locked():
+            self._upload_index = {}
+            self._upload_index_position = (None, 0)
+            self._refresh_upload_index()
+            if not self._upload_index:
+                self._import_upload_index_json(os.path.join(self.stats_dir, 'upload_index.json'))
+        
+        # History records ordered by timestamp, with a per-category index
+        self.history_index = HistoryIndex(self.history_dir)
+        
+        # Classifications are appended to an event log; stats_file is a
+        # snapshot of the aggregates, refreshed when the log is compacted.
+        # Several processes can share both: each keeps its own aggregates
+        # and merges the events the others logged whenever it flushes.
+        self.log_file = os.path.splitext(self.stats_file)[0] + '.log'
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_batch = flush_batch
+        self.event_log = EventLog(self.log_file)
+        
+        # Guards the aggregates and the buffer of classifications not yet logged
+        self._lock = threading.RLock()
+        self._pending = []
+        self._flush_wakeup = threading.Event()
+        self._flusher = None
+        self._closed = False
+        self._last_compaction = time.monotonic()
+        
+        # get_stats summaries by days, valid while the aggregates and the date don't change
+        self._version = 0
+        self._summaries = {}
+        
+        with self._lock, self.event_log.locked():
+            self._rebuild()
+    
+    def _rebuild(self):
+        """
+        Rebuild the aggregates from the snapshot plus the log tail, then
+        re-apply the buffered classifications. Caller holds both locks.
+        """
         self.stats = self._load_stats()
+        self._version += 1
+        events, self._log_position = self.event_log.read_since(self.stats.get('log_id'),
+                                                               self.stats.get('log_offset', 0))
+        for event in events + self._pending:
+            self._apply_event(event)
+        self._logged_since_compaction = len(events)
+    
+    def _merge_logged_events(self):
+        """
+        Apply the events other processes logged since our last flush.
+        Caller holds both locks.
+        """
+        if self.event_log.read_log_id() != self._log_position[0]:
+            # Another process compacted the log; its snapshot includes our logged events
+            self._rebuild()
+            return
+        events, self._log_position = self.event_log.read_since(*self._log_position)
+        for event in events:
+            self._apply_event(event)
+        self._logged_since_compaction += len(events)
+    
+    def _flush_locked(self, compact=False):
+        """
+        Merge other processes' events, append the buffered ones and compact
+        the log if due. Caller holds both locks.
+        
+        Args:
+            compact: Compact even if fewer than compact_every events are logged
+        """
+        self._merge_logged_events()
+        if self._pending:
+            self._log_position = self.event_log.append(self._pending)
+            self._logged_since_compaction += len(self._pending)
+            self._pending = []
+        overdue = time.monotonic() - self._last_compaction >= self.compact_interval
+        if compact or self._logged_since_compaction >= self.compact_every or \
+                (overdue and self._logged_since_compaction):
+            self._save_stats()
+    
+    def flush(self):
+        """Write buffered classifications to the event log and pick up other processes' ones."""
+        with self._lock, self.event_log.locked():
+            self._flush_locked()
+    
+    def _flush_loop(self):
+        """Background thread flushing the buffer at most flush_interval after a classification."""
+        while True:
+            self._flush_wakeup.wait()
+            self._flush_wakeup.clear()
+            time.sleep(self.flush_interval)
+            if self._closed:
+                return  # close() flushes
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error flushing stats to {self.log_file}: {e}")
+    
+    def close(self):
+        """Flush buffered classifications and stop the background flush thread."""
+        self._closed = True
+        self._flush_wakeup.set()
+        self.flush()
     
     def _load_stats(self):
-        """Load statistics from file or create new if not exists."""
+        """Load the statistics snapshot or create new stats if not exists."""
         if os.path.exists(self.stats_file):
             try:
                 with open(self.stats_file, 'r') as f:
                     return json.load(f)
-            except (json.JSONDecodeError, OSError):
-                # If there's any error reading the file, create new stats
-                pass
+            except (json.JSONDecodeError, OSError) as e:
+                # Keep the damaged snapshot for inspection instead of overwriting it
+                corrupt_path = f"{self.stats_file}.corrupt-{int(time.time())}"
+                print(f"Error reading stats file {self.stats_file} ({e}), moved to {corrupt_path}")
+                try:
+                    os.replace(self.stats_file, corrupt_path)
+                except OSError:
+                    pass
         
         # Initialize new stats structure
         return {
@@ -65,21 +220,42 @@ class ClassificationStats:
         }
     
     def _save_stats(self):
-        """Save statistics to file."""
+        """
+        Compact the event log: write a snapshot of the aggregates, then
+        start a new, empty log. Caller holds both locks and has merged the log.
+        """
+        self._prune_daily_data()
+        self.stats['log_id'], self.stats['log_offset'] = self._log_position
         try:
-            with open(self.stats_file, 'w') as f:
+            # Write to a temporary file first so a crash never leaves a partial snapshot
+            temp_path = f"{self.stats_file}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
                 json.dump(self.stats, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.stats_file)
         except OSError:
             print(f"Error writing to stats file {self.stats_file}")
+            return
+        
+        # The snapshot covers every logged event, so the log can start over
+        self._log_position = self.event_log.rotate()
+        self._logged_since_compaction = 0
+        self._last_compaction = time.monotonic()
     
-    def record_classification(self, category, confidence):
+    def _apply_event(self, event):
         """
-        Record a new classification.
+        Add a logged classification to the in-memory aggregates.
         
         Args:
-            category: The classified category
-            confidence: The confidence score
+            event: Dict with 'timestamp', 'category' and 'confidence'
         """
+        category = event['category']
+        confidence = event['confidence']
+        timestamp = event['timestamp']
+        
+        self._version += 1
+        
         # Update total count
         self.stats['total_classifications'] += 1
         
@@ -97,9 +273,10 @@ class ClassificationStats:
             (cat_stats['count'] + 1)
         )
         cat_stats['count'] += 1
+        confidence_histogram.add(cat_stats.setdefault('histogram', {}), confidence)
         
         # Update daily stats
-        today = datetime.now().strftime('%Y-%m-%d')
+        today = timestamp[:10]
         if today not in self.stats['daily']:
             self.stats['daily'][today] = {
                 'total': 0,
@@ -112,65 +289,189 @@ class ClassificationStats:
         if category not in daily['categories']:
             daily['categories'][category] = 0
         daily['categories'][category] += 1
+        confidence_histogram.add(daily.setdefault('histograms', {}).setdefault(category, {}), confidence)
+        sums = daily.setdefault('confidence_sums', {})
+        sums[category] = sums.get(category, 0) + confidence
+        
+        # Update the minute and hour ring buffers
+        series = self.stats.setdefault('timeseries', {})
+        for resolution in timeseries.RESOLUTIONS:
+            timeseries.add(series.setdefault(resolution, {}), resolution, timestamp, category)
         
         # Update last updated timestamp
-        self.stats['last_updated'] = datetime.now().isoformat()
+        self.stats['last_updated'] = timestamp
+    
+    def record_classification(self, category, confidence):
+        """
+        Record a new classification.
         
-        # Save to file
-        self._save_stats()
+        Args:
+            category: The classified category
+            confidence: The confidence score
+        """
+        event = {
+            'timestamp': datetime.now().isoformat(),
+            'category': category,
+            'confidence': confidence
+        }
+        with self._lock:
+            self._apply_event(event)
+            
+            # Buffer for the event log instead of rewriting the whole stats file
+            self._pending.append(event)
+            if len(self._pending) >= self.flush_batch or self._closed:
+                self.flush()
+            elif self._flusher is None or not self._flusher.is_alive():
+                # Started lazily, so it also runs in forked worker processes
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+            self._flush_wakeup.set()
     
     def get_stats(self, days=7):
         """
-        Get classification statistics.
+        Get classification statistics. Only reads: old daily data is dropped
+        when the log is compacted, not here.
         
         Args:
             days: Number of days to include in daily stats
             
         Returns:
-            dict: Statistics data
+            dict: Statistics data (shared between callers, do not modify)
         """
-        # Clean up old daily data
-        self._cleanup_old_daily_data(days)
-        
-        # Get recent daily stats
-        recent_dates = self._get_recent_dates(days)
-        daily_stats = {}
-        
-        for date in recent_dates:
-            if date in self.stats['daily']:
-                daily_stats[date] = self.stats['daily'][date]
-            else:
-                daily_stats[date] = {'total': 0, 'categories': {}}
-        
-        # Prepare summary
-        summary = {
-            'total_classifications': self.stats['total_classifications'],
-            'categories': self.stats['categories'],
-            'daily': daily_stats,
-            'last_updated': self.stats['last_updated']
-        }
+        with self._lock, self.event_log.locked():
+            # Include the classifications other processes logged
+            self._merge_logged_events()
+            
+            today = datetime.now().strftime('%Y-%m-%d')
+            cached = self._summaries.get(days)
+            if cached and cached[0] == (self._version, today):
+                return cached[1]
+            
+            # Get recent daily stats
+            recent_dates = self._get_recent_dates(days)
+            daily_stats = {}
+            
+            for date in recent_dates:
+                if date in self.stats['daily']:
+                    daily = self.stats['daily'][date]
+                    daily_stats[date] = {
+                        'total': daily['total'],
+                        'categories': dict(daily['categories']),
+                        'percentiles': {
+                            name: confidence_histogram.percentiles(histogram)
+                            for name, histogram in daily.get('histograms', {}).items()
+                        }
+                    }
+                else:
+                    daily_stats[date] = {'total': 0, 'categories': {}, 'percentiles': {}}
+            
+            # Prepare summary (copies, as the aggregates keep changing)
+            categories = {}
+            for name, data in self.stats['categories'].items():
+                categories[name] = {
+                    'count': data['count'],
+                    'avg_confidence': data['avg_confidence'],
+                    'percentiles': confidence_histogram.percentiles(data.get('histogram'))
+                }
+            summary = {
+                'total_classifications': self.stats['total_classifications'],
+                'categories': categories,
+                'daily': daily_stats,
+                'last_updated': self.stats['last_updated']
+            }
+            self._summaries[days] = ((self._version, today), summary)
         
         return summary
     
-    def _cleanup_old_daily_data(self, keep_days=30):
+    def get_timeseries(self, granularity='hour', start=None, end=None):
         """
-        Remove daily data older than keep_days.
+        Get classification counts over time.
         
         Args:
-            keep_days: Number of days to keep
+            granularity: 'minute' (last 6 hours), 'hour' (last 35 days) or
+                         'day' (retention_days)
+            start: ISO start of the range (defaults to a window before end)
+            end: ISO end of the range (defaults to now)
+            
+        Returns:
+            list: {'start', 'total', 'categories'} per bucket, oldest first
+            
+        Raises:
+            ValueError: If the granularity or range is invalid
         """
-        if 'daily' not in self.stats:
-            return
+        start, end = timeseries.parse_range(granularity, start, end)
+        with self._lock, self.event_log.locked():
+            self._merge_logged_events()
+            if granularity == 'day':
+                starts = timeseries.bucket_range(granularity, start, end, retained=self.retention_days + 1)
+                buckets = self.stats['daily']
+            else:
+                starts = timeseries.bucket_range(granularity, start, end,
+                                                 retained=timeseries.RESOLUTIONS[granularity][1])
+                ring = self.stats.get('timeseries', {}).get(granularity, {})
+                buckets = {bucket['start']: bucket for bucket in ring.values()}
+            return timeseries.points(starts, granularity, buckets)
+    
+    def get_rollups(self, group='day', start=None, end=None, category=None):
+        """
+        Get per-category counts and average confidence over a date range.
         
-        cutoff_date = (datetime.now() - timedelta(days=keep_days)).strftime('%Y-%m-%d')
-        new_daily = {}
+        The rollups are the daily stats, so they cover the last retention_days.
+        
+        Args:
+            group: Period of each point: 'day', 'week' or 'month'
+            start: First day (YYYY-MM-DD, defaults to 30 days before end)
+            end: Last day (YYYY-MM-DD, defaults to today)
+            category: Only include this category if provided
+            
+        Returns:
+            list: {'start', 'total', 'categories'} per period (see utils.rollups.summarize)
+            
+        Raises:
+            ValueError: If the group or range is invalid
+        """
+        start, end = rollups.parse_range(group, start, end)
+        first, last = start.isoformat(), end.isoformat()
+        with self._lock, self.event_log.locked():
+            self._merge_logged_events()
+            rows = [
+                {
+                    'date': day,
+                    'category': name,
+                    'count': count,
+                    # Days recorded before confidence sums were kept have none
+                    'confidence_sum': data.get('confidence_sums', {}).get(name)
+                }
+                for day, data in self.stats['daily'].items() if first <= day <= last
+                for name, count in data['categories'].items() if not category or name == category
+            ]
+        return rollups.summarize(rows, group, start, end)
+    
+    def export_aggregates(self):
+        """
+        Get a copy of the raw aggregates: every retained day and the
+        confidence histograms (used to migrate to MongoDB).
         
-        for date, data in self.stats['daily'].items():
-            if date >= cutoff_date:
-                new_daily[date] = data
+        Returns:
+            dict: 'total_classifications', 'categories', 'daily' and 'last_updated'
+        """
+        with self._lock, self.event_log.locked():
+            self._merge_logged_events()
+            aggregates = json.loads(json.dumps(self.stats))
+        aggregates.pop('log_id', None)
+        aggregates.pop('log_offset', None)
+        return aggregates
+    
+    def _prune_daily_data(self):
+        """
+        Remove daily data older than retention_days. Caller holds both locks.
+        """
+        cutoff_date = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        new_daily = {date: data for date, data in self.stats['daily'].items() if date >= cutoff_date}
         
-        self.stats['daily'] = new_daily
-        self._save_stats()
+        if len(new_daily) != len(self.stats['daily']):
+            self.stats['daily'] = new_daily
+            self._version += 1
     
     def _get_recent_dates(self, days=7):
         """
@@ -191,7 +492,8 @@ class ClassificationStats:
         
         return sorted(dates)
     
-    def record_classification_with_image(self, category, confidence, image_data, original_filename=None):
+    def record_classification_with_image(self, category, confidence, image_data, original_filename=None,
+                                         renditions=None):
         """
         Record a new classification with the image.
         
@@ -200,6 +502,8 @@ class ClassificationStats:
             confidence: The confidence score
             image_data: The image data (file-like object or bytes)
             original_filename: Original filename if available
+            renditions: URLs of locally stored renditions ('thumb', 'medium'),
+                        preferred over the ImageBB ones
         
         Returns:
             str: The unique ID of the recorded classification
@@ -223,12 +527,8 @@ class ClassificationStats:
             else:
                 img_bytes = image_data
             
-            # Upload the image to ImageBB
+            renditions = renditions or {}
             image_name = original_filename or f"{category}_{unique_id}.jpg"
-            upload_result = upload_image_to_imagebb(img_bytes, name=image_name)
-            
-            if not upload_result:
-                raise Exception("Failed to upload image to ImageBB")
             
             # Create metadata for this classification
             metadata = {
@@ -237,18 +537,40 @@ class ClassificationStats:
                 'category': category,
                 'confidence': confidence,
                 'original_filename': original_filename or 'unknown.jpg',
-                'image_url': upload_result.get('url'),
-                'image_thumbnail': upload_result.get('thumb', {}).get('url'),
-                'image_medium': upload_result.get('medium', {}).get('url'),
-                'delete_url': upload_result.get('delete_url')
+                'image_url': None,
+                'image_thumbnail': renditions.get('thumb'),
+                'image_medium': renditions.get('medium'),
+                'delete_url': None
             }
             
-            # Save the metadata
-            metadata_path = os.path.join(self.history_dir, f"{unique_id}.json")
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            image_hash = hashlib.sha256(img_bytes).hexdigest()
+            metadata['image_hash'] = image_hash
+            
+            previous_upload = self.find_upload(image_hash) if self.image_store is None else None
+            if self.image_store is not None:
+                # Store the image locally (no external round trip)
+                upload_result = self.image_store.save(img_bytes, name=image_name)
+            elif previous_upload:
+                # The same image was uploaded before: reuse its URLs
+                upload_result = previous_upload
+            elif self.upload_outbox is not None:
+                # Save the record now and upload the image in the background
+                metadata['upload_status'] = 'pending'
+                self._add_record(metadata)
+                self.upload_outbox.enqueue(unique_id, img_bytes, name=image_name)
+                return unique_id
+            else:
+                # Upload the image to ImageBB
+                upload_result = upload_image_to_imagebb(img_bytes, name=image_name)
+                
+                if not upload_result:
+                    raise Exception("Failed to upload image to ImageBB")
+                self.remember_upload(image_hash, upload_result)
+            
+            _apply_upload_result(metadata, upload_result)
+            self._add_record(metadata)
                 
-            print(f"Image uploaded to ImageBB: {upload_result.get('url')}")
+            print(f"Image saved for history: {upload_result.get('url')}")
             return unique_id
             
         except Exception as e:
@@ -258,7 +580,123 @@ class ClassificationStats:
             traceback.print_exc()
             return None
     
-    def get_classification_history(self, limit=50, offset=0, category=None):
+    def count_history(self, category=None):
+        """
+        Count the history records.
+        
+        Args:
+            category: Only count this category if provided
+            
+        Returns:
+            int: Number of records
+        """
+        return self.history_index.count(category)
+    
+    def _add_record(self, metadata):
+        """Write a new history record and add it to the history index."""
+        self._write_metadata(metadata)
+        self.history_index.add(metadata)
+    
+    def _write_metadata(self, metadata, keep_mtime=False):
+        """
+        Write a history record atomically.
+        
+        Args:
+            metadata: The record
+            keep_mtime: Keep the file's modification time (when the record was created)
+        """
+        metadata_path = os.path.join(self.history_dir, f"{metadata['id']}.json")
+        times = None
+        if keep_mtime and os.path.exists(metadata_path):
+            stat = os.stat(metadata_path)
+            times = (stat.st_atime, stat.st_mtime)
+        
+        temp_path = f"{metadata_path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        if times:
+            os.utime(temp_path, times)
+        os.replace(temp_path, metadata_path)
+    
+    def apply_upload_result(self, record_id, upload_result):
+        """
+        Patch a history record with the result of its background upload
+        (callback of UploadOutbox).
+        
+        Args:
+            record_id: The record ID
+            upload_result: ImageBB upload data, or None if the upload failed for good
+        """
+        metadata_path = os.path.join(self.history_dir, f"{record_id}.json")
+        with open(metadata_path, 'r') as f:
+            metadata = json.load(f)
+        
+        if upload_result:
+            _apply_upload_result(metadata, upload_result)
+            if metadata.get('image_hash'):
+                self.remember_upload(metadata['image_hash'], upload_result)
+        else:
+            metadata['upload_status'] = 'failed'
+        self._write_metadata(metadata, keep_mtime=True)
+    
+    def _refresh_upload_index(self):
+        """Read the uploads other processes appended to the index log (call with the lock held)."""
+        events, self._upload_index_position = self.upload_log.read_since(*self._upload_index_position)
+        for event in events:
+            self._upload_index[event['hash']] = event['upload']
+    
+    def _import_upload_index_json(self, path):
+        """Append the entries of the former JSON upload index to the log (call with both locks held)."""
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error reading upload index {path}: {e}")
+            return
+        if entries:
+            self.upload_log.append([{'hash': image_hash, 'upload': upload} for image_hash, upload in entries.items()])
+            self._refresh_upload_index()
+            print(f"Imported {len(entries)} uploads from {path}")
+    
+    def find_upload(self, image_hash):
+        """
+        Look up the ImageBB URLs of an image uploaded before.
+        
+        Args:
+            image_hash: SHA-256 of the image bytes (hex)
+            
+        Returns:
+            dict: Upload data (url, thumb, medium, delete_url) or None
+        """
+        with self._upload_index_lock:
+            if image_hash not in self._upload_index:
+                self._refresh_upload_index()
+            return self._upload_index.get(image_hash)
+    
+    def remember_upload(self, image_hash, upload_result):
+        """
+        Add an uploaded image to the hash -> URLs index.
+        
+        Appends a single line to the index log, under its file lock, so the
+        cost does not grow with the number of images and no process
+        overwrites the entries of another.
+        
+        Args:
+            image_hash: SHA-256 of the image bytes (hex)
+            upload_result: ImageBB upload data
+        """
+        entry = _upload_index_entry(upload_result)
+        with self._upload_index_lock:
+            try:
+                with self.upload_log.locked():
+                    self.upload_log.append([{'hash': image_hash, 'upload': entry}])
+            except OSError as e:
+                print(f"Error writing to upload index {self.upload_index_file}: {e}")
+            self._upload_index[image_hash] = entry
+    
+    def get_classification_history(self, limit=50, offset=0, category=None, cursor=None, compact=False):
         """
         Get the classification history.
         
@@ -266,58 +704,86 @@ class ClassificationStats:
             limit: Maximum number of entries to return
             offset: Offset for pagination
             category: Filter by category if provided
+            cursor: Return the entries after this cursor (see utils.history_cursor)
+            compact: Return only the list view fields (see compact_history_item)
             
         Returns:
             list: List of classification entries with metadata
+            
+        Raises:
+            ValueError: If the cursor is malformed
         """
         history = []
+        before = decode_cursor(cursor) if cursor else None
         
         try:
-            # Get all JSON metadata files in history directory
-            metadata_files = [f for f in os.listdir(self.history_dir) if f.endswith('.json')]
+            # Read only the records on the requested page
+            keys = self.history_index.page(limit=limit, offset=offset, category=category, before=before)
             
-            # Sort by modification time (newest first)
-            metadata_files.sort(key=lambda f: os.path.getmtime(os.path.join(self.history_dir, f)), reverse=True)
-            
-            # Apply pagination
-            metadata_files = metadata_files[offset:offset+limit]
-            
-            for metadata_file in metadata_files:
+            for timestamp, record_id in keys:
                 try:
-                    # Load metadata
-                    with open(os.path.join(self.history_dir, metadata_file), 'r') as f:
-                        metadata = json.load(f)
-                    
-                    # Skip if category filter is applied and doesn't match
-                    if category and metadata.get('category', '').lower() != category.lower():
-                        continue
-                    
-                    # For older entries that might not have ImageBB URLs
-                    if 'image_url' not in metadata:
-                        # Check if the corresponding image exists
-                        image_id = metadata.get('id')
-                        image_path = os.path.join(self.history_dir, f"{image_id}.jpg")
-                        if os.path.exists(image_path):
-                            # Read image as base64 for sending to frontend
-                            with open(image_path, 'rb') as img_file:
-                                img_data = img_file.read()
-                                img_base64 = base64.b64encode(img_data).decode('utf-8')
-                            
-                            # Add image data to metadata
-                            metadata['image_data'] = f"data:image/jpeg;base64,{img_base64}"
-                    else:
-                        # Use the ImageBB URLs directly
-                        metadata['image_data'] = metadata['image_url']
-                    
-                    # Process the metadata to ensure all image URLs are properly set
-                    processed_metadata = prepare_image_urls_for_frontend(metadata)
-                    
-                    # Add to history list
-                    history.append(processed_metadata)
+                    metadata = self._load_record(record_id, timestamp, load_image=not compact)
+                    history.append(compact_history_item(metadata) if compact
+                                   else prepare_image_urls_for_frontend(metadata))
                 except Exception as e:
-                    print(f"Error processing history file {metadata_file}: {e}")
+                    print(f"Error processing history file {record_id}.json: {e}")
                     continue
         except Exception as e:
             print(f"Error retrieving classification history: {e}")
         
         return history
+    
+    def get_classification_record(self, record_id):
+        """
+        Get a single classification record with all its fields.
+        
+        Args:
+            record_id: The record ID
+            
+        Returns:
+            dict: The record, or None if there is no such record
+        """
+        # IDs are file names in the history directory
+        if not record_id or os.path.basename(record_id) != record_id or record_id.startswith('.'):
+            return None
+        try:
+            return prepare_image_urls_for_frontend(self._load_record(record_id))
+        except FileNotFoundError:
+            return None
+    
+    def _load_record(self, record_id, timestamp=None, load_image=True):
+        """
+        Read the metadata of a history record.
+        
+        Args:
+            record_id: The record ID
+            timestamp: Index timestamp, for records from before timestamps were stored
+            load_image: Inline the local image of records without ImageBB URLs
+                        as base64 image_data (the list view leaves it out)
+            
+        Returns:
+            dict: The metadata, with image_data set
+        """
+        with open(os.path.join(self.history_dir, f"{record_id}.json"), 'r') as f:
+            metadata = json.load(f)
+        # Records from before timestamps were stored are ordered by mtime
+        if timestamp:
+            metadata.setdefault('timestamp', timestamp)
+        
+        # For older entries that might not have ImageBB URLs
+        if 'image_url' not in metadata:
+            if not load_image:
+                return metadata
+            # Check if the corresponding image exists
+            image_path = os.path.join(self.history_dir, f"{metadata.get('id', record_id)}.jpg")
+            if os.path.exists(image_path):
+                # Read image as base64 for sending to frontend
+                with open(image_path, 'rb') as img_file:
+                    img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
+                
+                # Add image data to metadata
+                metadata['image_data'] = f"data:image/jpeg;base64,{img_base64}"
+        else:
+            # Use the ImageBB URLs directly
+            metadata['image_data'] = metadata['image_url']
+        return metadata
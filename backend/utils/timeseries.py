@@ -0,0 +1,176 @@
+"""
+Multi-resolution time series of classification counts.
+
+Every classification is counted once per resolution when it is recorded
+(downsampling happens at write time, never by scanning the history):
+
+- minute: the last 6 hours
+- hour: the last 35 days
+- day: the daily stats, kept for the stats retention period
+
+Minutes and hours are ring buffers: bucket N goes to slot N % slots and
+replaces whatever older bucket was there, so each resolution holds a fixed
+number of buckets. A bucket is stored as {'start', 'total', 'categories'}.
+"""
+import calendar
+from datetime import datetime, timedelta
+
+# Seconds per bucket and number of buckets kept, by resolution
+RESOLUTIONS = {
+    'minute': (60, 6 * 60),
+    'hour': (3600, 35 * 24)
+}
+
+GRANULARITIES = ('minute', 'hour', 'day')
+
+# Maximum number of buckets returned by a query
+MAX_POINTS = 2000
+
+# Range returned when the request gives no start
+DEFAULT_WINDOWS = {
+    'minute': timedelta(hours=1),
+    'hour': timedelta(days=1),
+    'day': timedelta(days=7)
+}
+
+_FORMATS = {
+    'minute': '%Y-%m-%dT%H:%M',
+    'hour': '%Y-%m-%dT%H:00',
+    'day': '%Y-%m-%d'
+}
+
+def bucket_start(moment, granularity):
+    """
+    Get the start of the bucket holding a moment.
+
+    Args:
+        moment: datetime or ISO timestamp
+        granularity: 'minute', 'hour' or 'day'
+
+    Returns:
+        datetime: The bucket start
+    """
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    if granularity == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def bucket_label(start, granularity):
+    """Format a bucket start as returned by the API (and used as the daily stats key)."""
+    return start.strftime(_FORMATS[granularity])
+
+def step(granularity):
+    """Get the length of a bucket."""
+    return timedelta(days=1) if granularity == 'day' else timedelta(seconds=RESOLUTIONS[granularity][0])
+
+def _slot(start, resolution):
+    """Get the ring buffer slot of a bucket."""
+    seconds, slots = RESOLUTIONS[resolution]
+    return str(calendar.timegm(start.timetuple()) // seconds % slots)
+
+def add(series, resolution, timestamp, category):
+    """
+    Count a classification in a ring buffer (modified in place).
+
+    Args:
+        series: Dict of slot -> bucket for the resolution
+        resolution: 'minute' or 'hour'
+        timestamp: ISO timestamp of the classification
+        category: The classified category
+    """
+    start_time = bucket_start(timestamp, resolution)
+    start = bucket_label(start_time, resolution)
+    slot = _slot(start_time, resolution)
+    bucket = series.get(slot)
+    if bucket is None or bucket['start'] < start:
+        # The slot still holds a bucket from a previous turn of the ring
+        bucket = series[slot] = {'start': start, 'total': 0, 'categories': {}}
+    elif bucket['start'] > start:
+        # Older than the ring's retention (e.g. replayed late)
+        return
+    bucket['total'] += 1
+    bucket['categories'][category] = bucket['categories'].get(category, 0) + 1
+
+def parse_range(granularity, start=None, end=None, now=None):
+    """
+    Validate a time series query and fill in its defaults.
+
+    Args:
+        granularity: 'minute', 'hour' or 'day'
+        start: ISO start of the range (defaults to DEFAULT_WINDOWS before end)
+        end: ISO end of the range (defaults to now)
+        now: Current time (for tests)
+
+    Returns:
+        tuple: (start, end) bucket starts as datetimes
+
+    Raises:
+        ValueError: If the granularity or a date is invalid, or start is after end
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity '{granularity}', use one of: {', '.join(GRANULARITIES)}")
+    try:
+        end = datetime.fromisoformat(end) if end else (now or datetime.now())
+        start = datetime.fromisoformat(start) if start else end - DEFAULT_WINDOWS[granularity]
+    except (TypeError, ValueError):
+        raise ValueError("Invalid date, use ISO format (e.g. 2024-01-31T13:45)")
+    # Timestamps are stored in local time
+    start, end = [moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+                  for moment in (start, end)]
+    if start > end:
+        raise ValueError("start must be before end")
+    return bucket_start(start, granularity), bucket_start(end, granularity)
+
+def bucket_range(granularity, start, end, retained=None):
+    """
+    List the bucket starts of a range, oldest first.
+
+    Args:
+        granularity: 'minute', 'hour' or 'day'
+        start: First bucket start
+        end: Last bucket start
+        retained: Number of buckets kept up to now; older ones are left out
+
+    Returns:
+        list: datetimes
+
+    Raises:
+        ValueError: If the range has more than MAX_POINTS buckets
+    """
+    if retained is not None:
+        oldest = bucket_start(datetime.now(), granularity) - step(granularity) * (retained - 1)
+        start = max(start, oldest)
+    if (end - start) / step(granularity) >= MAX_POINTS:
+        raise ValueError(f"Range too long, at most {MAX_POINTS} {granularity} buckets")
+    starts = []
+    current = start
+    while current <= end:
+        starts.append(current)
+        current += step(granularity)
+    return starts
+
+def points(starts, granularity, buckets):
+    """
+    Build the API points of a range.
+
+    Args:
+        starts: Bucket starts (from bucket_range)
+        granularity: 'minute', 'hour' or 'day'
+        buckets: Dict of bucket label -> {'total', 'categories'}
+
+    Returns:
+        list: {'start', 'total', 'categories'} per bucket, zeros where nothing was counted
+    """
+    result = []
+    for start in starts:
+        label = bucket_label(start, granularity)
+        bucket = buckets.get(label) or {}
+        result.append({
+            'start': label,
+            'total': bucket.get('total', 0),
+            'categories': dict(bucket.get('categories', {}))
+        })
+    return result
@@ -0,0 +1,270 @@
+"""
+Durable outbox for image uploads to ImageBB.
+
+/api/classify stores the image here and returns; background worker threads
+upload it, retrying with exponential backoff, and hand the result to a
+callback that patches the history record with the image URLs. Jobs live in
+a SQLite database, so they survive restarts and can be shared by several
+server processes.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import closing
+from utils.imagebb import upload_image_to_imagebb, backoff_delay
+
+# Job states
+UPLOAD_PENDING = 'pending'
+UPLOAD_FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    record_id TEXT NOT NULL,
+    name TEXT,
+    image BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    result TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS uploads_due ON uploads (status, next_attempt_at);
+"""
+
+class UploadOutbox:
+    """
+    SQLite-backed queue of pending image uploads with background workers.
+    """
+
+    def __init__(self, db_path='./stats/upload_outbox.sqlite3', uploader=upload_image_to_imagebb, workers=1,
+                 max_attempts=8, base_delay=2, max_delay=600, lease_seconds=300, poll_interval=5):
+        """
+        Initialize the outbox and create its database if needed.
+
+        Args:
+            db_path: Path of the SQLite database
+            uploader: Function (image_bytes, name=...) returning the upload
+                      data dict, or None if the upload failed
+            workers: Number of upload threads started by start()
+            max_attempts: Attempts before a job is marked as failed
+            base_delay: Delay (seconds) before the first retry, doubled on each attempt
+            max_delay: Upper bound (seconds) of the retry delay
+            lease_seconds: Time a claimed job is hidden from other workers; if
+                           its worker dies the job is retried after this
+            poll_interval: Seconds between checks for due retries when idle
+        """
+        # Convert relative paths to absolute paths if they are relative
+        if not os.path.isabs(db_path):
+            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            db_path = os.path.join(base_dir, db_path)
+
+        self.db_path = db_path
+        self.uploader = uploader
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+
+        self.on_result = None
+        self._threads = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+        # Per-process counters
+        self._counters_lock = threading.Lock()
+        self._counters = {'uploaded': 0, 'retries': 0, 'failed': 0}
+
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            # Release the images of jobs that failed before they were cleared on failure
+            conn.execute("UPDATE uploads SET image = X'' WHERE status = ? AND length(image) > 0", (UPLOAD_FAILED,))
+
+    def _connect(self):
+        """Open an autocommit connection (one per call, so any thread can use the outbox)."""
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def _count(self, counter):
+        with self._counters_lock:
+            self._counters[counter] += 1
+
+    def enqueue(self, record_id, image_bytes, name=None):
+        """
+        Store an image to be uploaded for a history record.
+
+        Args:
+            record_id: ID of the history record to patch once uploaded
+            image_bytes: The image data as bytes
+            name: Name for the uploaded image (optional)
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                'INSERT INTO uploads (record_id, name, image, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)',
+                (record_id, name, image_bytes, now, now)
+            )
+        self._wakeup.set()
+
+    def _claim(self):
+        """Lease the next due job, returning its row or None."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            # Take the write lock up front so two workers cannot claim the same job
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT id, record_id, name, image, attempts, result FROM uploads '
+                'WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT 1',
+                (UPLOAD_PENDING, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE uploads SET next_attempt_at = ? WHERE id = ?',
+                    (now + self.lease_seconds, row[0])
+                )
+            conn.execute('COMMIT')
+            return row
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def retry_delay(self, attempts):
+        """
+        Get the delay before the next attempt (exponential backoff with jitter).
+
+        Args:
+            attempts: Number of failed attempts so far
+
+        Returns:
+            float: Delay in seconds
+        """
+        return backoff_delay(attempts, self.base_delay, self.max_delay)
+
+    def process_once(self):
+        """
+        Process the next due job, if any.
+
+        Returns:
+            bool: True if a job was processed (successfully or not)
+        """
+        row = self._claim()
+        if row is None:
+            return False
+
+        job_id, record_id, name, image_bytes, attempts, stored_result = row
+        upload_result = json.loads(stored_result) if stored_result else None
+        try:
+            if upload_result is None:
+                upload_result = self.uploader(bytes(image_bytes), name=name)
+                if not upload_result:
+                    raise Exception("Failed to upload image to ImageBB")
+                # Keep the result, so a failing callback does not upload the image again
+                with closing(self._connect()) as conn:
+                    conn.execute('UPDATE uploads SET result = ? WHERE id = ?', (json.dumps(upload_result), job_id))
+
+            if self.on_result:
+                self.on_result(record_id, upload_result)
+
+            with closing(self._connect()) as conn:
+                conn.execute('DELETE FROM uploads WHERE id = ?', (job_id,))
+            self._count('uploaded')
+        except Exception as e:
+            self._record_failure(job_id, record_id, attempts + 1, e)
+        return True
+
+    def _record_failure(self, job_id, record_id, attempts, error):
+        """Schedule a retry of a failed job, or mark it as failed (dropping its image)."""
+        with closing(self._connect()) as conn:
+            if attempts < self.max_attempts:
+                delay = self.retry_delay(attempts)
+                conn.execute(
+                    'UPDATE uploads SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?',
+                    (attempts, time.time() + delay, str(error), job_id)
+                )
+                self._count('retries')
+                print(f"Upload of image for {record_id} failed ({attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {error}")
+                return
+
+            # The row is kept for the failed metric and its error, not the image
+            conn.execute(
+                "UPDATE uploads SET status = ?, attempts = ?, last_error = ?, image = X'' WHERE id = ?",
+                (UPLOAD_FAILED, attempts, str(error), job_id)
+            )
+        self._count('failed')
+        print(f"Giving up uploading image for {record_id} after {attempts} attempts: {error}")
+        if self.on_result:
+            try:
+                self.on_result(record_id, None)
+            except Exception as e:
+                print(f"Error marking upload of {record_id} as failed: {e}")
+
+    def _run(self):
+        """Worker thread loop."""
+        while not self._stop.is_set():
+            # Cleared before looking for work, so an enqueue is never missed
+            self._wakeup.clear()
+            try:
+                if self.process_once():
+                    continue
+            except Exception as e:
+                print(f"Error in upload worker: {e}")
+            self._wakeup.wait(self.poll_interval)
+
+    def start(self, on_result=None):
+        """
+        Start the upload worker threads.
+
+        Args:
+            on_result: Callback (record_id, upload_result) called after each
+                       upload; upload_result is None if the job failed for good
+        """
+        if on_result is not None:
+            self.on_result = on_result
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"upload-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Stop the worker threads (pending jobs stay in the outbox)."""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def get_metrics(self):
+        """
+        Get the outbox backlog and this process's upload counters.
+
+        Returns:
+            dict: 'pending' and 'failed' jobs, oldest pending job age in
+                  seconds, and uploaded/retries/failed counters
+        """
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute('SELECT status, COUNT(*) FROM uploads GROUP BY status').fetchall())
+            oldest = conn.execute(
+                'SELECT MIN(created_at) FROM uploads WHERE status = ?', (UPLOAD_PENDING,)
+            ).fetchone()[0]
+
+        with self._counters_lock:
+            counters = dict(self._counters)
+
+        return {
+            'pending': counts.get(UPLOAD_PENDING, 0),
+            'failed': counts.get(UPLOAD_FAILED, 0),
+            'oldest_pending_seconds': round(time.time() - oldest, 1) if oldest else None,
+            'counters': counters
+        }